@@ -1,7 +1,4329 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import re
 import sqlite3
-from datetime import datetime
+import struct
+import sys
+import tempfile
+import queue
+import random
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+# 金额在数据库和业务层中一律以整数“分”存储和计算，只在输入输出处用 Decimal 与“元”换算
+MONEY_COLUMNS = {
+    'inventory': ('purchase_price', 'selling_price'),
+    'orders': ('total_amount', 'freight_cost', 'commission'),
+    'order_items': ('price',),
+    'transactions': ('amount',),
+    'price_list_items': ('price',),
+    'daily_sales': ('amount',),
+    'daily_cash': ('amount',),
+    'account_balances': ('charged', 'paid', 'balance'),
+    'account_charges': ('amount',),
+}
+
+
+def to_fen(value):
+    """元（字符串、数字或 Decimal）换算为整数分，四舍五入；输入无效时抛出 ValueError"""
+    try:
+        yuan = Decimal(value) if isinstance(value, (str, Decimal)) else Decimal(str(value))
+        return int((yuan * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f'不是有效的金额: {value}')
+
+
+def from_fen(fen):
+    """整数分换算为两位小数的 Decimal 元，空值返回 None"""
+    if fen is None:
+        return None
+    return Decimal(int(fen)).scaleb(-2)
+
+
+def format_money(fen):
+    """整数分显示为 “12.50” 形式的元，空值显示为空"""
+    return '' if fen is None else str(from_fen(fen))
+
+
+def money_sql(expr):
+    """SQL 中把整数分显示为两位小数的元"""
+    return f"printf('%.2f', {expr} / 100.0)"
+
+
+# 汇总表全量重建：按天、商品、客户、业务类型汇总销售，按天、收支类型、业务类型汇总资金往来
+SUMMARY_REBUILD_SQL = [
+    'DELETE FROM daily_sales',
+    '''
+    INSERT INTO daily_sales (day, product_id, customer_id, business_type, quantity, amount, lines)
+    SELECT substr(o.date, 1, 10), i.product_id, o.customer_id, o.business_type,
+           SUM(i.quantity), SUM(i.quantity * i.price), COUNT(*)
+    FROM order_items i JOIN orders o ON o.id = i.order_id
+    GROUP BY 1, 2, 3, 4
+    ''',
+    'DELETE FROM daily_cash',
+    '''
+    INSERT INTO daily_cash (day, type, business_type, amount, count)
+    SELECT substr(date, 1, 10), type, business_type, SUM(amount), COUNT(*)
+    FROM transactions
+    GROUP BY 1, 2, 3
+    ''',
+]
+
+
+# 往来账：应收按客户（订单为欠款，收入为回款），应付按供应商（收入为欠款，支出为付款）
+ACCOUNT_PARTIES = {'应收': 'customers', '应付': 'suppliers'}
+# 账龄区间的上限天数，超过最后一个为“90天以上”
+AGING_DAYS = (30, 60, 90)
+
+
+def _order_account_rows(where, sign=1):
+    """订单对应的往来发生额：(类别, 单位ID, 日期, 欠款, 回款)"""
+    return f'''
+        SELECT '应收' AS kind, customer_id AS party_id, substr(date, 1, 10) AS day,
+               {int(sign)} * total_amount AS charged, 0 AS paid
+        FROM orders WHERE {where}
+    '''
+
+
+def _transaction_account_rows(where, sign=1):
+    """资金往来对应的往来发生额：客户的收入为回款，支出（退款）冲减回款；
+    没有采购单据，供应商收到的款项记为欠款，支出为付款"""
+    return f'''
+        SELECT '应收' AS kind, customer_id AS party_id, substr(date, 1, 10) AS day, 0 AS charged,
+               {int(sign)} * CASE type WHEN '收入' THEN amount ELSE -amount END AS paid
+        FROM transactions WHERE customer_id IS NOT NULL AND ({where})
+        UNION ALL
+        SELECT '应付', supplier_id, substr(date, 1, 10),
+               {int(sign)} * CASE type WHEN '收入' THEN amount ELSE 0 END,
+               {int(sign)} * CASE type WHEN '支出' THEN amount ELSE 0 END
+        FROM transactions WHERE supplier_id IS NOT NULL AND ({where})
+    '''
+
+
+# 按现有订单和资金往来重建往来账
+ACCOUNT_REBUILD_SQL = [
+    'DELETE FROM account_charges',
+    'DELETE FROM account_balances',
+    f'''
+    INSERT INTO account_balances (kind, party_id, charged, paid, balance)
+    SELECT kind, party_id, SUM(charged), SUM(paid), SUM(charged) - SUM(paid)
+    FROM ({_order_account_rows('1')} UNION ALL {_transaction_account_rows('1')})
+    GROUP BY 1, 2
+    ''',
+    f'''
+    INSERT INTO account_charges (kind, party_id, day, amount)
+    SELECT kind, party_id, day, SUM(charged)
+    FROM ({_order_account_rows('1')} UNION ALL {_transaction_account_rows('1')})
+    WHERE charged != 0
+    GROUP BY 1, 2, 3
+    HAVING SUM(charged) != 0
+    ''',
+]
+
+
+# 只由其他表汇总得到的表，转换时建空表，最后全量重建
+DERIVED_MONEY_TABLES = ('daily_sales', 'daily_cash', 'account_balances', 'account_charges')
+
+
+def _fen_table_sql(sql, table, columns, new_table):
+    """把建表语句改为新表名，并把金额列声明为 INTEGER"""
+    sql = re.sub(rf'^CREATE TABLE\s+(IF NOT EXISTS\s+)?"?{table}"?', f'CREATE TABLE IF NOT EXISTS {new_table}', sql.strip(), count=1)
+    for column in columns:
+        sql = re.sub(rf'(\b{column}\s+)REAL\b', r'\1INTEGER', sql)
+    return sql
+
+
+def migrate_money_to_fen(conn, batch_size=50000):
+    """把金额列由 REAL 元转换为 INTEGER 分：逐表建新表，按主键分批复制（每批一个事务，
+    中断后再次执行从已复制的位置继续），最后在一个事务中替换旧表并恢复索引、触发器和自增序号"""
+    foreign_keys = conn.execute('PRAGMA foreign_keys').fetchone()[0]
+    # 替换表时旧表会被删除，外键检查必须在事务外关闭
+    conn.execute('PRAGMA foreign_keys = OFF')
+    try:
+        for table, columns in MONEY_COLUMNS.items():
+            types = {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({table})')}
+            if not types or all(types.get(column) == 'INTEGER' for column in columns):
+                continue
+            new_table = f'{table}_fen'
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+            conn.execute(_fen_table_sql(sql, table, columns, new_table))
+            names = ', '.join(types)
+            values = ', '.join(f'CAST(ROUND({name} * 100) AS INTEGER)' if name in columns else name for name in types)
+            copy = f'INSERT INTO {new_table} ({names}) SELECT {values} FROM {table}'
+            if 'id' in types and table not in DERIVED_MONEY_TABLES:
+                # 分批复制，写锁只在每批之间短暂持有
+                batch = f'{copy} WHERE id > (SELECT IFNULL(MAX(id), 0) FROM {new_table}) ORDER BY id LIMIT {int(batch_size)}'
+                while True:
+                    conn.execute('BEGIN IMMEDIATE')
+                    copied = conn.execute(batch).rowcount
+                    conn.commit()
+                    if copied < batch_size:
+                        break
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if 'id' in types and table not in DERIVED_MONEY_TABLES:
+                    # 复制最后一批之后新写入的行
+                    conn.execute(f'{copy} WHERE id > (SELECT IFNULL(MAX(id), 0) FROM {new_table})')
+                elif table not in DERIVED_MONEY_TABLES:
+                    conn.execute(f'DELETE FROM {new_table}')
+                    conn.execute(copy)
+                extras = [row[0] for row in conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+                    (table,)
+                )]
+                sequence = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone() \
+                    if 'id' in types else None
+                conn.execute(f'DROP TABLE {table}')
+                conn.execute(f'ALTER TABLE {new_table} RENAME TO {table}')
+                for sql in extras:
+                    conn.execute(sql)
+                if sequence:
+                    # 保留已删除记录占用过的ID，新记录不会重用
+                    conn.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+                    conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, sequence[0]))
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sql in SUMMARY_REBUILD_SQL + ACCOUNT_REBUILD_SQL:
+                conn.execute(sql)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute(f'PRAGMA foreign_keys = {int(foreign_keys)}')
+
+
+def _detail(prefix):
+    """客户/供应商参与检索的其他字段"""
+    return ' || \' \' || '.join(f"COALESCE({prefix}{column}, '')" for column in ('contact', 'address', 'notes'))
+
+
+def _version_triggers(table, counter=None, columns=''):
+    """在 master_data_versions 中登记计数，并创建表修改时计数加一的触发器"""
+    counter = counter or table
+    return [f"INSERT OR IGNORE INTO master_data_versions (table_name, version) VALUES ('{counter}', 0)"] + [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_version_{event.split()[0].lower()}
+        AFTER {event} ON {table} BEGIN
+            UPDATE master_data_versions SET version = version + 1 WHERE table_name = '{counter}';
+        END
+        '''
+        for event in ('INSERT', 'UPDATE' + columns, 'DELETE')
+    ]
+
+
+# 数据库结构迁移：(版本号, [SQL, ...])，按 PRAGMA user_version 顺序执行尚未应用的版本
+SCHEMA_MIGRATIONS = [
+    (1, [
+        # 创建商品分类表
+        '''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+        ''',
+        # 创建供应商表
+        '''
+        CREATE TABLE IF NOT EXISTS suppliers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            contact TEXT,
+            address TEXT,
+            notes TEXT,
+            type TEXT NOT NULL
+        )
+        ''',
+        # 创建库存表
+        '''
+        CREATE TABLE IF NOT EXISTS inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category_id INTEGER,
+            quantity INTEGER NOT NULL,
+            purchase_price REAL NOT NULL,  -- 进货价
+            selling_price REAL NOT NULL,   -- 销售价
+            supplier_id INTEGER,
+            warning_level INTEGER DEFAULT 10,
+            FOREIGN KEY (category_id) REFERENCES categories (id),
+            FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
+        )
+        ''',
+        # 创建客户表
+        '''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            contact TEXT,
+            address TEXT,
+            notes TEXT,
+            type TEXT NOT NULL  -- 客户类型：意向客户/已合作客户/已联系客户
+        )
+        ''',
+        # 创建订单表
+        '''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            business_type TEXT NOT NULL,  -- 对公/对私
+            total_amount REAL NOT NULL,   -- 订单总金额
+            freight_cost REAL DEFAULT 0,  -- 运费
+            commission REAL DEFAULT 0,    -- 回扣
+            notes TEXT,                   -- 备注
+            FOREIGN KEY (customer_id) REFERENCES customers (id)
+        )
+        ''',
+        # 创建订单明细表
+        '''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders (id),
+            FOREIGN KEY (product_id) REFERENCES inventory (id)
+        )
+        ''',
+        # 创建资金往来表
+        '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            type TEXT NOT NULL,           -- 收入/支出
+            business_type TEXT NOT NULL,   -- 对公/对私
+            amount REAL NOT NULL,
+            description TEXT,
+            customer_id INTEGER,
+            supplier_id INTEGER,
+            order_id INTEGER,
+            FOREIGN KEY (customer_id) REFERENCES customers (id),
+            FOREIGN KEY (supplier_id) REFERENCES suppliers (id),
+            FOREIGN KEY (order_id) REFERENCES orders (id)
+        )
+        ''',
+    ]),
+    (2, [
+        # 外键列和排序列的索引
+        'CREATE INDEX IF NOT EXISTS idx_inventory_category ON inventory (category_id)',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_supplier ON inventory (supplier_id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer_id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_date ON orders (date, id)',
+        'CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items (product_id)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date, id)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_customer ON transactions (customer_id)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_supplier ON transactions (supplier_id)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_order ON transactions (order_id)',
+    ]),
+    (3, [
+        # 账套设置表（连接参数等）
+        '''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''',
+    ]),
+    (4, [
+        # 库存流水表：只追加，每条记录保存变动后的结存
+        '''
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            change INTEGER NOT NULL,      -- 变动数量：入库为正，出库为负
+            balance INTEGER NOT NULL,     -- 变动后的结存
+            ref_type TEXT NOT NULL,       -- 来源：期初/盘点/销售/订单修改/订单删除
+            ref_id INTEGER,               -- 来源单据ID
+            FOREIGN KEY (product_id) REFERENCES inventory (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements (product_id, date, id)',
+        # 已有商品以当前库存记一笔期初
+        '''
+        INSERT INTO stock_movements (product_id, date, change, balance, ref_type)
+        SELECT id, datetime('now', 'localtime'), quantity, quantity, '期初'
+        FROM inventory
+        ''',
+    ]),
+    (5, [
+        # 销售日汇总：按天、商品、客户、业务类型，随订单增量维护
+        '''
+        CREATE TABLE IF NOT EXISTS daily_sales (
+            day TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            customer_id INTEGER NOT NULL,
+            business_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            lines INTEGER NOT NULL,       -- 订单明细行数
+            PRIMARY KEY (day, product_id, customer_id, business_type)
+        ) WITHOUT ROWID
+        ''',
+        # 资金日汇总：按天、收支类型、业务类型，随资金往来增量维护
+        '''
+        CREATE TABLE IF NOT EXISTS daily_cash (
+            day TEXT NOT NULL,
+            type TEXT NOT NULL,
+            business_type TEXT NOT NULL,
+            amount REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, type, business_type)
+        ) WITHOUT ROWID
+        ''',
+    ] + SUMMARY_REBUILD_SQL),
+    (6, [
+        # 库存预警：部分索引只包含库存不高于预警值的商品，随库存变动自动维护
+        'CREATE INDEX IF NOT EXISTS idx_inventory_low_stock ON inventory (id) WHERE quantity <= warning_level',
+    ]),
+    (7, [
+        # 全文检索：商品、客户、供应商共用一个 trigram 索引，中文按任意三个字的片段匹配
+        # rowid = 原表ID * 4 + 类型（1 商品，2 客户，3 供应商）
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(name, detail, tokenize='trigram')",
+        # 少于三个字时按名称前缀查找
+        'CREATE INDEX IF NOT EXISTS idx_inventory_name ON inventory (name)',
+        'CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name)',
+        'CREATE INDEX IF NOT EXISTS idx_suppliers_name ON suppliers (name)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS inventory_search_insert AFTER INSERT ON inventory BEGIN
+            INSERT INTO search_index (rowid, name, detail) VALUES (new.id * 4 + 1, new.name, '');
+        END
+        ''',
+        # 只在名称变化时触发，库存变动不会更新检索索引
+        '''
+        CREATE TRIGGER IF NOT EXISTS inventory_search_update AFTER UPDATE OF name ON inventory BEGIN
+            UPDATE search_index SET name = new.name WHERE rowid = old.id * 4 + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS inventory_search_delete AFTER DELETE ON inventory BEGIN
+            DELETE FROM search_index WHERE rowid = old.id * 4 + 1;
+        END
+        ''',
+        'INSERT INTO search_index (rowid, name, detail) SELECT id * 4 + 1, name, \'\' FROM inventory',
+    ] + [
+        sql
+        for table, kind in (('customers', 2), ('suppliers', 3))
+        for sql in (
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO search_index (rowid, name, detail)
+                VALUES (new.id * 4 + {kind}, new.name, {_detail('new.')});
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_search_update
+            AFTER UPDATE OF name, contact, address, notes ON {table} BEGIN
+                UPDATE search_index
+                SET name = new.name, detail = {_detail('new.')}
+                WHERE rowid = old.id * 4 + {kind};
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 4 + {kind};
+            END
+            ''',
+            f'''
+            INSERT INTO search_index (rowid, name, detail)
+            SELECT id * 4 + {kind}, name, {_detail('')} FROM {table}
+            ''',
+        )
+    ]),
+    (8, [
+        # 主数据变更计数：任何连接修改客户、供应商、分类或商品资料时加一，供内存缓存判断是否失效
+        '''
+        CREATE TABLE IF NOT EXISTS master_data_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        ''',
+    ]
+    + _version_triggers('categories')
+    + _version_triggers('customers')
+    + _version_triggers('suppliers')
+    # 库存数量不在缓存中，数量变动不影响缓存
+    + _version_triggers('inventory', columns=' OF name, category_id, supplier_id, purchase_price, selling_price, warning_level')
+    ),
+    (9, [
+        # 价格表：指定客户的优先于指定客户类型的，再次是通用的（两者都为空）；同一层级按优先级
+        '''
+        CREATE TABLE IF NOT EXISTS price_lists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            customer_id INTEGER,
+            customer_type TEXT,
+            priority INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (customer_id) REFERENCES customers (id)
+        )
+        ''',
+        # 价格表中的商品价格，同一商品可按起订数量设置多档阶梯价
+        '''
+        CREATE TABLE IF NOT EXISTS price_list_items (
+            price_list_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            min_quantity INTEGER NOT NULL DEFAULT 1,
+            price REAL NOT NULL,
+            PRIMARY KEY (price_list_id, product_id, min_quantity),
+            FOREIGN KEY (price_list_id) REFERENCES price_lists (id),
+            FOREIGN KEY (product_id) REFERENCES inventory (id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_price_list_items_product ON price_list_items (product_id)',
+        'CREATE INDEX IF NOT EXISTS idx_price_lists_customer ON price_lists (customer_id)',
+    ]
+    # 两张表共用一个计数，定价引擎据此重新编译价格表
+    + _version_triggers('price_lists')
+    + _version_triggers('price_list_items', counter='price_lists')
+    ),
+    (10, [
+        # 列表按列筛选和排序：按客户/供应商筛选后仍按日期翻页，取代原来的单列索引
+        'CREATE INDEX IF NOT EXISTS idx_orders_customer_date ON orders (customer_id, date)',
+        'DROP INDEX IF EXISTS idx_orders_customer',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_customer_date ON transactions (customer_id, date)',
+        'DROP INDEX IF EXISTS idx_transactions_customer',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_supplier_date ON transactions (supplier_id, date)',
+        'DROP INDEX IF EXISTS idx_transactions_supplier',
+        # 按金额、数量、价格排序或筛选范围
+        'CREATE INDEX IF NOT EXISTS idx_orders_total ON orders (total_amount)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_amount ON transactions (amount)',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_quantity ON inventory (quantity)',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_purchase_price ON inventory (purchase_price)',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_selling_price ON inventory (selling_price)',
+    ]),
+    (11, [
+        # 往来余额：每个客户（应收）/供应商（应付）一行，随订单、资金往来和入库增量维护
+        '''
+        CREATE TABLE IF NOT EXISTS account_balances (
+            kind TEXT NOT NULL,           -- 应收/应付
+            party_id INTEGER NOT NULL,    -- 客户ID或供应商ID
+            charged REAL NOT NULL,        -- 累计欠款
+            paid REAL NOT NULL,           -- 累计回款/付款
+            balance REAL NOT NULL,        -- 余额 = 欠款 - 回款
+            PRIMARY KEY (kind, party_id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_account_balances_balance ON account_balances (kind, balance)',
+        # 按天汇总的欠款，账龄按先进先出只需读取最近90天
+        '''
+        CREATE TABLE IF NOT EXISTS account_charges (
+            kind TEXT NOT NULL,
+            party_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (kind, party_id, day)
+        ) WITHOUT ROWID
+        ''',
+    ] + ACCOUNT_REBUILD_SQL),
+    # 金额改为整数分，大账套分批转换，见 migrate_money_to_fen
+    (12, migrate_money_to_fen),
+    # 应付不再按入库流水记欠款，只由资金往来计算，按新的口径重建往来账
+    (13, ACCOUNT_REBUILD_SQL),
+    (14, [
+        # 商品列表按分类、供应商、预警值排序：排序键带 IFNULL，需要同样的表达式索引
+        'CREATE INDEX IF NOT EXISTS idx_inventory_category_sort ON inventory (IFNULL(category_id, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_supplier_sort ON inventory (IFNULL(supplier_id, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_warning_sort ON inventory (IFNULL(warning_level, 0))',
+    ]),
+    (15, [
+        # 以前补记的早日期流水保存的是记账时的库存，按日期顺序重新累计结存
+        '''
+        UPDATE stock_movements SET balance = r.balance
+        FROM (
+            SELECT id, SUM(change) OVER (PARTITION BY product_id ORDER BY date, id) AS balance
+            FROM stock_movements
+        ) r
+        WHERE stock_movements.id = r.id AND stock_movements.balance != r.balance
+        ''',
+    ]),
+]
+
+
+# 最新的结构版本
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+
+def migrate_database(conn, target_version=None):
+    """执行尚未应用的结构迁移（最多到 target_version），返回迁移后的版本号；
+    迁移项为函数时由它自行管理事务，完成后再记录版本号"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for target, statements in SCHEMA_MIGRATIONS:
+        if target <= version or (target_version is not None and target > target_version):
+            continue
+        if callable(statements):
+            statements(conn)
+            conn.execute(f'PRAGMA user_version = {target}')
+            conn.commit()
+            version = target
+            continue
+        conn.execute('BEGIN')
+        try:
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f'PRAGMA user_version = {target}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        version = target
+    return version
+
+
+# 连接参数的默认配置，每个账套可在 settings 表中用 'pragma.<名称>' 覆盖
+DEFAULT_CONNECTION_PROFILE = {
+    'journal_mode': 'WAL',          # 读写互不阻塞
+    'synchronous': 'NORMAL',        # WAL 模式下只在检查点时 fsync
+    'mmap_size': 268435456,         # 256MB 内存映射读取
+    'cache_size': -65536,           # 64MB 页缓存（负数单位为 KiB）
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+    'foreign_keys': 'ON',           # 外键约束，拒绝写入引用不存在记录的行
+}
+
+
+def load_connection_profile(conn):
+    """读取账套的连接参数配置"""
+    profile = dict(DEFAULT_CONNECTION_PROFILE)
+    try:
+        rows = conn.execute("SELECT key, value FROM settings WHERE key LIKE 'pragma.%'").fetchall()
+    except sqlite3.OperationalError:
+        # 旧账套尚未创建 settings 表
+        rows = []
+    for key, value in rows:
+        profile[key[len('pragma.'):]] = value
+    return profile
+
+
+def apply_connection_profile(conn):
+    """按账套配置设置连接的 PRAGMA，返回实际使用的配置"""
+    profile = load_connection_profile(conn)
+    for name, value in profile.items():
+        # PRAGMA 不能使用参数绑定，只接受名称和简单的取值
+        if not name.isidentifier() or not str(value).lstrip('-').isalnum():
+            raise ValueError(f'无效的连接参数: {name} = {value}')
+        conn.execute(f'PRAGMA {name} = {value}')
+    return profile
+
+
+def set_connection_setting(conn, name, value):
+    """保存账套的连接参数，下次打开账套时生效"""
+    conn.execute(
+        'INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)',
+        (f'pragma.{name}', str(value))
+    )
+    conn.commit()
+
+
+def connect_database(db_file, migrate=True, readonly=False):
+    """打开账套数据库：执行结构迁移并应用连接配置；只读连接不迁移，可在多个线程间传递"""
+    if readonly:
+        conn = sqlite3.connect(Path(db_file).resolve().as_uri() + '?mode=ro', uri=True, cached_statements=256, check_same_thread=False)
+        apply_connection_profile(conn)
+        return conn
+    # 切换账套时连接会被复用，语句缓存放大一些
+    conn = sqlite3.connect(db_file, cached_statements=256)
+    if migrate:
+        migrate_database(conn)
+    apply_connection_profile(conn)
+    return conn
+
+
+def id_list(ids):
+    """主键转为 JSON 数组，SQL 中用 json_each(?) 展开，一条语句即可处理任意多行"""
+    if isinstance(ids, (int, str)):
+        ids = [ids]
+    return json.dumps([int(row_id) for row_id in ids])
+
+
+def apply_stock_changes(cursor, changes, ref_type, ref_id=None, date=None):
+    """按商品调整库存并记入库存流水，changes 为 {商品ID: 变动数量}，返回涉及的商品ID"""
+    rows = [(int(product_id), change) for product_id, change in changes.items() if change]
+    _update_stock(cursor, rows)
+    return _record_stock_movements(cursor, rows, ref_type, ref_id, date)
+
+
+def reserve_stock(cursor, changes, ref_type, ref_id=None, date=None):
+    """与 apply_stock_changes 相同，但出库只在库存足够时扣减；
+    有任何一行不足时抛出 InsufficientStockError，由调用方回滚整个事务。
+    检查和扣减是同一条带条件的 UPDATE，不依赖调用方先取得写锁也不会超卖"""
+    rows = [(int(product_id), change) for product_id, change in changes.items() if change]
+    requested = {product_id: -change for product_id, change in rows if change < 0}
+    if rows:
+        # 出库行只在库存足够时扣减，RETURNING 给出实际更新的商品
+        cursor.execute('''
+            UPDATE inventory SET quantity = quantity + c.value
+            FROM json_each(?) c
+            WHERE inventory.id = CAST(c.key AS INTEGER) AND (c.value > 0 OR inventory.quantity >= -c.value)
+            RETURNING inventory.id
+        ''', (_stock_json(rows),))
+        updated = {row[0] for row in cursor.fetchall()}
+        missing = [product_id for product_id in requested if product_id not in updated]
+        if missing:
+            # 未扣减的行库存未变，查询到的就是当前可用数量
+            cursor.execute(
+                'SELECT id, name, quantity FROM inventory WHERE id IN (SELECT value FROM json_each(?))',
+                (id_list(missing),)
+            )
+            found = {row[0]: row for row in cursor.fetchall()}
+            raise InsufficientStockError([
+                StockShortage(
+                    product_id,
+                    found[product_id][1] if product_id in found else None,
+                    requested[product_id],
+                    found[product_id][2] if product_id in found else 0
+                )
+                for product_id in missing
+            ])
+    return _record_stock_movements(cursor, rows, ref_type, ref_id, date)
+
+
+def _stock_json(rows):
+    return json.dumps({product_id: change for product_id, change in rows})
+
+
+def _update_stock(cursor, rows):
+    # 全部商品的库存变动以 JSON 对象 {商品ID: 变动数量} 传入，一条语句完成
+    if rows:
+        cursor.execute('''
+            UPDATE inventory SET quantity = quantity + c.value
+            FROM json_each(?) c
+            WHERE inventory.id = CAST(c.key AS INTEGER)
+        ''', (_stock_json(rows),))
+
+
+def _record_stock_movements(cursor, rows, ref_type, ref_id, date):
+    date = date or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # 结存按日期顺序保存：取该时刻之前最后一条流水的结存加上变动，查询历史库存时无需回放流水。
+    # 补记以前日期的流水时，日期在其后的流水结存一并调整；按当前时间记账时没有这样的流水
+    if rows:
+        changes = _stock_json(rows)
+        cursor.execute('''
+            INSERT INTO stock_movements (product_id, date, change, balance, ref_type, ref_id)
+            SELECT i.id, ?, c.value,
+                   COALESCE((SELECT m.balance FROM stock_movements m
+                             WHERE m.product_id = i.id AND m.date <= ?
+                             ORDER BY m.date DESC, m.id DESC LIMIT 1), 0) + c.value,
+                   ?, ?
+            FROM json_each(?) c JOIN inventory i ON i.id = CAST(c.key AS INTEGER)
+        ''', (date, date, ref_type, ref_id, changes))
+        cursor.execute('''
+            UPDATE stock_movements SET balance = balance + c.value
+            FROM json_each(?) c
+            WHERE stock_movements.product_id = CAST(c.key AS INTEGER) AND stock_movements.date > ?
+        ''', (changes, date))
+    return [product_id for product_id, _ in rows]
+
+
+def stock_as_of(conn, product_id, date):
+    """查询商品在某一时刻的库存结存（按索引定位该时刻之前按日期排序的最后一条流水）"""
+    if len(date) == 10:
+        date += ' 23:59:59'
+    row = conn.execute('''
+        SELECT balance FROM stock_movements
+        WHERE product_id = ? AND date <= ?
+        ORDER BY date DESC, id DESC LIMIT 1
+    ''', (product_id, date)).fetchone()
+    return row[0] if row else 0
+
+
+def apply_sales_summary(cursor, order_ids, sign):
+    """把订单（一个或多个ID）的明细计入（sign=1）或移出（sign=-1）销售日汇总"""
+    order_ids = id_list(order_ids)
+    cursor.execute('''
+        INSERT INTO daily_sales (day, product_id, customer_id, business_type, quantity, amount, lines)
+        SELECT substr(o.date, 1, 10), i.product_id, o.customer_id, o.business_type,
+               ? * SUM(i.quantity), ? * SUM(i.quantity * i.price), ? * COUNT(*)
+        FROM order_items i JOIN orders o ON o.id = i.order_id
+        WHERE o.id IN (SELECT value FROM json_each(?))
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (day, product_id, customer_id, business_type) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            amount = amount + excluded.amount,
+            lines = lines + excluded.lines
+    ''', (sign, sign, sign, order_ids))
+    if sign < 0:
+        # 只按主键检查本次涉及的汇总行，不扫描当天的全部汇总行
+        keys = cursor.execute('''
+            SELECT DISTINCT substr(o.date, 1, 10), i.product_id, o.customer_id, o.business_type
+            FROM order_items i JOIN orders o ON o.id = i.order_id
+            WHERE o.id IN (SELECT value FROM json_each(?))
+        ''', (order_ids,)).fetchall()
+        cursor.executemany('''
+            DELETE FROM daily_sales
+            WHERE day = ? AND product_id = ? AND customer_id = ? AND business_type = ? AND lines = 0
+        ''', keys)
+
+
+def apply_sales_delta(cursor, day, customer_id, business_type, deltas):
+    """订单表头未变时按明细差异调整销售日汇总，deltas 为 {商品ID: (数量差, 金额差, 行数差)}"""
+    cursor.executemany('''
+        INSERT INTO daily_sales (day, product_id, customer_id, business_type, quantity, amount, lines)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (day, product_id, customer_id, business_type) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            amount = amount + excluded.amount,
+            lines = lines + excluded.lines
+    ''', [(day, product_id, customer_id, business_type) + delta for product_id, delta in deltas.items()])
+    cursor.executemany('''
+        DELETE FROM daily_sales
+        WHERE day = ? AND product_id = ? AND customer_id = ? AND business_type = ? AND lines = 0
+    ''', [(day, product_id, customer_id, business_type) for product_id in deltas])
+
+
+def apply_cash_summary(cursor, transaction_ids, sign):
+    """把资金往来（一个或多个ID）计入（sign=1）或移出（sign=-1）资金日汇总"""
+    transaction_ids = id_list(transaction_ids)
+    cursor.execute('''
+        INSERT INTO daily_cash (day, type, business_type, amount, count)
+        SELECT substr(date, 1, 10), type, business_type, ? * SUM(amount), ? * COUNT(*)
+        FROM transactions WHERE id IN (SELECT value FROM json_each(?))
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, type, business_type) DO UPDATE SET
+            amount = amount + excluded.amount,
+            count = count + excluded.count
+    ''', (sign, sign, transaction_ids))
+    if sign < 0:
+        # 只按主键检查本次涉及的汇总行，不扫描当天的全部汇总行
+        keys = cursor.execute('''
+            SELECT DISTINCT substr(date, 1, 10), type, business_type
+            FROM transactions WHERE id IN (SELECT value FROM json_each(?))
+        ''', (transaction_ids,)).fetchall()
+        cursor.executemany('''
+            DELETE FROM daily_cash
+            WHERE day = ? AND type = ? AND business_type = ? AND count = 0
+        ''', keys)
+
+
+def rebuild_summaries(conn):
+    """按现有订单和资金往来重建汇总表，用于补齐旧账套或修复汇总"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for sql in SUMMARY_REBUILD_SQL:
+            conn.execute(sql)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def apply_accounts(cursor, rows_sql, params=()):
+    """把 rows_sql 查出的往来发生额 (类别, 单位ID, 日期, 欠款, 回款) 计入余额和按天的欠款汇总"""
+    cursor.execute(f'''
+        INSERT INTO account_balances (kind, party_id, charged, paid, balance)
+        SELECT kind, party_id, SUM(charged), SUM(paid), SUM(charged) - SUM(paid)
+        FROM ({rows_sql}) GROUP BY 1, 2
+        ON CONFLICT (kind, party_id) DO UPDATE SET
+            charged = charged + excluded.charged,
+            paid = paid + excluded.paid,
+            balance = balance + excluded.balance
+    ''', params)
+    cursor.execute(f'''
+        INSERT INTO account_charges (kind, party_id, day, amount)
+        SELECT kind, party_id, day, SUM(charged)
+        FROM ({rows_sql}) WHERE charged != 0 GROUP BY 1, 2, 3
+        ON CONFLICT (kind, party_id, day) DO UPDATE SET amount = amount + excluded.amount
+    ''', params)
+    # 冲销为零的日汇总不再参与账龄计算，按主键逐行删除
+    keys = cursor.execute(
+        f'SELECT DISTINCT kind, party_id, day FROM ({rows_sql}) WHERE charged != 0', params
+    ).fetchall()
+    cursor.executemany(
+        'DELETE FROM account_charges WHERE kind = ? AND party_id = ? AND day = ? AND amount = 0', keys
+    )
+
+
+def apply_order_accounts(cursor, order_ids, sign):
+    """把订单（一个或多个ID）计入（sign=1）或移出（sign=-1）客户应收"""
+    apply_accounts(cursor, _order_account_rows('id IN (SELECT value FROM json_each(?))', sign), (id_list(order_ids),))
+
+
+def apply_transaction_accounts(cursor, transaction_ids, sign):
+    """把资金往来（一个或多个ID）计入（sign=1）或移出（sign=-1）回款/付款"""
+    ids = id_list(transaction_ids)
+    apply_accounts(cursor, _transaction_account_rows('id IN (SELECT value FROM json_each(?))', sign), (ids, ids))
+
+
+def rebuild_accounts(conn):
+    """按现有数据重建往来账"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for sql in ACCOUNT_REBUILD_SQL:
+            conn.execute(sql)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def aging_buckets(balance, windows):
+    """按先进先出把欠款余额分到账龄区间：回款先冲最早的欠款，余额对应最近的欠款。
+    windows 为最近 30/60/90 天内的累计欠款，金额均为整数分，返回 [0-30, 31-60, 61-90, 90以上]"""
+    outstanding = max(balance or 0, 0)
+    buckets, covered = [], 0
+    for charged in windows:
+        within = min(outstanding, max(charged or 0, 0))
+        within = max(within, covered)
+        buckets.append(within - covered)
+        covered = within
+    buckets.append(outstanding - covered)
+    return buckets
+
+
+def _aging_params(as_of=None):
+    day = datetime.strptime(as_of, '%Y-%m-%d') if as_of else datetime.now()
+    return [(day - timedelta(days=days)).strftime('%Y-%m-%d') for days in AGING_DAYS]
+
+
+def aging_pager(kind, as_of=None, page_size=200):
+    """账龄表的分页查询，按余额从大到小；每行的区间欠款只按索引读取该单位最近90天的日汇总"""
+    table = ACCOUNT_PARTIES[kind]
+    windows = ', '.join(
+        '(SELECT IFNULL(SUM(a.amount), 0) FROM account_charges a '
+        'WHERE a.kind = b.kind AND a.party_id = b.party_id AND a.day >= ?)'
+        for _ in AGING_DAYS
+    )
+    # 选择列表中的参数排在 WHERE 的参数之前
+    return KeysetPager(
+        f'b.party_id, p.name, b.balance, {windows}',
+        f'account_balances b JOIN {table} p ON p.id = b.party_id',
+        [('b.balance', 'DESC'), ('b.party_id', 'DESC')],
+        'b.kind = ? AND b.balance != 0', _aging_params(as_of) + [kind], page_size
+    )
+
+
+def aging_row(row):
+    """账龄表的一行：(单位ID, 名称, 余额, 0-30, 31-60, 61-90, 90以上)，金额换算为元"""
+    return list(row[:2]) + [from_fen(amount) for amount in [row[2]] + aging_buckets(row[2], row[3:])]
+
+
+def aging_summary(conn, kind, as_of=None):
+    """全部单位的账龄合计：{'parties': 单位数, 'balance': 余额, 'buckets': [各区间合计]}，金额为整数分"""
+    d30, d60, d90 = _aging_params(as_of)
+    rows = conn.execute('''
+        SELECT b.balance, SUM(CASE WHEN a.day >= ? THEN a.amount ELSE 0 END),
+               SUM(CASE WHEN a.day >= ? THEN a.amount ELSE 0 END), IFNULL(SUM(a.amount), 0)
+        FROM account_balances b
+        LEFT JOIN account_charges a ON a.kind = b.kind AND a.party_id = b.party_id AND a.day >= ?
+        WHERE b.kind = ? AND b.balance != 0
+        GROUP BY b.party_id
+    ''', (d30, d60, d90, kind))
+    totals = [0] * (len(AGING_DAYS) + 1)
+    parties = balance = 0
+    for row in rows:
+        parties += 1
+        balance += row[0]
+        for i, amount in enumerate(aging_buckets(row[0], row[1:])):
+            totals[i] += amount
+    return {'parties': parties, 'balance': balance, 'buckets': totals}
+
+
+# 库存预警条件，与 idx_inventory_low_stock 的 WHERE 子句保持一致才能使用该索引
+LOW_STOCK_CONDITION = 'i.quantity <= i.warning_level'
+
+
+def low_stock_items(conn, limit=None):
+    """列出库存不高于预警值的商品：[(ID, 名称, 分类, 供应商, 库存, 预警值, 缺口), ...]"""
+    sql = f'''
+        SELECT i.id, i.name, c.name, s.name, i.quantity, i.warning_level,
+               i.warning_level - i.quantity
+        FROM inventory i
+        LEFT JOIN categories c ON i.category_id = c.id
+        LEFT JOIN suppliers s ON i.supplier_id = s.id
+        WHERE {LOW_STOCK_CONDITION}
+        ORDER BY i.id
+    '''
+    if limit:
+        sql += f' LIMIT {int(limit)}'
+    return conn.execute(sql).fetchall()
+
+
+def low_stock_count(conn):
+    """库存预警的商品数（只扫描预警索引）"""
+    return conn.execute(f'SELECT COUNT(*) FROM inventory i WHERE {LOW_STOCK_CONDITION}').fetchone()[0]
+
+
+@dataclass
+class IntegrityCheck:
+    """一项一致性检查。sql 按块执行：按ID分块时参数为 :low/:high，按月分块时为 :start/:end；
+    查询结果的每一行是一个问题，第一列为行ID（汇总表检查为日期）"""
+    name: str
+    table: str
+    sql: str
+    detail: str                 # 问题说明，按结果列格式化
+    repair: object = None       # repair(row) -> [(SQL, 参数), ...]，无法自动修复时为 None
+    by_month: bool = False
+
+
+@dataclass
+class IntegrityIssue:
+    """检查发现的一个问题；repair 为空表示需要人工处理"""
+    check: str
+    table: str
+    row_id: object
+    detail: str
+    repair: tuple = ()
+
+
+def _set_null(table, column):
+    return lambda row: ((f'UPDATE {table} SET {column} = NULL WHERE id = ?', (row[0],)),)
+
+
+def _delete_row(table):
+    return lambda row: ((f'DELETE FROM {table} WHERE id = ?', (row[0],)),)
+
+
+def _rebuild_summaries(row):
+    return tuple((sql, ()) for sql in SUMMARY_REBUILD_SQL)
+
+
+def _rebuild_accounts(row):
+    return tuple((sql, ()) for sql in ACCOUNT_REBUILD_SQL)
+
+
+def _orphan_sql(table, column, parent):
+    return f'''
+        SELECT t.id, t.{column} FROM {table} t
+        WHERE t.id > :low AND t.id <= :high AND t.{column} IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM {parent} p WHERE p.id = t.{column})
+    '''
+
+
+INTEGRITY_CHECKS = [
+    IntegrityCheck('明细缺少订单', 'order_items', _orphan_sql('order_items', 'order_id', 'orders'),
+                   '订单 {1} 不存在', _delete_row('order_items')),
+    IntegrityCheck('明细商品不存在', 'order_items', _orphan_sql('order_items', 'product_id', 'inventory'),
+                   '商品 {1} 不存在'),
+    IntegrityCheck('订单客户不存在', 'orders', _orphan_sql('orders', 'customer_id', 'customers'),
+                   '客户 {1} 不存在'),
+    IntegrityCheck('订单金额不符', 'orders', '''
+        SELECT id, total_amount, expected FROM (
+            SELECT o.id, o.total_amount,
+                   COALESCE((SELECT SUM(i.quantity * i.price) FROM order_items i WHERE i.order_id = o.id), 0)
+                   + COALESCE(o.freight_cost, 0) - COALESCE(o.commission, 0) AS expected
+            FROM orders o
+            WHERE o.id > :low AND o.id <= :high
+        )
+        WHERE total_amount != expected
+    ''', '总金额 {1} 分，按明细、运费和回扣应为 {2} 分',
+        lambda row: (('UPDATE orders SET total_amount = ? WHERE id = ?', (row[2], row[0])),)),
+    IntegrityCheck('商品分类不存在', 'inventory', _orphan_sql('inventory', 'category_id', 'categories'),
+                   '分类 {1} 不存在'),
+    IntegrityCheck('商品供应商不存在', 'inventory', _orphan_sql('inventory', 'supplier_id', 'suppliers'),
+                   '供应商 {1} 不存在', _set_null('inventory', 'supplier_id')),
+    IntegrityCheck('负库存', 'inventory', '''
+        SELECT id, quantity FROM inventory
+        WHERE id > :low AND id <= :high AND quantity < 0
+    ''', '库存 {1}，需盘点后修改'),
+    # 库存流水的最后一笔结存应等于当前库存；修复时按差额补记一笔校正流水
+    IntegrityCheck('库存与流水不符', 'inventory', '''
+        SELECT id, quantity, balance FROM (
+            SELECT i.id, i.quantity,
+                   COALESCE((SELECT m.balance FROM stock_movements m WHERE m.product_id = i.id
+                             ORDER BY m.date DESC, m.id DESC LIMIT 1), 0) AS balance
+            FROM inventory i
+            WHERE i.id > :low AND i.id <= :high
+        )
+        WHERE quantity != balance
+    ''', '库存 {1}，流水结存 {2}',
+        lambda row: (('''
+            INSERT INTO stock_movements (product_id, date, change, balance, ref_type)
+            VALUES (?, datetime('now', 'localtime'), ?, ?, '校正')
+        ''', (row[0], row[1] - row[2], row[1])),)),
+    IntegrityCheck('流水商品不存在', 'stock_movements', _orphan_sql('stock_movements', 'product_id', 'inventory'),
+                   '商品 {1} 不存在', _delete_row('stock_movements')),
+    IntegrityCheck('往来客户不存在', 'transactions', _orphan_sql('transactions', 'customer_id', 'customers'),
+                   '客户 {1} 不存在', _set_null('transactions', 'customer_id')),
+    IntegrityCheck('往来供应商不存在', 'transactions', _orphan_sql('transactions', 'supplier_id', 'suppliers'),
+                   '供应商 {1} 不存在', _set_null('transactions', 'supplier_id')),
+    IntegrityCheck('往来订单不存在', 'transactions', _orphan_sql('transactions', 'order_id', 'orders'),
+                   '订单 {1} 不存在', _set_null('transactions', 'order_id')),
+    # 汇总表按月比对：明细聚合减去汇总行，不为零的组合即为不一致
+    IntegrityCheck('销售汇总不符', 'daily_sales', '''
+        SELECT day, product_id, SUM(quantity), SUM(amount) FROM (
+            SELECT substr(o.date, 1, 10) AS day, i.product_id, o.customer_id, o.business_type,
+                   i.quantity, i.quantity * i.price AS amount, 1 AS lines
+            FROM orders o JOIN order_items i ON i.order_id = o.id
+            WHERE o.date >= :start AND o.date < :end
+            UNION ALL
+            SELECT day, product_id, customer_id, business_type, -quantity, -amount, -lines
+            FROM daily_sales WHERE day >= :start AND day < :end
+        )
+        GROUP BY day, product_id, customer_id, business_type
+        HAVING SUM(quantity) != 0 OR SUM(amount) != 0 OR SUM(lines) != 0
+    ''', '商品 {1} 数量差 {2}，金额差 {3} 分', _rebuild_summaries, by_month=True),
+    IntegrityCheck('资金汇总不符', 'daily_cash', '''
+        SELECT day, type, SUM(amount) FROM (
+            SELECT substr(date, 1, 10) AS day, type, business_type, amount, 1 AS count
+            FROM transactions WHERE date >= :start AND date < :end
+            UNION ALL
+            SELECT day, type, business_type, -amount, -count
+            FROM daily_cash WHERE day >= :start AND day < :end
+        )
+        GROUP BY day, type, business_type
+        HAVING SUM(amount) != 0 OR SUM(count) != 0
+    ''', '{1} 金额差 {2} 分', _rebuild_summaries, by_month=True),
+    # 往来余额可由订单和资金往来精确算出
+    IntegrityCheck('应收余额不符', 'customers', '''
+        SELECT id, expected, balance FROM (
+            SELECT c.id,
+                   IFNULL((SELECT SUM(total_amount) FROM orders WHERE customer_id = c.id), 0)
+                   - IFNULL((SELECT SUM(CASE type WHEN '收入' THEN amount ELSE -amount END)
+                             FROM transactions WHERE customer_id = c.id), 0) AS expected,
+                   IFNULL(b.balance, 0) AS balance
+            FROM customers c LEFT JOIN account_balances b ON b.kind = '应收' AND b.party_id = c.id
+            WHERE c.id > :low AND c.id <= :high
+        )
+        WHERE expected != balance
+    ''', '应收 {1} 分，往来账余额 {2} 分', _rebuild_accounts),
+    IntegrityCheck('应付余额不符', 'suppliers', '''
+        SELECT id, expected, balance FROM (
+            SELECT s.id, IFNULL((SELECT SUM(CASE type WHEN '收入' THEN amount ELSE -amount END)
+                                 FROM transactions WHERE supplier_id = s.id), 0) AS expected,
+                   IFNULL(b.balance, 0) AS balance
+            FROM suppliers s LEFT JOIN account_balances b ON b.kind = '应付' AND b.party_id = s.id
+            WHERE s.id > :low AND s.id <= :high
+        )
+        WHERE expected != balance
+    ''', '应付 {1} 分，往来账余额 {2} 分', _rebuild_accounts),
+]
+
+# 按月比对时确定日期范围的表：汇总表 -> 明细日期来源
+_MONTH_SOURCES = {
+    'daily_sales': ('orders', 'date'),
+    'daily_cash': ('transactions', 'date'),
+}
+
+
+def _month_ranges(conn, table):
+    """明细和汇总表覆盖的全部月份：[(月初, 下月初), ...]"""
+    source, column = _MONTH_SOURCES[table]
+    days = [
+        day for row in (
+            conn.execute(f'SELECT MIN({column}), MAX({column}) FROM {source}').fetchone(),
+            conn.execute(f'SELECT MIN(day), MAX(day) FROM {table}').fetchone(),
+        ) for day in row if day
+    ]
+    if not days:
+        return []
+    year, month = int(min(days)[:4]), int(min(days)[5:7])
+    last = max(days)[:7]
+    ranges = []
+    while f'{year:04d}-{month:02d}' <= last:
+        start = f'{year:04d}-{month:02d}'
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        ranges.append((start, f'{year:04d}-{month:02d}'))
+    return ranges
+
+
+class IntegrityChecker:
+    """分块检查账套的一致性：按主键区间（汇总表按月）逐块执行，内存中只保留发现的问题。
+    每次 step() 只处理一个块，界面可在后台线程中逐块提交，期间其他查询照常执行"""
+
+    def __init__(self, conn, checks=INTEGRITY_CHECKS, chunk_size=50000, max_issues=10000):
+        self.conn = conn
+        self.max_issues = max_issues
+        self.issues = []
+        self.counts = {check.name: 0 for check in checks}
+        self.steps = []
+        max_ids = {}
+        for check in checks:
+            if check.by_month:
+                self.steps.extend((check, {'start': start, 'end': end})
+                                  for start, end in _month_ranges(conn, check.table))
+                continue
+            if check.table not in max_ids:
+                max_ids[check.table] = conn.execute(f'SELECT MAX(id) FROM {check.table}').fetchone()[0] or 0
+            self.steps.extend((check, {'low': low, 'high': low + chunk_size})
+                              for low in range(0, max_ids[check.table], chunk_size))
+        self.position = 0
+
+    @property
+    def done(self):
+        return self.position >= len(self.steps)
+
+    @property
+    def total_issues(self):
+        return sum(self.counts.values())
+
+    def step(self):
+        """执行下一个块，返回 (已完成块数, 总块数)"""
+        if not self.done:
+            check, params = self.steps[self.position]
+            for row in self.conn.execute(check.sql, params):
+                self.counts[check.name] += 1
+                if len(self.issues) < self.max_issues:
+                    self.issues.append(IntegrityIssue(
+                        check.name, check.table, row[0],
+                        check.detail.format(*row),
+                        tuple(check.repair(row)) if check.repair else ()
+                    ))
+            self.position += 1
+        return self.position, len(self.steps)
+
+    def run(self, progress=None):
+        """执行全部检查，返回发现的问题（最多 max_issues 条）"""
+        while not self.done:
+            position, total = self.step()
+            if progress:
+                progress(position, total)
+        return self.issues
+
+
+def repair_plan(issues):
+    """由检查结果生成修复计划：去重后的 [(SQL, 参数), ...]"""
+    plan = {}
+    for issue in issues:
+        for sql, params in issue.repair:
+            plan.setdefault((sql, params), None)
+    return list(plan)
+
+
+def apply_repair_plan(conn, plan):
+    """在一个事务中执行修复计划，返回执行的语句数"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for sql, params in plan:
+            conn.execute(sql, params)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return len(plan)
+
+
+# 检索范围：表名 -> (search_index 中的类型编号, 显示名称)
+SEARCH_KINDS = {'inventory': (1, '商品'), 'customers': (2, '客户'), 'suppliers': (3, '供应商')}
+
+
+def _match_expression(terms):
+    # 每个词作为短语匹配，多个词同时满足
+    return ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _glob_prefix(text):
+    # GLOB 的通配符需要放进字符集才能按字面匹配
+    return ''.join(f'[{ch}]' if ch in '*?[' else ch for ch in text) + '*'
+
+
+def search_condition(table, alias, query):
+    """把检索词转换为列表查询的筛选条件 (SQL, 参数)：
+    三个字及以上的词使用全文索引，只有更短的词时按名称前缀走名称索引"""
+    kind = SEARCH_KINDS[table][0]
+    terms = query.split()
+    long_terms = [term for term in terms if len(term) >= 3]
+    short_terms = [term for term in terms if len(term) < 3]
+    conditions, params = [], []
+    if long_terms:
+        conditions.append(
+            f'{alias}.id IN (SELECT rowid >> 2 FROM search_index '
+            f'WHERE search_index MATCH ? AND (rowid & 3) = {kind})'
+        )
+        params.append(_match_expression(long_terms))
+    elif short_terms:
+        conditions.append(f'{alias}.name GLOB ?')
+        params.append(_glob_prefix(short_terms.pop(0)))
+    for term in short_terms:
+        conditions.append(f'instr({alias}.name, ?) > 0')
+        params.append(term)
+    return ' AND '.join(conditions), params
+
+
+def search(conn, query, tables=None, limit=20):
+    """输入时的联想检索，返回 [(表名, ID, 名称), ...]"""
+    tables = list(tables or SEARCH_KINDS)
+    terms = query.split()
+    long_terms = [term for term in terms if len(term) >= 3]
+    short_terms = [term for term in terms if len(term) < 3]
+    names = {kind: table for table, (kind, _) in SEARCH_KINDS.items()}
+    if long_terms:
+        kinds = ', '.join(str(SEARCH_KINDS[table][0]) for table in tables)
+        sql = f'''
+            SELECT rowid, name FROM search_index
+            WHERE search_index MATCH ? AND (rowid & 3) IN ({kinds})
+        ''' + ''.join(' AND instr(name, ?) > 0' for _ in short_terms) + ' LIMIT ?'
+        rows = conn.execute(sql, [_match_expression(long_terms)] + short_terms + [limit])
+        return [(names[rowid & 3], rowid >> 2, name) for rowid, name in rows]
+    if not short_terms:
+        return []
+    results = []
+    for table in tables:
+        sql = f'SELECT id, name FROM {table} WHERE name GLOB ?' + ''.join(
+            ' AND instr(name, ?) > 0' for _ in short_terms[1:]
+        ) + ' ORDER BY name LIMIT ?'
+        rows = conn.execute(sql, [_glob_prefix(short_terms[0])] + short_terms[1:] + [limit - len(results)])
+        results.extend((table, row_id, name) for row_id, name in rows)
+        if len(results) >= limit:
+            break
+    return results
+
+
+# 下拉联想：名称 -> (显示内容, FROM 子句, ID 列, 检索条件函数, 排序)
+COMPLETIONS = {
+    'customers': ('c.name', 'customers c', 'c.id',
+                  lambda text: search_condition('customers', 'c', text), 'c.id'),
+    'suppliers': ('s.name', 'suppliers s', 's.id',
+                  lambda text: search_condition('suppliers', 's', text), 's.id'),
+    'products': (f"i.name || ' (¥' || {money_sql('i.selling_price')} || ')'", 'inventory i', 'i.id',
+                 lambda text: search_condition('inventory', 'i', text), 'i.id'),
+    'categories': ('k.name', 'categories k', 'k.id',
+                   lambda text: ('instr(k.name, ?) > 0', [text]), 'k.id'),
+    # 订单按单号或客户名称查找，新订单在前
+    'orders': (f"c.name || ' (¥' || {money_sql('o.total_amount')} || ')'", 'orders o JOIN customers c ON o.customer_id = c.id', 'o.id',
+               lambda text: ('o.id = ?', [int(text)]) if text.isdigit() else search_condition('customers', 'c', text),
+               'o.id DESC'),
+}
+
+
+@dataclass(frozen=True)
+class GridColumn:
+    """列表中的一列：显示用的表达式和排序键"""
+    heading: str
+    expr: str
+    # 排序键：表达式或多个表达式的元组，默认同 expr；可为空的列要用 IFNULL，否则键集翻页会漏掉空值行。
+    # 排序键要有对应的索引（计划见 HOT_QUERIES），没有索引的列设为不可排序
+    sort: Optional[object] = None
+    sortable: bool = True
+
+
+@dataclass(frozen=True)
+class GridFilter:
+    """列表上方的一个筛选项"""
+    label: str
+    expr: str
+    kind: str           # date: 日期范围，range: 数值范围，money: 金额范围（输入元），choice: 下拉选项，ref: 关联记录（按ID）
+    choices: tuple = ()  # choice 的选项；ref 时为下拉联想的名称（见 COMPLETIONS）
+
+
+def _filter_value(kind, text):
+    """把筛选框的输入转换为查询参数，输入为空、未完成或无效时返回 None（不筛选）"""
+    text = (text or '').strip()
+    if not text:
+        return None
+    try:
+        if kind == 'date':
+            return datetime.strptime(text, '%Y-%m-%d').date()
+        if kind == 'range':
+            return float(text)
+        if kind == 'money':
+            return to_fen(text)
+    except ValueError:
+        return None
+    if kind == 'ref':
+        row_id = text.split(' - ')[0].strip()
+        return int(row_id) if row_id.isdigit() else None
+    return text
+
+
+@dataclass(frozen=True)
+class GridView:
+    """一个列表的查询定义：表头点击排序和筛选条件都编译成参数化 SQL 交给 KeysetPager"""
+    from_clause: str
+    columns: tuple      # 第一列必须是ID
+    filters: tuple = ()
+    default_sort: tuple = ('ID', 'ASC')
+
+    def column(self, heading):
+        return next(col for col in self.columns if col.heading == heading)
+
+    def order_by(self, sort=None):
+        """排序 (列标题, 方向) -> KeysetPager 的排序键，最后补上ID保证唯一"""
+        heading, direction = sort or self.default_sort
+        id_expr = self.columns[0].expr
+        column = self.column(heading)
+        if column.expr == id_expr:
+            return [(id_expr, direction)]
+        # 与ID同向排序，SQLite 可以沿 (列, rowid) 索引做行值比较
+        sort = column.sort or column.expr
+        keys = sort if isinstance(sort, tuple) else (sort,)
+        return [(expr, direction) for expr in keys] + [(id_expr, direction)]
+
+    def conditions(self, values):
+        """筛选框的输入 {标签: 值或(下限, 上限)} -> (SQL, 参数)"""
+        conditions, params = [], []
+        for item in self.filters:
+            value = values.get(item.label)
+            if item.kind in ('date', 'range', 'money'):
+                low, high = value or (None, None)
+                low, high = _filter_value(item.kind, low), _filter_value(item.kind, high)
+                if low is not None:
+                    conditions.append(f'{item.expr} >= ?')
+                    params.append(str(low) if item.kind == 'date' else low)
+                if high is not None:
+                    if item.kind == 'date':
+                        # 日期带时间，截止日当天全部包含在内
+                        conditions.append(f'{item.expr} < ?')
+                        params.append(str(high + timedelta(days=1)))
+                    else:
+                        conditions.append(f'{item.expr} <= ?')
+                        params.append(high)
+            else:
+                value = _filter_value(item.kind, value)
+                if value is not None:
+                    conditions.append(f'{item.expr} = ?')
+                    params.append(value)
+        return ' AND '.join(conditions), params
+
+    def pager(self, sort=None, values=None, where='', params=(), page_size=200):
+        """按当前排序和筛选生成分页查询，where/params 为额外条件（如搜索框）"""
+        condition, condition_params = self.conditions(values or {})
+        where = ' AND '.join(f'({c})' for c in (where, condition) if c)
+        return KeysetPager(
+            ', '.join(col.expr for col in self.columns), self.from_clause, self.order_by(sort),
+            where, list(params) + condition_params, page_size
+        )
+
+
+BUSINESS_TYPES = ('对公', '对私')
+
+# 各列表的列、排序键和筛选项，列的顺序与表格的列一致。
+# 可排序的列都有索引支撑；订单、资金往来写入频繁，取值很少的列（类型等）只提供筛选不提供排序
+GRID_VIEWS = {
+    'inventory': GridView(
+        'inventory i',
+        (
+            GridColumn('ID', 'i.id'),
+            GridColumn('名称', 'i.name'),
+            # 分类、供应商显示名称（取自主数据缓存），排序按ID分组
+            GridColumn('分类', 'i.category_id', 'IFNULL(i.category_id, 0)'),
+            GridColumn('数量', 'i.quantity'),
+            # 金额列显示为元，排序按整数分
+            GridColumn('进货价', money_sql('i.purchase_price'), 'i.purchase_price'),
+            GridColumn('销售价', money_sql('i.selling_price'), 'i.selling_price'),
+            GridColumn('供应商', 'i.supplier_id', 'IFNULL(i.supplier_id, 0)'),
+            GridColumn('预警值', 'i.warning_level', 'IFNULL(i.warning_level, 0)'),
+        ),
+        (
+            GridFilter('分类', 'i.category_id', 'ref', ('categories',)),
+            GridFilter('供应商', 'i.supplier_id', 'ref', ('suppliers',)),
+            GridFilter('数量', 'i.quantity', 'range'),
+            GridFilter('销售价', 'i.selling_price', 'money'),
+        ),
+    ),
+    'transactions': GridView(
+        '''transactions t
+        LEFT JOIN customers c ON t.customer_id = c.id
+        LEFT JOIN suppliers s ON t.supplier_id = s.id''',
+        (
+            GridColumn('ID', 't.id'),
+            GridColumn('日期', 't.date'),
+            GridColumn('类型', 't.type', sortable=False),
+            GridColumn('业务类型', 't.business_type', sortable=False),
+            GridColumn('金额', money_sql('t.amount'), 't.amount'),
+            GridColumn('客户/供应商', 'COALESCE(c.name, s.name)', sortable=False),
+            GridColumn('关联订单', 't.order_id', sortable=False),
+            GridColumn('描述', 't.description', sortable=False),
+        ),
+        (
+            GridFilter('日期', 't.date', 'date'),
+            GridFilter('类型', 't.type', 'choice', ('收入', '支出')),
+            GridFilter('业务类型', 't.business_type', 'choice', BUSINESS_TYPES),
+            GridFilter('客户', 't.customer_id', 'ref', ('customers',)),
+            GridFilter('供应商', 't.supplier_id', 'ref', ('suppliers',)),
+            GridFilter('金额', 't.amount', 'money'),
+        ),
+        ('日期', 'DESC'),
+    ),
+    'orders': GridView(
+        'orders o JOIN customers c ON o.customer_id = c.id',
+        (
+            GridColumn('ID', 'o.id'),
+            # 按客户名称排序，同名客户按ID分开，同一客户的订单按日期；
+            # 依次沿客户名称索引和 (customer_id, date) 索引读取，不需要排序
+            GridColumn('客户', 'c.name', ('c.name', 'c.id', 'o.date')),
+            GridColumn('日期', 'o.date'),
+            GridColumn('业务类型', 'o.business_type', sortable=False),
+            GridColumn('总金额', money_sql('o.total_amount'), 'o.total_amount'),
+            GridColumn('运费', money_sql('o.freight_cost'), sortable=False),
+            GridColumn('回扣', money_sql('o.commission'), sortable=False),
+            GridColumn('备注', 'o.notes', sortable=False),
+        ),
+        (
+            GridFilter('日期', 'o.date', 'date'),
+            GridFilter('业务类型', 'o.business_type', 'choice', BUSINESS_TYPES),
+            GridFilter('客户', 'o.customer_id', 'ref', ('customers',)),
+            GridFilter('总金额', 'o.total_amount', 'money'),
+        ),
+        ('日期', 'DESC'),
+    ),
+}
+
+
+def _party_view(table, alias, types):
+    """客户、供应商列表的结构相同"""
+    return GridView(
+        f'{table} {alias}',
+        (
+            GridColumn('ID', f'{alias}.id'),
+            GridColumn('名称', f'{alias}.name'),
+            GridColumn('联系方式', f'{alias}.contact', sortable=False),
+            GridColumn('地址', f'{alias}.address', sortable=False),
+            GridColumn('备注', f'{alias}.notes', sortable=False),
+            GridColumn('类型', f'{alias}.type', sortable=False),
+        ),
+        (GridFilter('类型', f'{alias}.type', 'choice', types),),
+    )
+
+
+GRID_VIEWS['customers'] = _party_view('customers', 'c', ('意向客户', '已合作客户', '已联系客户'))
+GRID_VIEWS['suppliers'] = _party_view('suppliers', 's', ('生产商', '代理商', '批发商'))
+
+
+# 按全文索引联想的下拉框：名称 -> 检索范围
+COMPLETION_SEARCH = {'customers': 'customers', 'suppliers': 'suppliers', 'products': 'inventory'}
+
+
+def complete(conn, name, text, limit=50):
+    """下拉联想的候选项，返回 ["ID - 显示内容", ...]，最多 limit 项"""
+    label, from_clause, id_column, condition, order = COMPLETIONS[name]
+    select = f"SELECT {id_column} || ' - ' || {label}"
+    text = text.strip()
+    terms = text.split()
+    long_terms = [term for term in terms if len(term) >= 3]
+    if name in COMPLETION_SEARCH and long_terms:
+        # 按全文索引的 rowid（即ID）顺序读取，取够 limit 项即停止，不必先收集全部匹配
+        kind = SEARCH_KINDS[COMPLETION_SEARCH[name]][0]
+        short_terms = [term for term in terms if len(term) < 3]
+        alias = id_column.split('.')[0]
+        sql = f'''
+            {select} FROM search_index JOIN {from_clause} ON {id_column} = search_index.rowid >> 2
+            WHERE search_index MATCH ? AND (search_index.rowid & 3) = {kind}
+        ''' + ''.join(f' AND instr({alias}.name, ?) > 0' for _ in short_terms)
+        sql += ' ORDER BY search_index.rowid LIMIT ?'
+        params = [_match_expression(long_terms)] + short_terms
+    else:
+        sql = f'{select} FROM {from_clause}'
+        params = []
+        if text:
+            where, params = condition(text)
+            sql += f' WHERE {where}'
+            if name in COMPLETION_SEARCH:
+                # 只有短词时按名称前缀查找，沿名称索引取够 limit 项即停止
+                order = id_column.split('.')[0] + '.name'
+        sql += f' ORDER BY {order} LIMIT ?'
+    return [row[0] for row in conn.execute(sql, list(params) + [limit])]
+
+
+def completion_label(conn, name, row_id):
+    """按ID取得下拉框中的显示值，记录不存在时返回空字符串"""
+    if row_id in (None, ''):
+        return ''
+    label, from_clause, id_column, _, _ = COMPLETIONS[name]
+    row = conn.execute(
+        f"SELECT {id_column} || ' - ' || {label} FROM {from_clause} WHERE {id_column} = ?", (row_id,)
+    ).fetchone()
+    return row[0] if row else ''
+
+
+# 批量导入的字段：表名 -> [(CSV列名, 数据库列名, 类型, 是否必填, 默认值), ...]
+# CSV 表头可以使用中文列名，也可以直接使用数据库列名
+IMPORT_FIELDS = {
+    'inventory': [
+        ('名称', 'name', 'text', True, None),
+        ('分类', 'category_id', 'category', True, None),
+        ('供应商', 'supplier_id', 'supplier', False, None),
+        ('数量', 'quantity', 'int', False, 0),
+        ('进货价', 'purchase_price', 'money', False, 0),
+        ('销售价', 'selling_price', 'money', False, 0),
+        ('预警值', 'warning_level', 'int', False, 10),
+    ],
+    'customers': [
+        ('名称', 'name', 'text', True, None),
+        ('联系方式', 'contact', 'text', False, ''),
+        ('地址', 'address', 'text', False, ''),
+        ('备注', 'notes', 'text', False, ''),
+        ('类型', 'type', 'text', True, None),
+    ],
+    'suppliers': [
+        ('名称', 'name', 'text', True, None),
+        ('联系方式', 'contact', 'text', False, ''),
+        ('地址', 'address', 'text', False, ''),
+        ('备注', 'notes', 'text', False, ''),
+        ('类型', 'type', 'text', True, None),
+    ],
+}
+
+
+class ImportResult:
+    """批量导入的结果：处理行数、成功行数和逐行错误"""
+
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.errors = []        # [(CSV行号, 错误信息), ...]
+
+
+# SQLite INTEGER 能保存的最大值，超出的整数和金额按行报错
+MAX_SQLITE_INTEGER = 2 ** 63 - 1
+
+
+class BulkImporter:
+    """CSV 批量导入：分块读取、校验并解析分类/供应商名称，按批用 executemany 写入"""
+
+    def __init__(self, conn, table, batch_size=5000, progress=None):
+        self.conn = conn
+        self.table = table
+        self.fields = IMPORT_FIELDS[table]
+        self.batch_size = batch_size
+        self.progress = progress
+        self.columns = []
+
+        # 名称到ID的查找表，导入过程中不再逐行查询
+        self.categories = {}
+        for category_id, name in conn.execute('SELECT id, name FROM categories'):
+            self.categories[name] = category_id
+        self.suppliers = {}
+        for supplier_id, name in conn.execute('SELECT id, name FROM suppliers'):
+            self.suppliers.setdefault(name, supplier_id)
+        self.category_ids = set(self.categories.values())
+        self.supplier_ids = set(self.suppliers.values())
+        self.created_categories = []    # 当前块新建的分类，回滚时从查找表中移除
+
+        columns = ', '.join(field[1] for field in self.fields)
+        marks = ', '.join('?' for _ in self.fields)
+        self.insert_sql = f'INSERT INTO {table} ({columns}) VALUES ({marks})'
+
+    def read_chunks(self, path, encoding='utf-8-sig'):
+        """按块读取 CSV，逐块产生 [(行号, 行数据), ...]"""
+        with open(path, newline='', encoding=encoding) as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            self._prepare(header)
+
+            chunk = []
+            for row in reader:
+                chunk.append((reader.line_num, row))
+                if len(chunk) >= self.batch_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    def _prepare(self, header):
+        # 按表头确定每个字段所在的列和转换函数，逐行转换时不再查找
+        converters = {
+            'int': int,
+            'float': float,
+            'money': to_fen,    # 元 -> 整数分
+            'text': str,
+            'category': self._category_id,
+            'supplier': self._supplier_id,
+        }
+        self.columns = []
+        for label, column, kind, required, default in self.fields:
+            index = header.index(label) if label in header else header.index(column) if column in header else None
+            if index is None and required:
+                raise ValueError(f'CSV 文件缺少“{label}”列')
+            self.columns.append((index, converters[kind], kind in ('int', 'float', 'money'), required, default, label))
+
+    def convert_chunk(self, chunk):
+        """按列批量校验并转换一块数据，返回 (有效行, [(行号, 错误信息), ...])"""
+        bad = {}        # 块内位置 -> 该行的第一个错误
+        columns = []
+        for index, convert, numeric, required, default, label in self.columns:
+            if index is None:
+                columns.append([default] * len(chunk))
+                continue
+            raw = [row[index].strip() if index < len(row) else '' for _, row in chunk]
+            columns.append(self._convert_column(raw, convert, numeric, required, default, label, bad))
+
+        rows = [values for position, values in enumerate(zip(*columns)) if position not in bad]
+        errors = [(chunk[position][0], message) for position, message in sorted(bad.items())]
+        return self._create_categories(rows), errors
+
+    def _convert_column(self, raw, convert, numeric, required, default, label, bad):
+        # 快速路径：整列都能转换时一次完成，空值直接取默认值
+        if not required or all(raw):
+            try:
+                values = [convert(value) if value else default for value in raw]
+                if not numeric or not values or 0 <= min(values) and max(values) <= MAX_SQLITE_INTEGER:
+                    return values
+            except ValueError:
+                pass
+
+        # 慢速路径：逐个转换，记录出错的行
+        values = []
+        for position, value in enumerate(raw):
+            try:
+                if not value:
+                    if required:
+                        raise ValueError(f'{label}不能为空')
+                    values.append(default)
+                    continue
+                try:
+                    converted = convert(value)
+                except ValueError as e:
+                    if numeric:
+                        raise ValueError(f'{label}不是有效的数字: {value}')
+                    raise e
+                if numeric and converted < 0:
+                    raise ValueError(f'{label}不能为负数: {value}')
+                if isinstance(converted, int) and converted > MAX_SQLITE_INTEGER:
+                    raise ValueError(f'{label}超出范围: {value}')
+                values.append(converted)
+            except ValueError as e:
+                bad.setdefault(position, str(e))
+                values.append(None)
+        return values
+
+    def _category_id(self, raw):
+        if raw in self.categories:
+            return self.categories[raw]
+        if raw.isdigit() and int(raw) in self.category_ids:
+            return int(raw)
+        # 新分类先保留名称，校验通过的行写入前再创建，被拒绝的行不会留下分类
+        return raw
+
+    def _create_categories(self, rows):
+        position = next((n for n, field in enumerate(self.fields) if field[2] == 'category'), None)
+        if position is None:
+            return rows
+        resolved = []
+        for values in rows:
+            name = values[position]
+            if isinstance(name, str):
+                if name not in self.categories:
+                    category_id = self.conn.execute('INSERT INTO categories (name) VALUES (?)', (name,)).lastrowid
+                    self.categories[name] = category_id
+                    self.category_ids.add(category_id)
+                    self.created_categories.append(name)
+                values = values[:position] + (self.categories[name],) + values[position + 1:]
+            resolved.append(values)
+        return resolved
+
+    def _supplier_id(self, raw):
+        if raw in self.suppliers:
+            return self.suppliers[raw]
+        if raw.isdigit() and int(raw) in self.supplier_ids:
+            return int(raw)
+        raise ValueError(f'供应商不存在: {raw}')
+
+    def run(self, path):
+        """执行导入，每块数据一个事务，返回 ImportResult"""
+        result = ImportResult()
+        date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for chunk in self.read_chunks(path):
+            cursor = self.conn.cursor()
+            self.created_categories = []
+            self.conn.execute('BEGIN')
+            try:
+                rows, errors = self.convert_chunk(chunk)
+                result.errors.extend(errors)
+
+                last_id = cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {self.table}').fetchone()[0]
+                cursor.executemany(self.insert_sql, rows)
+                if self.table == 'inventory':
+                    # 导入的库存记为期初流水
+                    cursor.execute('''
+                        INSERT INTO stock_movements (product_id, date, change, balance, ref_type, ref_id)
+                        SELECT id, ?, quantity, quantity, '期初', id
+                        FROM inventory WHERE id > ? AND quantity != 0
+                    ''', (date, last_id))
+                self.conn.commit()
+            except BaseException:
+                # 任何异常（包括写入时的 OverflowError）都要回滚，不能把连接留在未结束的事务中
+                self.conn.rollback()
+                for name in self.created_categories:
+                    self.category_ids.discard(self.categories.pop(name))
+                raise
+
+            result.total += len(chunk)
+            result.inserted += len(rows)
+            if self.progress is not None:
+                self.progress(result.total, result.inserted, len(result.errors))
+        return result
+
+
+def write_import_errors(result, path):
+    """把导入错误写到 CSV 文件旁边，返回错误报告的路径"""
+    report = path + '.errors.csv'
+    with open(report, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['行号', '错误'])
+        writer.writerows(result.errors)
+    return report
+
+
+# 可导出的表：表名 -> (表及关联, 导出的列, 日期列, 排序键)；排序键沿日期索引，最后一项唯一确定一行
+EXPORT_QUERIES = {
+    'orders': ('orders o', 'o.*', 'o.date', ('o.date', 'o.id')),
+    'order_items': (
+        # CROSS JOIN 固定先按日期索引遍历订单再取明细，第一批也不需要整表排序
+        'orders o CROSS JOIN order_items oi ON oi.order_id = o.id',
+        'oi.*',
+        'o.date',
+        ('o.date', 'o.id', 'oi.id')
+    ),
+    'transactions': ('transactions t', 't.*', 't.date', ('t.date', 't.id')),
+}
+
+# 列式文件的文件头标识
+COLUMNAR_MAGIC = b'ERPCOL1\n'
+
+
+class CsvExportWriter:
+    """CSV 导出，金额写为元"""
+
+    def __init__(self, path, columns, types):
+        self.f = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(columns)
+        self.money = [index for index, kind in enumerate(types) if kind == 'money']
+
+    def write_batch(self, rows):
+        if self.money:
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for index in self.money:
+                    row[index] = format_money(row[index])
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+
+def _pack_array(kind, values):
+    # 列式文件统一使用小端字节序
+    data = array(kind, values)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+
+def _unpack_array(kind, payload, count):
+    data = array(kind)
+    data.frombytes(payload[:count * data.itemsize])
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data
+
+
+class ColumnarExportWriter:
+    """紧凑的二进制列式文件：按行组分块，每个行组内按列存放并用 zlib 压缩"""
+
+    def __init__(self, path, columns, types):
+        self.f = open(path, 'wb')
+        self.types = types
+        header = json.dumps({'columns': columns, 'types': types}, ensure_ascii=False).encode('utf-8')
+        self.f.write(COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header)
+
+    def write_batch(self, rows):
+        if not rows:
+            return
+        self.f.write(struct.pack('<I', len(rows)))
+        for index, kind in enumerate(self.types):
+            block = zlib.compress(self._encode([row[index] for row in rows], kind), 1)
+            self.f.write(struct.pack('<I', len(block)) + block)
+
+    def _encode(self, values, kind):
+        # 块结构：空值标志(1字节) [+ 每行一个字节的空值掩码] + 数据
+        nulls = bytes(value is None for value in values)
+        prefix = b'\x01' + nulls if any(nulls) else b'\x00'
+        if kind in ('int', 'money'):
+            return prefix + _pack_array('q', [0 if value is None else int(value) for value in values])
+        if kind == 'float':
+            return prefix + _pack_array('d', [0.0 if value is None else float(value) for value in values])
+        encoded = [b'' if value is None else str(value).encode('utf-8') for value in values]
+        return prefix + _pack_array('I', [len(value) for value in encoded]) + b''.join(encoded)
+
+    def close(self):
+        # 行数为 0 的行组表示文件结束
+        self.f.write(struct.pack('<I', 0))
+        self.f.close()
+
+
+def read_columnar(path):
+    """读取列式文件，返回 (列名, 按行产生数据的生成器)；金额列还原为 Decimal 元"""
+    f = open(path, 'rb')
+    if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        f.close()
+        raise ValueError(f'不是有效的列式导出文件: {path}')
+    header = json.loads(f.read(struct.unpack('<I', f.read(4))[0]).decode('utf-8'))
+    types = header['types']
+
+    def decode(payload, kind, count):
+        nulls = payload[1:count + 1] if payload[0] else bytes(count)
+        body = payload[count + 1:] if payload[0] else payload[1:]
+        if kind == 'money':
+            values = [from_fen(value) for value in _unpack_array('q', body, count)]
+        elif kind in ('int', 'float'):
+            values = _unpack_array('q' if kind == 'int' else 'd', body, count)
+        else:
+            lengths = _unpack_array('I', body, count)
+            offset = count * lengths.itemsize
+            values = []
+            for length in lengths:
+                values.append(body[offset:offset + length].decode('utf-8'))
+                offset += length
+        return [None if null else value for value, null in zip(values, nulls)]
+
+    def rows():
+        with f:
+            while True:
+                count = struct.unpack('<I', f.read(4))[0]
+                if count == 0:
+                    break
+                columns = []
+                for kind in types:
+                    size = struct.unpack('<I', f.read(4))[0]
+                    columns.append(decode(zlib.decompress(f.read(size)), kind, count))
+                yield from zip(*columns)
+
+    return header['columns'], rows()
+
+
+EXPORT_WRITERS = {
+    'csv': CsvExportWriter,
+    'columnar': ColumnarExportWriter,
+}
+
+
+class TableExporter:
+    """分批导出订单、订单明细或资金往来：每次 step() 从上一批最后的排序键之后读取一批写入文件，
+    批与批之间不保持打开的游标，界面可以把每批作为单独的任务提交，其间的查询和保存可以插队执行"""
+
+    def __init__(self, conn, table, path, fmt='csv', date_from=None, date_to=None, batch_size=5000):
+        from_clause, columns, date_column, order = EXPORT_QUERIES[table]
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append(f'{date_column} >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append(f'{date_column} <= ?')
+            params.append(date_to + ' 23:59:59' if len(date_to) == 10 else date_to)
+        self.pager = KeysetPager(
+            columns, from_clause, [(expr, 'ASC') for expr in order], ' AND '.join(conditions), params, batch_size
+        )
+
+        # 金额列的类型为 money（整数分）
+        self.columns = []
+        self.types = []
+        for _, name, declared, *_ in conn.execute(f'PRAGMA table_info({table})'):
+            declared = declared.upper()
+            self.columns.append(name)
+            if name in MONEY_COLUMNS.get(table, ()):
+                self.types.append('money')
+            else:
+                self.types.append('int' if 'INT' in declared else 'float' if 'REAL' in declared else 'text')
+
+        self.writer = EXPORT_WRITERS[fmt](path, self.columns, self.types)
+        self.key = None
+        self.count = 0
+
+    @property
+    def done(self):
+        return self.writer is None
+
+    def step(self, conn):
+        """导出下一批，返回已导出的行数；最后一批写完后关闭文件"""
+        page = self.pager.fetch(conn, self.key)
+        if page:
+            self.writer.write_batch([row for _, row in page])
+            self.key = page[-1][0]
+            self.count += len(page)
+        if len(page) < self.pager.page_size:
+            self.close()
+        return self.count
+
+    def close(self):
+        """关闭导出文件（完成、失败或取消时调用）"""
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.close()
+
+
+def export_table(conn, table, path, fmt='csv', date_from=None, date_to=None, progress=None):
+    """把订单、订单明细或资金往来分批导出到文件，返回导出的行数"""
+    exporter = TableExporter(conn, table, path, fmt, date_from, date_to)
+    try:
+        while not exporter.done:
+            count = exporter.step(conn)
+            if progress is not None:
+                progress(count)
+    finally:
+        exporter.close()
+    return exporter.count
+
+
+# 报表：名称 -> (汇总表及关联, {维度: (表达式, 列名)}, [(度量表达式, 列名, 是否金额), ...])
+_QUARTER = "substr(s.day, 1, 4) || '-Q' || ((CAST(substr(s.day, 6, 2) AS INTEGER) + 2) / 3)"
+SUMMARY_REPORTS = {
+    'sales': (
+        '''daily_sales s
+        LEFT JOIN inventory i ON i.id = s.product_id
+        LEFT JOIN customers c ON c.id = s.customer_id''',
+        {
+            'day': ('s.day', '日期'),
+            'month': ('substr(s.day, 1, 7)', '月份'),
+            'quarter': (_QUARTER, '季度'),
+            'product': ("s.product_id || ' - ' || COALESCE(i.name, '')", '商品'),
+            'customer': ("s.customer_id || ' - ' || COALESCE(c.name, '')", '客户'),
+            'business_type': ('s.business_type', '业务类型'),
+        },
+        [('SUM(s.quantity)', '数量', False), ('SUM(s.amount)', '金额', True), ('SUM(s.lines)', '明细行数', False)],
+    ),
+    'cash': (
+        'daily_cash s',
+        {
+            'day': ('s.day', '日期'),
+            'month': ('substr(s.day, 1, 7)', '月份'),
+            'quarter': (_QUARTER, '季度'),
+            'type': ('s.type', '收支类型'),
+            'business_type': ('s.business_type', '业务类型'),
+        },
+        [('SUM(s.amount)', '金额', True), ('SUM(s.count)', '笔数', False)],
+    ),
+}
+
+
+def summary_report(conn, report, group_by, date_from=None, date_to=None):
+    """从汇总表查询报表，group_by 为维度名列表，返回 (列名, 行)；金额在库中按整数分精确求和，返回时换算为元"""
+    from_clause, dimensions, measures = SUMMARY_REPORTS[report]
+    unknown = [name for name in group_by if name not in dimensions]
+    if unknown:
+        raise ValueError(f'未知的报表维度: {", ".join(unknown)}')
+    selected = [dimensions[name] for name in group_by]
+    columns = [label for _, label in selected] + [label for _, label, _ in measures]
+    select = ', '.join([expr for expr, _ in selected] + [expr for expr, _, _ in measures])
+    money = [len(selected) + n for n, (_, _, is_money) in enumerate(measures) if is_money]
+    conditions, params = [], []
+    if date_from:
+        conditions.append('s.day >= ?')
+        params.append(date_from[:10])
+    if date_to:
+        conditions.append('s.day <= ?')
+        params.append(date_to[:10])
+    sql = f'SELECT {select} FROM {from_clause}'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    if selected:
+        positions = ', '.join(str(n) for n in range(1, len(selected) + 1))
+        sql += f' GROUP BY {positions} ORDER BY {positions}'
+    rows = conn.execute(sql, params).fetchall()
+    for n, row in enumerate(rows):
+        row = list(row)
+        for index in money:
+            row[index] = from_fen(row[index])
+        rows[n] = tuple(row)
+    return columns, rows
+
+
+class ConnectionPool:
+    """按账套文件缓存已打开的连接，超出上限时关闭最久未使用的账套"""
+
+    def __init__(self, limit=3, migrate=True):
+        self.limit = limit
+        self.migrate = migrate
+        self.connections = OrderedDict()
+        self.versions = {}      # 账套文件 -> 已确认的结构版本
+
+    def get(self, db_file):
+        """取得账套的连接；已打开的连接直接复用"""
+        conn = self.connections.get(db_file)
+        if conn is not None:
+            self.connections.move_to_end(db_file)
+            return conn
+
+        # 已确认是最新版本的账套不再执行结构迁移
+        migrate = self.migrate and self.versions.get(db_file) != SCHEMA_VERSION
+        conn = connect_database(db_file, migrate=migrate)
+        if migrate:
+            self.versions[db_file] = SCHEMA_VERSION
+        self.connections[db_file] = conn
+
+        while len(self.connections) > self.limit:
+            _, oldest = self.connections.popitem(last=False)
+            oldest.close()
+        return conn
+
+    def close_all(self):
+        """关闭所有连接"""
+        while self.connections:
+            _, conn = self.connections.popitem()
+            conn.close()
+
+
+# 界面中频繁执行的查询，用于检查查询计划是否走索引
+HOT_QUERIES = [
+    ('按分类查询商品', '''
+        SELECT i.id, i.*, c.name, s.name
+        FROM inventory i
+        LEFT JOIN categories c ON i.category_id = c.id
+        LEFT JOIN suppliers s ON i.supplier_id = s.id
+        WHERE i.category_id = ? AND i.id > ?
+        ORDER BY i.id LIMIT 200
+    ''', (1, 0)),
+    ('订单列表翻页', '''
+        SELECT o.date, o.id, o.*, c.name
+        FROM orders o JOIN customers c ON o.customer_id = c.id
+        WHERE (o.date, o.id) < (?, ?)
+        ORDER BY o.date DESC, o.id DESC LIMIT 200
+    ''', ('9999-12-31', 0)),
+    ('交易列表翻页', '''
+        SELECT t.date, t.id, t.*, c.name, s.name
+        FROM transactions t
+        LEFT JOIN customers c ON t.customer_id = c.id
+        LEFT JOIN suppliers s ON t.supplier_id = s.id
+        WHERE (t.date, t.id) < (?, ?)
+        ORDER BY t.date DESC, t.id DESC LIMIT 200
+    ''', ('9999-12-31', 0)),
+    ('订单明细', '''
+        SELECT oi.*, i.name
+        FROM order_items oi
+        JOIN inventory i ON oi.product_id = i.id
+        WHERE oi.order_id = ?
+    ''', (1,)),
+    ('分类下的商品数', 'SELECT COUNT(*) FROM inventory WHERE category_id = ?', (1,)),
+    ('供应商的商品数', 'SELECT COUNT(*) FROM inventory WHERE supplier_id = ?', (1,)),
+    ('商品的订单明细数', 'SELECT COUNT(*) FROM order_items WHERE product_id = ?', (1,)),
+    ('客户的订单数', 'SELECT COUNT(*) FROM orders WHERE customer_id = ?', (1,)),
+    ('客户的交易数', 'SELECT COUNT(*) FROM transactions WHERE customer_id = ?', (1,)),
+    ('供应商的交易数', 'SELECT COUNT(*) FROM transactions WHERE supplier_id = ?', (1,)),
+    ('订单的交易数', 'SELECT COUNT(*) FROM transactions WHERE order_id = ?', (1,)),
+    ('库存预警翻页', '''
+        SELECT i.id, i.name, i.quantity, i.warning_level
+        FROM inventory i
+        WHERE i.quantity <= i.warning_level AND i.id > ?
+        ORDER BY i.id LIMIT 200
+    ''', (0,)),
+    ('库存预警数', 'SELECT COUNT(*) FROM inventory i WHERE i.quantity <= i.warning_level', ()),
+    ('按客户筛选订单', '''
+        SELECT o.date, o.id, o.*, c.name
+        FROM orders o JOIN customers c ON o.customer_id = c.id
+        WHERE o.customer_id = ? AND (o.date, o.id) < (?, ?)
+        ORDER BY o.date DESC, o.id DESC LIMIT 200
+    ''', (1, '9999-12-31', 0)),
+    ('订单按金额排序', '''
+        SELECT o.total_amount, o.id, o.*, c.name
+        FROM orders o JOIN customers c ON o.customer_id = c.id
+        WHERE (o.total_amount, o.id) > (?, ?)
+        ORDER BY o.total_amount, o.id LIMIT 200
+    ''', (0, 0)),
+    ('按客户筛选交易', '''
+        SELECT t.date, t.id, t.*
+        FROM transactions t
+        WHERE t.customer_id = ? AND (t.date, t.id) < (?, ?)
+        ORDER BY t.date DESC, t.id DESC LIMIT 200
+    ''', (1, '9999-12-31', 0)),
+    ('交易按金额排序', '''
+        SELECT t.amount, t.id, t.*
+        FROM transactions t
+        WHERE (t.amount, t.id) < (?, ?)
+        ORDER BY t.amount DESC, t.id DESC LIMIT 200
+    ''', (1e18, 0)),
+    ('商品按数量排序', '''
+        SELECT i.quantity, i.id, i.*
+        FROM inventory i
+        WHERE (i.quantity, i.id) > (?, ?)
+        ORDER BY i.quantity, i.id LIMIT 200
+    ''', (-1, 0)),
+    ('商品按分类排序', '''
+        SELECT IFNULL(i.category_id, 0), i.id, i.*
+        FROM inventory i
+        WHERE (IFNULL(i.category_id, 0), i.id) > (?, ?)
+        ORDER BY IFNULL(i.category_id, 0), i.id LIMIT 200
+    ''', (-1, 0)),
+    ('商品按供应商排序', '''
+        SELECT IFNULL(i.supplier_id, 0), i.id, i.*
+        FROM inventory i
+        WHERE (IFNULL(i.supplier_id, 0), i.id) < (?, ?)
+        ORDER BY IFNULL(i.supplier_id, 0) DESC, i.id DESC LIMIT 200
+    ''', (1e18, 0)),
+    ('商品按预警值排序', '''
+        SELECT IFNULL(i.warning_level, 0), i.id, i.*
+        FROM inventory i
+        WHERE (IFNULL(i.warning_level, 0), i.id) > (?, ?)
+        ORDER BY IFNULL(i.warning_level, 0), i.id LIMIT 200
+    ''', (-1, 0)),
+    ('订单按客户名称排序', '''
+        SELECT c.name, c.id, o.date, o.id, o.*
+        FROM orders o JOIN customers c ON o.customer_id = c.id
+        WHERE (c.name, c.id, o.date, o.id) > (?, ?, ?, ?)
+        ORDER BY c.name, c.id, o.date, o.id LIMIT 200
+    ''', ('', 0, '', 0)),
+]
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """检查查询计划，返回全表扫描或临时排序的 [(查询名称, 计划明细), ...]"""
+    problems = []
+    for name, sql, params in queries:
+        for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+            detail = row[-1]
+            if (detail.startswith('SCAN') and 'USING' not in detail) or 'TEMP B-TREE' in detail:
+                problems.append((name, detail))
+    return problems
+
+
+class KeysetPager:
+    """键集(keyset)分页查询：按排序键游标逐页读取，避免 OFFSET 扫描和一次性 fetchall"""
+
+    def __init__(self, columns, from_clause, order_by, where='', params=(), page_size=200):
+        # order_by 为 [(表达式, 'ASC'/'DESC'), ...]，最后一项必须能唯一确定一行（通常是 id）
+        self.columns = columns
+        self.from_clause = from_clause
+        self.order_by = [(expr, direction.upper()) for expr, direction in order_by]
+        self.where = where
+        self.params = tuple(params)
+        self.page_size = page_size
+
+    def _direction(self, direction, reverse):
+        if reverse:
+            return 'DESC' if direction == 'ASC' else 'ASC'
+        return direction
+
+    def _keyset_condition(self, key, reverse):
+        """生成“排在 key 之后”的条件"""
+        directions = {self._direction(d, reverse) for _, d in self.order_by}
+        if len(directions) == 1:
+            # 方向一致时使用行值比较，SQLite 可以直接沿索引定位
+            op = '>' if directions.pop() == 'ASC' else '<'
+            exprs = ', '.join(expr for expr, _ in self.order_by)
+            marks = ', '.join('?' for _ in self.order_by)
+            return f'({exprs}) {op} ({marks})', list(key)
+
+        clauses = []
+        params = []
+        for i, (expr, direction) in enumerate(self.order_by):
+            op = '>' if self._direction(direction, reverse) == 'ASC' else '<'
+            parts = [f'{e} = ?' for e, _ in self.order_by[:i]] + [f'{expr} {op} ?']
+            clauses.append('(' + ' AND '.join(parts) + ')')
+            params.extend(key[:i + 1])
+        return '(' + ' OR '.join(clauses) + ')', params
+
+    def _select(self, conn, conditions, params, suffix=''):
+        key_count = len(self.order_by)
+        select = ', '.join([expr for expr, _ in self.order_by] + [self.columns])
+        conditions = ([self.where] if self.where else []) + conditions
+        sql = f'SELECT {select} FROM {self.from_clause}'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(f'({c})' for c in conditions)
+        rows = conn.execute(sql + suffix, list(self.params) + params)
+        return [(row[:key_count], row[key_count:]) for row in rows]
+
+    def fetch(self, conn, key=None, reverse=False):
+        """读取 key 之后（reverse 时为之前）的一页，返回 [(排序键, 行数据), ...]"""
+        conditions = []
+        params = []
+        if key is not None:
+            condition, params = self._keyset_condition(key, reverse)
+            conditions.append(condition)
+
+        suffix = ' ORDER BY ' + ', '.join(
+            f'{expr} {self._direction(direction, reverse)}' for expr, direction in self.order_by
+        ) + ' LIMIT ?'
+        page = self._select(conn, conditions, params + [self.page_size], suffix)
+        if reverse:
+            page.reverse()
+        return page
+
+    def fetch_rows(self, conn, ids):
+        """按主键读取指定的行（仍受筛选条件约束），返回 [(排序键, 行数据), ...]"""
+        ids = list(ids)
+        id_expr = self.order_by[-1][0]
+        rows = []
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ', '.join('?' for _ in chunk)
+            rows.extend(self._select(conn, [f'{id_expr} IN ({marks})'], chunk))
+        return rows
+
+    def compare_keys(self, a, b):
+        """按本查询的排序方向比较两个排序键，返回 -1/0/1"""
+        for x, y, (_, direction) in zip(a, b, self.order_by):
+            if x == y:
+                continue
+            if x is None:
+                result = -1
+            elif y is None:
+                result = 1
+            else:
+                result = -1 if x < y else 1
+            return result if direction == 'ASC' else -result
+        return 0
+
+
+class DbExecutor:
+    """数据库后台执行器：工作线程持有自己的连接并按队列执行任务，结果通过 root.after 回到界面线程"""
+
+    def __init__(self, root, poll_interval=20):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.latest = {}        # 标签 -> 该标签最新的任务编号，旧任务视为过期
+        self.next_id = 0
+        self.running = None     # 工作线程正在执行的任务
+        self.conn = None        # 只在工作线程中使用
+        self.pool = ConnectionPool(migrate=False)  # 结构迁移已由界面线程完成
+        self.thread = threading.Thread(target=self._work, name='db-executor', daemon=True)
+        self.thread.start()
+        self.root.after(self.poll_interval, self._poll)
+
+    def open(self, db_file):
+        """切换工作线程使用的数据库文件"""
+        def reopen(conn):
+            self.conn = self.pool.get(db_file)
+        self.submit(reopen)
+
+    def submit(self, fn, callback=None, errback=None, tag=None):
+        """提交任务 fn(conn)；同一标签的新任务会取消尚未完成的旧任务"""
+        with self.lock:
+            self.next_id += 1
+            job = (self.next_id, tag, fn, callback, errback)
+            if tag is not None:
+                self._supersede(tag, self.next_id)
+        self.jobs.put(job)
+        return job[0]
+
+    def post(self, callback, value):
+        """从工作线程中把 callback(value) 交给界面线程执行（用于进度通知）"""
+        self.results.put(((None, None, None, callback, None), value, None))
+
+    def cancel(self, tag):
+        """取消某个标签下所有未完成的任务"""
+        with self.lock:
+            self.next_id += 1
+            self._supersede(tag, self.next_id)
+
+    def _supersede(self, tag, job_id):
+        self.latest[tag] = job_id
+        if self.running is not None and self.running[1] == tag and self.conn is not None:
+            # 中断正在执行的过期查询
+            self.conn.interrupt()
+
+    def _is_stale(self, job):
+        return job[1] is not None and self.latest.get(job[1]) != job[0]
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            with self.lock:
+                if self._is_stale(job):
+                    continue
+                self.running = job
+            try:
+                result, error = job[2](self.conn), None
+            except Exception as e:
+                result, error = None, e
+                # 失败的任务不能把事务留给后面的任务
+                if self.conn is not None and self.conn.in_transaction:
+                    self.conn.rollback()
+            finally:
+                with self.lock:
+                    self.running = None
+            self.results.put((job, result, error))
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    job, result, error = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                with self.lock:
+                    if self._is_stale(job):
+                        continue
+                if error is None:
+                    if job[3] is not None:
+                        job[3](result)
+                elif job[4] is not None:
+                    job[4](error)
+                else:
+                    self.root.report_callback_exception(type(error), error, error.__traceback__)
+        finally:
+            self.root.after(self.poll_interval, self._poll)
+
+    def stop(self, timeout=None):
+        """执行完已提交的任务后停止工作线程并关闭其连接，等待线程结束；返回线程是否已结束"""
+        self.submit(lambda conn: self.pool.close_all())
+        self.jobs.put(None)
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+
+class VirtualTreeLoader:
+    """Treeview 虚拟列表：只保留可视窗口附近的若干页数据，滚动时按需加载"""
+
+    def __init__(self, tree, executor, max_pages=5, format_row=None):
+        self.tree = tree
+        self.executor = executor
+        self.max_pages = max_pages
+        self.format_row = format_row or tuple  # 在界面线程把查询结果转换为显示值
+        self.pager = None
+        self.scrollbar = None
+        self.keys = []          # 与表格中的行一一对应的排序键
+        self.at_start = True    # 窗口是否已包含结果集的第一行
+        self.at_end = True      # 窗口是否已包含结果集的最后一行
+        self.generation = 0     # 每次重新加载加一，用于丢弃旧查询的结果
+        self._loading = False
+        self._pending = False
+        self.tree.configure(yscrollcommand=self._on_yscroll)
+
+    def _run(self, fn, callback, tag=None):
+        # 查询在后台线程执行，结果返回时若列表已重新加载则丢弃
+        generation = self.generation
+
+        def deliver(result):
+            if generation == self.generation:
+                callback(result)
+
+        if tag is not None:
+            tag = (id(self), tag)
+        self.executor.submit(fn, deliver, self._on_error, tag)
+
+    def _on_error(self, error):
+        self._loading = False
+        self._pending = False
+        messagebox.showerror('错误', f'读取数据失败: {error}')
+
+    def load(self, pager):
+        """重新加载结果集的第一页"""
+        self.pager = pager
+        self.generation += 1
+        self._loading = True
+        self._pending = False
+        self._run(pager.fetch, self._on_loaded, 'load')
+
+    def detach(self):
+        """表格销毁时调用，丢弃尚未返回的查询结果"""
+        self.generation += 1
+        self.pager = None
+
+    def _on_loaded(self, page):
+        self._loading = False
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self.keys = []
+        self.at_start = True
+        self.at_end = len(page) < self.pager.page_size
+        self._insert(page, 'end')
+        self.tree.yview_moveto(0)
+
+    def _insert(self, page, index):
+        for offset, (key, values) in enumerate(page):
+            position = index if index == 'end' else index + offset
+            self.tree.insert('', position, iid=str(key[-1]), values=self.format_row(values))
+        if index == 'end':
+            self.keys.extend(key for key, _ in page)
+        else:
+            self.keys[index:index] = [key for key, _ in page]
+
+    def _first_visible(self):
+        return int(float(self.tree.yview()[0]) * len(self.keys))
+
+    def _restore_view(self, first_visible):
+        if self.keys:
+            self.tree.yview_moveto(max(first_visible, 0) / len(self.keys))
+
+    def _on_yscroll(self, first, last):
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        if self._pending or self._loading or self.pager is None:
+            return
+        if float(last) >= 0.9 and not self.at_end:
+            self.load_next()
+        elif float(first) <= 0.1 and not self.at_start:
+            self.load_previous()
+
+    def load_next(self):
+        """向下加载一页，并丢弃窗口顶部超出缓冲区的行"""
+        if self.at_end or not self.keys:
+            return
+        self._pending = True
+        pager, key = self.pager, self.keys[-1]
+        self._run(lambda conn: pager.fetch(conn, key), self._on_next_page, 'page')
+
+    def _on_next_page(self, page):
+        self._pending = False
+        first_visible = self._first_visible()
+        self.at_end = len(page) < self.pager.page_size
+        self._insert(page, 'end')
+
+        overflow = len(self.keys) - self.pager.page_size * self.max_pages
+        if overflow > 0:
+            self.tree.delete(*self.tree.get_children()[:overflow])
+            del self.keys[:overflow]
+            self.at_start = False
+            self._restore_view(first_visible - overflow)
+
+    def load_previous(self):
+        """向上加载一页，并丢弃窗口底部超出缓冲区的行"""
+        if self.at_start or not self.keys:
+            return
+        self._pending = True
+        pager, key = self.pager, self.keys[0]
+        self._run(lambda conn: pager.fetch(conn, key, reverse=True), self._on_previous_page, 'page')
+
+    def _on_previous_page(self, page):
+        self._pending = False
+        first_visible = self._first_visible()
+        self.at_start = len(page) < self.pager.page_size
+        self._insert(page, 0)
+
+        overflow = len(self.keys) - self.pager.page_size * self.max_pages
+        if overflow > 0:
+            self.tree.delete(*self.tree.get_children()[-overflow:])
+            del self.keys[-overflow:]
+            self.at_end = False
+        self._restore_view(first_visible + len(page))
+
+    def patch(self, inserted=(), updated=(), deleted=()):
+        """按主键增量修补表格中的行，不重建整个列表"""
+        if self.pager is None:
+            return
+        ids = set(inserted) | set(updated)
+        deleted = set(deleted)
+        pager = self.pager
+        self._run(
+            lambda conn: pager.fetch_rows(conn, ids) if ids else [],
+            lambda rows: self._apply_patch(ids, deleted, rows)
+        )
+
+    def _apply_patch(self, ids, deleted, rows):
+        for row_id in deleted:
+            self._remove(str(row_id))
+
+        rows = {str(key[-1]): (key, values) for key, values in rows}
+        for row_id in ids:
+            iid = str(row_id)
+            row = rows.get(iid)
+            if row is None:
+                # 已不满足当前的筛选条件
+                self._remove(iid)
+                continue
+            key, values = row
+            if self.tree.exists(iid):
+                if tuple(self.keys[self.tree.index(iid)]) == tuple(key):
+                    self.tree.item(iid, values=self.format_row(values))
+                    continue
+                # 排序键变化，需要移动到新的位置
+                self._remove(iid)
+            self._place(key, values)
+
+    def refresh_visible(self):
+        """重新读取窗口内已加载的行（关联表的名称等变化时使用）"""
+        if self.keys:
+            self.patch(updated=[key[-1] for key in self.keys])
+
+    def _remove(self, iid):
+        if self.tree.exists(iid):
+            del self.keys[self.tree.index(iid)]
+            self.tree.delete(iid)
+
+    def _place(self, key, values):
+        # 二分查找插入位置；落在已加载窗口之外的行等滚动到时再加载
+        low, high = 0, len(self.keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self.pager.compare_keys(self.keys[middle], key) < 0:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0 and self.keys and not self.at_start:
+            return
+        if low == len(self.keys) and not self.at_end:
+            return
+        self.tree.insert('', low, iid=str(key[-1]), values=self.format_row(values))
+        self.keys.insert(low, key)
+
+
+class CompletionSource:
+    """一种下拉候选项的查询，带最近输入的 LRU 缓存，多个下拉框可以共用"""
+
+    def __init__(self, name, limit=50, cache_size=32):
+        self.name = name
+        self.limit = limit
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def cached(self, text):
+        if text in self.cache:
+            self.cache.move_to_end(text)
+            return self.cache[text]
+        return None
+
+    def store(self, text, values):
+        self.cache[text] = values
+        self.cache.move_to_end(text)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def fetch(self, conn, text):
+        return complete(conn, self.name, text, self.limit)
+
+    def invalidate(self):
+        """数据变化后清空缓存，下次输入时重新查询"""
+        self.cache.clear()
+
+
+class AutocompleteCombobox(ttk.Combobox):
+    """输入时在后台线程按需查询候选项的下拉框，候选项格式为 “ID - 名称”"""
+
+    # 不触发查询的按键
+    NAVIGATION_KEYS = {'Up', 'Down', 'Left', 'Right', 'Return', 'KP_Enter', 'Escape', 'Tab',
+                       'Shift_L', 'Shift_R', 'Control_L', 'Control_R', 'Alt_L', 'Alt_R', 'Home', 'End'}
+
+    def __init__(self, master, executor, source, delay=150, **kw):
+        super().__init__(master, postcommand=self._on_post, **kw)
+        self.executor = executor
+        self.source = source
+        self.delay = delay
+        self._pending = None
+        self._loaded = None     # 当前候选项对应的输入
+        self._typed = False     # 输入过但还没有选中候选项
+        self.bind('<KeyRelease>', self._on_key)
+        self.bind('<FocusIn>', lambda event: self._query(self.get()) if self._loaded is None else None)
+        self.bind('<FocusOut>', self._on_focus_out)
+        self.bind('<<ComboboxSelected>>', self._on_selected)
+
+    def _on_key(self, event):
+        if event.keysym in self.NAVIGATION_KEYS:
+            return
+        self._typed = True
+        # 连续输入时只在停顿后查询一次
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+        self._pending = self.after(self.delay, self._run)
+
+    def _run(self):
+        self._pending = None
+        self._query(self.get())
+
+    def _on_post(self):
+        # 展开下拉列表前确保候选项与当前输入一致
+        text = self.get() if self._typed else ''
+        if self._loaded != text:
+            self._query(text)
+
+    def _query(self, text):
+        values = self.source.cached(text)
+        if values is not None:
+            self._show(text, values)
+            return
+        
+        def done(values):
+            self.source.store(text, values)
+            self._show(text, values)
+        
+        # 新的输入会取消尚未执行的旧查询
+        self.executor.submit(lambda conn: self.source.fetch(conn, text), done, tag=(id(self), 'complete'))
+
+    def _show(self, text, values):
+        try:
+            self['values'] = values
+        except tk.TclError:
+            # 查询返回前窗口已关闭
+            return
+        self._loaded = text
+
+    def _on_selected(self, event):
+        self._typed = False
+
+    def _on_focus_out(self, event):
+        # 焦点切换完成后再检查，展开的下拉列表取得焦点时不算离开
+        self.after_idle(self._check_input)
+
+    def _check_input(self):
+        # 输入的内容必须对应一个候选项：唯一匹配时自动选中，否则清空
+        if not self._typed:
+            return
+        try:
+            focus = str(self.tk.call('focus'))
+        except tk.TclError:
+            return
+        if focus.startswith(str(self)):
+            return
+        text = self.get()
+        values = list(self['values'])
+        if text and text not in values:
+            self.set(values[0] if len(values) == 1 and self._loaded == text else '')
+        self._typed = False
+
+    def reset(self):
+        """数据变化后丢弃已加载的候选项"""
+        self._loaded = None
+        self['values'] = ()
+
+
+class ChangeSet:
+    """记录一次数据修改涉及的行主键，供界面按行增量刷新"""
+
+    def __init__(self):
+        self.tables = {}
+
+    def _record(self, table, kind, ids):
+        rows = self.tables.setdefault(table, {'inserted': set(), 'updated': set(), 'deleted': set()})
+        rows[kind].update(int(row_id) for row_id in ids if row_id is not None)
+        return self
+
+    def inserted(self, table, ids):
+        return self._record(table, 'inserted', ids)
+
+    def updated(self, table, ids):
+        return self._record(table, 'updated', ids)
+
+    def deleted(self, table, ids):
+        return self._record(table, 'deleted', ids)
+
+    def __iter__(self):
+        for table, rows in self.tables.items():
+            yield table, rows['inserted'], rows['updated'], rows['deleted']
+
+
+# 主数据缓存的记录：表名 -> 精简记录类型
+MASTER_RECORDS = {
+    'categories': namedtuple('CategoryRecord', 'name'),
+    'customers': namedtuple('CustomerRecord', 'name contact address notes type'),
+    'suppliers': namedtuple('SupplierRecord', 'name contact address notes type'),
+    'inventory': namedtuple('ProductRecord', 'name category_id supplier_id purchase_price selling_price warning_level'),
+}
+
+
+class MasterDataCache:
+    """客户、供应商、分类和商品资料的内存缓存：ID -> 精简记录。
+    本连接的修改由调用方按 ChangeSet 逐行失效；其他连接（后台线程、HTTP 服务、其他进程）
+    的修改通过 PRAGMA data_version 发现，再按 master_data_versions 的计数整表失效"""
+
+    def __init__(self, conn, max_records=50000):
+        self.conn = conn
+        self.max_records = max_records
+        self.records = {table: OrderedDict() for table in MASTER_RECORDS}
+        self.hits = 0
+        self.misses = 0
+        self.data_version = None
+        self.versions = {}
+        self.sync()
+
+    def sync(self):
+        """其他连接提交过修改时，丢弃计数有变化的表"""
+        data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+        versions = dict(self.conn.execute('SELECT table_name, version FROM master_data_versions'))
+        for table, records in self.records.items():
+            if versions.get(table) != self.versions.get(table):
+                records.clear()
+        self.versions = versions
+
+    def get(self, table, row_id):
+        """按ID取记录，不存在时返回 None"""
+        if row_id in (None, ''):
+            return None
+        self.sync()
+        records = self.records[table]
+        row_id = int(row_id)
+        if row_id in records:
+            self.hits += 1
+            records.move_to_end(row_id)
+            return records[row_id]
+        self.misses += 1
+        record_type = MASTER_RECORDS[table]
+        row = self.conn.execute(
+            f'SELECT {", ".join(record_type._fields)} FROM {table} WHERE id = ?', (row_id,)
+        ).fetchone()
+        record = record_type._make(row) if row else None
+        records[row_id] = record
+        if len(records) > self.max_records:
+            records.popitem(last=False)
+        return record
+
+    def name(self, table, row_id):
+        record = self.get(table, row_id)
+        return record.name if record else ''
+
+    def label(self, table, row_id):
+        """下拉框中的显示值 “ID - 名称”"""
+        record = self.get(table, row_id)
+        return f'{row_id} - {record.name}' if record else ''
+
+    def invalidate(self, changes):
+        """本连接修改数据后按行失效"""
+        for table, inserted, updated, deleted in changes:
+            records = self.records.get(table)
+            if records is not None:
+                for row_id in inserted | updated | deleted:
+                    records.pop(row_id, None)
+
+    def clear(self):
+        for records in self.records.values():
+            records.clear()
+
+    def stats(self):
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'records': sum(len(records) for records in self.records.values()),
+        }
+
+
+class PricingEngine:
+    """订单定价：价格表整体编译到内存，按客户选出适用的价格表后一次为整单定价。
+    客户专属价格表优先，其次是客户类型的价格表，再次是通用价格表，同一层级按优先级；
+    都没有该商品时使用商品的销售价。价格表有修改（任何连接）时按变更计数重新编译"""
+
+    def __init__(self, conn, master_data):
+        self.conn = conn
+        self.master_data = master_data
+        self.version = None
+        self.lists = []     # [(客户ID, 客户类型, {商品ID: ([起订数量, ...], [价格, ...])}), ...]，生效顺序
+
+    def sync(self):
+        version = self.conn.execute(
+            "SELECT version FROM master_data_versions WHERE table_name = 'price_lists'"
+        ).fetchone()[0]
+        if version == self.version:
+            return
+        lists = {}
+        for list_id, customer_id, customer_type, priority in self.conn.execute(
+                'SELECT id, customer_id, customer_type, priority FROM price_lists'):
+            level = 2 if customer_id else 1 if customer_type else 0
+            lists[list_id] = ((level, priority), customer_id, customer_type, {})
+        for list_id, product_id, min_quantity, price in self.conn.execute('''
+            SELECT price_list_id, product_id, min_quantity, price FROM price_list_items
+            ORDER BY price_list_id, product_id, min_quantity
+        '''):
+            breaks = lists[list_id][3].setdefault(product_id, ([], []))
+            breaks[0].append(min_quantity)
+            breaks[1].append(price)
+        self.lists = [entry[1:] for entry in sorted(lists.values(), key=lambda entry: entry[0], reverse=True)]
+        self.version = version
+
+    def applicable(self, customer_id):
+        """客户适用的价格表，按生效顺序"""
+        self.sync()
+        customer = self.master_data.get('customers', customer_id)
+        customer_id = int(customer_id) if customer else None
+        customer_type = customer.type if customer else None
+        applicable = []
+        for list_customer, list_type, products in self.lists:
+            if list_customer is not None:
+                if list_customer != customer_id:
+                    continue
+            elif list_type is not None and list_type != customer_type:
+                continue
+            applicable.append(products)
+        return applicable
+
+    def price_lines(self, customer_id, lines):
+        """为 [(商品ID, 数量), ...] 定价，返回单价列表；商品不存在时为 None"""
+        price_lists = self.applicable(customer_id)
+        prices = []
+        for product_id, quantity in lines:
+            product_id = int(product_id)
+            for products in price_lists:
+                breaks = products.get(product_id)
+                if breaks:
+                    index = bisect_right(breaks[0], quantity) - 1
+                    if index >= 0:
+                        prices.append(breaks[1][index])
+                        break
+            else:
+                product = self.master_data.get('inventory', product_id)
+                prices.append(product.selling_price if product else None)
+        return prices
+
+    def price(self, customer_id, product_id, quantity):
+        return self.price_lines(customer_id, [(product_id, quantity)])[0]
+
+
+class ServiceError(Exception):
+    """业务校验失败，消息可以直接展示给用户"""
+
+
+class NotFoundError(ServiceError):
+    """要修改或删除的记录不存在（可能已被其他连接删除）"""
+
+
+@dataclass
+class StockShortage:
+    """一行库存不足：商品、需要的数量和当前可用数量"""
+    product_id: int
+    name: Optional[str]
+    requested: int
+    available: int
+
+
+class InsufficientStockError(ServiceError):
+    """出库时库存不足，shortages 列出每一行的缺口"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__('库存不足：\n' + '\n'.join(
+            f'{s.name or s.product_id}：需要 {s.requested}，可用 {s.available}' for s in shortages
+        ))
+
+
+@dataclass
+class ProductInput:
+    """商品信息，价格为整数分"""
+    name: str
+    category_id: Optional[int]
+    supplier_id: Optional[int] = None
+    quantity: int = 0
+    purchase_price: int = 0
+    selling_price: int = 0
+    warning_level: int = 10
+
+
+@dataclass
+class PartyInput:
+    """客户/供应商信息"""
+    name: str
+    type: str
+    contact: str = ''
+    address: str = ''
+    notes: str = ''
+
+
+@dataclass
+class OrderLine:
+    """订单明细行，单价为整数分"""
+    product_id: int
+    quantity: int
+    price: int
+
+    @property
+    def subtotal(self):
+        return self.quantity * self.price
+
+
+@dataclass
+class OrderInput:
+    """订单信息，运费和回扣为整数分"""
+    customer_id: Optional[int]
+    business_type: str
+    lines: List[OrderLine] = field(default_factory=list)
+    freight_cost: int = 0
+    commission: int = 0
+    notes: str = ''
+
+    @property
+    def total_amount(self):
+        """订单总金额 = 明细小计 + 运费 - 回扣"""
+        return sum(line.subtotal for line in self.lines) + self.freight_cost - self.commission
+
+
+@dataclass
+class TransactionInput:
+    """资金往来信息，金额为整数分"""
+    type: str
+    business_type: str
+    amount: int
+    description: str = ''
+    customer_id: Optional[int] = None
+    supplier_id: Optional[int] = None
+    order_id: Optional[int] = None
+
+
+@dataclass
+class PriceListInput:
+    """价格表：customer_id 和 customer_type 都为空时适用于所有客户"""
+    name: str
+    customer_id: Optional[int] = None
+    customer_type: Optional[str] = None
+    priority: int = 0
+
+
+@dataclass
+class MutationResult:
+    """一次修改的结果：主记录ID和涉及的行；批量操作时 skipped 为因有关联记录而跳过的ID"""
+    id: Optional[int]
+    changes: ChangeSet
+    skipped: List[int] = field(default_factory=list)
+
+
+# 错误信息中显示的表名
+TABLE_LABELS = {
+    'categories': '分类', 'inventory': '商品', 'customers': '客户', 'suppliers': '供应商',
+    'orders': '订单', 'transactions': '资金往来', 'price_lists': '价格表',
+}
+
+
+class SqliteRepository:
+    """基于 SQLite 连接的数据访问，服务层只通过它读写数据库"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor()
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """事务：正常结束时提交，出错时回滚。
+        immediate 为真时在开始时就取得写锁，事务内读到的数据不会被其他连接改动。
+        连接上已有未结束的事务时拒绝执行：加入别人开启的事务既拿不到写锁，提交与否也不由自己决定"""
+        if self.conn.in_transaction:
+            raise sqlite3.OperationalError('连接上有未结束的事务，不能开始新的事务')
+        self.conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        try:
+            yield self.cursor
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def execute(self, sql, params=()):
+        """执行一条语句，返回最后插入的行ID"""
+        self.cursor.execute(sql, params)
+        return self.cursor.lastrowid
+
+    def executemany(self, sql, rows):
+        self.cursor.executemany(sql, rows)
+
+    def fetchone(self, sql, params=()):
+        return self.cursor.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        return self.cursor.execute(sql, params).fetchall()
+
+    def get(self, table, row_id):
+        return self.fetchone(f'SELECT * FROM {table} WHERE id = ?', (row_id,))
+
+    def count(self, table, column, value):
+        return self.fetchone(f'SELECT COUNT(*) FROM {table} WHERE {column} = ?', (value,))[0]
+
+    def insert(self, table, values):
+        columns = ', '.join(values)
+        marks = ', '.join('?' for _ in values)
+        return self.execute(f'INSERT INTO {table} ({columns}) VALUES ({marks})', tuple(values.values()))
+
+    def update(self, table, row_id, values):
+        """按主键修改一行，该行不存在时抛出 NotFoundError，所在事务随之回滚"""
+        assignments = ', '.join(f'{column} = ?' for column in values)
+        self.execute(f'UPDATE {table} SET {assignments} WHERE id = ?', tuple(values.values()) + (row_id,))
+        self._ensure_found(table, row_id)
+
+    def delete(self, table, row_id):
+        """按主键删除一行，该行不存在时抛出 NotFoundError"""
+        self.execute(f'DELETE FROM {table} WHERE id = ?', (row_id,))
+        self._ensure_found(table, row_id)
+
+    def _ensure_found(self, table, row_id):
+        if self.cursor.rowcount == 0:
+            raise NotFoundError(f'记录不存在：{TABLE_LABELS.get(table, table)} {row_id}')
+
+    def referenced(self, ids, references):
+        """一次查询找出被其他表引用的ID，references 为 [(表名, 列名), ...]"""
+        conditions = ' OR '.join(
+            f'EXISTS (SELECT 1 FROM {table} r WHERE r.{column} = j.value)' for table, column in references
+        )
+        return {row[0] for row in self.fetchall(
+            f'SELECT j.value FROM json_each(?) j WHERE {conditions}', (id_list(ids),)
+        )}
+
+    def update_many(self, table, ids, assignments, params=()):
+        """一条语句修改多行，assignments 为 SET 子句"""
+        self.execute(
+            f'UPDATE {table} SET {assignments} WHERE id IN (SELECT value FROM json_each(?))',
+            tuple(params) + (id_list(ids),)
+        )
+
+    def delete_many(self, table, ids, column='id'):
+        self.execute(f'DELETE FROM {table} WHERE {column} IN (SELECT value FROM json_each(?))', (id_list(ids),))
+
+    def apply_stock_changes(self, changes, ref_type, ref_id=None, date=None):
+        return apply_stock_changes(self.cursor, changes, ref_type, ref_id, date)
+
+    def reserve_stock(self, changes, ref_type, ref_id=None, date=None):
+        return reserve_stock(self.cursor, changes, ref_type, ref_id, date)
+
+    def apply_sales_summary(self, order_ids, sign):
+        apply_sales_summary(self.cursor, order_ids, sign)
+
+    def apply_sales_delta(self, day, customer_id, business_type, deltas):
+        apply_sales_delta(self.cursor, day, customer_id, business_type, deltas)
+
+    def apply_cash_summary(self, transaction_ids, sign):
+        apply_cash_summary(self.cursor, transaction_ids, sign)
+
+    def apply_order_accounts(self, order_ids, sign):
+        apply_order_accounts(self.cursor, order_ids, sign)
+
+    def apply_transaction_accounts(self, transaction_ids, sign):
+        apply_transaction_accounts(self.cursor, transaction_ids, sign)
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class InventoryService:
+    """商品和分类"""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def add_category(self, name):
+        if not name:
+            raise ServiceError('分类名称不能为空')
+        try:
+            with self.repo.transaction():
+                category_id = self.repo.insert('categories', {'name': name})
+        except sqlite3.IntegrityError:
+            raise ServiceError('该分类名称已存在')
+        return MutationResult(category_id, ChangeSet().inserted('categories', [category_id]))
+
+    def ensure_can_delete_category(self, category_id):
+        if self.repo.count('inventory', 'category_id', category_id) > 0:
+            raise ServiceError('该分类下有商品，无法删除')
+
+    def delete_category(self, category_id):
+        with self.repo.transaction(immediate=True):
+            self.ensure_can_delete_category(category_id)
+            self.repo.delete('categories', category_id)
+        return MutationResult(category_id, ChangeSet().deleted('categories', [category_id]))
+
+    def _validate(self, product, check_negative=True):
+        if not product.name or not product.category_id:
+            raise ServiceError('商品名称和分类为必填项')
+        if check_negative and (product.quantity < 0 or product.purchase_price < 0
+                               or product.selling_price < 0 or product.warning_level < 0):
+            raise ServiceError('数量、价格和预警值不能为负数')
+
+    def _columns(self, product):
+        return {
+            'name': product.name,
+            'category_id': product.category_id,
+            'supplier_id': product.supplier_id,
+            'purchase_price': product.purchase_price,
+            'selling_price': product.selling_price,
+            'warning_level': product.warning_level,
+        }
+
+    def add_product(self, product):
+        # 添加商品时暂不校验负数（与原有界面行为一致）
+        self._validate(product, check_negative=False)
+        with self.repo.transaction():
+            product_id = self.repo.insert('inventory', dict(self._columns(product), quantity=0))
+            # 初始库存作为期初记入库存流水
+            self.repo.apply_stock_changes({product_id: product.quantity}, '期初', product_id)
+        return MutationResult(product_id, ChangeSet().inserted('inventory', [product_id]))
+
+    def update_product(self, product_id, product):
+        self._validate(product)
+        with self.repo.transaction():
+            current = self.repo.fetchone('SELECT quantity FROM inventory WHERE id = ?', (product_id,))
+            if current is None:
+                raise NotFoundError(f'记录不存在：商品 {product_id}')
+            self.repo.update('inventory', product_id, self._columns(product))
+            # 直接修改的数量按盘点差额记入库存流水
+            self.repo.apply_stock_changes({product_id: product.quantity - current[0]}, '盘点', product_id)
+        return MutationResult(product_id, ChangeSet().updated('inventory', [product_id]))
+
+    def ensure_can_delete_product(self, product_id):
+        if self.repo.count('order_items', 'product_id', product_id) > 0:
+            raise ServiceError('该商品已被订单使用，无法删除')
+
+    def delete_product(self, product_id):
+        with self.repo.transaction(immediate=True):
+            self.ensure_can_delete_product(product_id)
+            self.repo.execute('DELETE FROM stock_movements WHERE product_id = ?', (product_id,))
+            self.repo.execute('DELETE FROM price_list_items WHERE product_id = ?', (product_id,))
+            self.repo.delete('inventory', product_id)
+        return MutationResult(product_id, ChangeSet().deleted('inventory', [product_id]))
+
+    def delete_products(self, product_ids):
+        """批量删除商品，已被订单使用的商品跳过"""
+        product_ids = [int(product_id) for product_id in product_ids]
+        with self.repo.transaction():
+            skipped = self.repo.referenced(product_ids, [('order_items', 'product_id')])
+            deleted = [product_id for product_id in product_ids if product_id not in skipped]
+            if deleted:
+                self.repo.delete_many('stock_movements', deleted, 'product_id')
+                self.repo.delete_many('price_list_items', deleted, 'product_id')
+                self.repo.delete_many('inventory', deleted)
+        return MutationResult(None, ChangeSet().deleted('inventory', deleted), sorted(skipped))
+
+    def set_category(self, product_ids, category_id):
+        """批量修改商品分类"""
+        if not category_id:
+            raise ServiceError('请选择分类')
+        with self.repo.transaction():
+            self.repo.update_many('inventory', product_ids, 'category_id = ?', (category_id,))
+        return MutationResult(None, ChangeSet().updated('inventory', product_ids))
+
+    def set_supplier(self, product_ids, supplier_id):
+        """批量设置供应商，supplier_id 为空时清除"""
+        with self.repo.transaction():
+            self.repo.update_many('inventory', product_ids, 'supplier_id = ?', (supplier_id or None,))
+        return MutationResult(None, ChangeSet().updated('inventory', product_ids))
+
+    def adjust_prices(self, product_ids, purchase_percent=0.0, selling_percent=0.0):
+        """批量按百分比调整进货价和销售价，结果四舍五入到分"""
+        if purchase_percent <= -100 or selling_percent <= -100:
+            raise ServiceError('调价幅度必须大于 -100%')
+        with self.repo.transaction():
+            self.repo.update_many('inventory', product_ids, '''
+                purchase_price = CAST(round(purchase_price * (100 + ?) / 100.0) AS INTEGER),
+                selling_price = CAST(round(selling_price * (100 + ?) / 100.0) AS INTEGER)
+            ''', (purchase_percent, selling_percent))
+        return MutationResult(None, ChangeSet().updated('inventory', product_ids))
+
+
+class PartyService:
+    """客户/供应商的通用增删改"""
+
+    table = None
+    label = None
+    account_kind = None
+    references = []     # 删除前检查的引用：[(表名, 列名, 错误信息), ...]
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def _validate(self, party):
+        if not party.name or not party.type:
+            raise ServiceError(f'{self.label}名称和类型为必填项')
+
+    def _columns(self, party):
+        return {
+            'name': party.name,
+            'contact': party.contact,
+            'type': party.type,
+            'address': party.address,
+            'notes': party.notes,
+        }
+
+    def add(self, party):
+        self._validate(party)
+        with self.repo.transaction():
+            party_id = self.repo.insert(self.table, self._columns(party))
+        return MutationResult(party_id, ChangeSet().inserted(self.table, [party_id]))
+
+    def update(self, party_id, party):
+        self._validate(party)
+        with self.repo.transaction():
+            self.repo.update(self.table, party_id, self._columns(party))
+        return MutationResult(party_id, ChangeSet().updated(self.table, [party_id]))
+
+    def ensure_can_delete(self, party_id):
+        for table, column, message in self.references:
+            if self.repo.count(table, column, party_id) > 0:
+                raise ServiceError(message)
+
+    def delete(self, party_id):
+        with self.repo.transaction(immediate=True):
+            self.ensure_can_delete(party_id)
+            self._delete_accounts([party_id])
+            self.repo.delete(self.table, party_id)
+        return MutationResult(party_id, ChangeSet().deleted(self.table, [party_id]))
+
+    def delete_many(self, party_ids):
+        """批量删除，有关联记录的跳过"""
+        party_ids = [int(party_id) for party_id in party_ids]
+        with self.repo.transaction():
+            skipped = self.repo.referenced(party_ids, [(table, column) for table, column, _ in self.references])
+            deleted = [party_id for party_id in party_ids if party_id not in skipped]
+            if deleted:
+                self._delete_accounts(deleted)
+                self.repo.delete_many(self.table, deleted)
+        return MutationResult(None, ChangeSet().deleted(self.table, deleted), sorted(skipped))
+
+    def _delete_accounts(self, party_ids):
+        # 往来账只由订单和资金往来计算，删除前已确认没有这些记录，剩下的只是余额为零的行，随单位一起删除
+        for table in ('account_charges', 'account_balances'):
+            self.repo.execute(
+                f'DELETE FROM {table} WHERE kind = ? AND party_id IN (SELECT value FROM json_each(?))',
+                (self.account_kind, id_list(party_ids))
+            )
+
+
+class CustomerService(PartyService):
+    """客户"""
+
+    table = 'customers'
+    label = '客户'
+    account_kind = '应收'
+    references = [
+        ('orders', 'customer_id', '该客户有关联订单，无法删除'),
+        ('transactions', 'customer_id', '该客户有关联交易记录，无法删除'),
+        ('price_lists', 'customer_id', '该客户有专属价格表，无法删除'),
+    ]
+
+
+class SupplierService(PartyService):
+    """供应商"""
+
+    table = 'suppliers'
+    label = '供应商'
+    account_kind = '应付'
+    references = [
+        ('inventory', 'supplier_id', '该供应商有关联商品，无法删除'),
+        ('transactions', 'supplier_id', '该供应商有关联交易记录，无法删除'),
+    ]
+
+
+@dataclass
+class OrderLineDiff:
+    """订单修改前后明细的差异"""
+    inserted: List[OrderLine] = field(default_factory=list)
+    updated: list = field(default_factory=list)     # [(明细ID, OrderLine), ...]
+    deleted: List[int] = field(default_factory=list)
+    stock: dict = field(default_factory=dict)       # 商品ID -> 库存变动，退回为正
+    sales: dict = field(default_factory=dict)       # 商品ID -> (数量差, 金额差（分）, 行数差)
+
+    @property
+    def changed(self):
+        return len(self.inserted) + len(self.updated) + len(self.deleted)
+
+    def _account(self, product_id, quantity, amount, lines):
+        self.stock[product_id] = self.stock.get(product_id, 0) - quantity
+        old = self.sales.get(product_id, (0, 0, 0))
+        self.sales[product_id] = (old[0] + quantity, old[1] + amount, old[2] + lines)
+
+
+def diff_order_lines(persisted, lines):
+    """比较已保存的明细 [(明细ID, 商品ID, 数量, 单价), ...] 和修改后的明细 [OrderLine, ...]，
+    同一商品的行按顺序一一对应，只有数量或单价变化的行才需要更新"""
+    remaining = {}
+    for item_id, product_id, quantity, price in persisted:
+        remaining.setdefault(product_id, []).append((item_id, quantity, price))
+    diff = OrderLineDiff()
+    for line in lines:
+        product_id = int(line.product_id)
+        candidates = remaining.get(product_id)
+        if not candidates:
+            diff.inserted.append(line)
+            diff._account(product_id, line.quantity, line.subtotal, 1)
+            continue
+        # 优先对应完全相同的行
+        match = next(
+            (row for row in candidates if row[1] == line.quantity and row[2] == line.price),
+            candidates[0]
+        )
+        candidates.remove(match)
+        item_id, quantity, price = match
+        if (quantity, price) != (line.quantity, line.price):
+            diff.updated.append((item_id, line))
+            diff._account(product_id, line.quantity - quantity, line.subtotal - quantity * price, 0)
+    for product_id, rows in remaining.items():
+        for item_id, quantity, price in rows:
+            diff.deleted.append(item_id)
+            diff._account(product_id, -quantity, -quantity * price, -1)
+    diff.stock = {product_id: change for product_id, change in diff.stock.items() if change}
+    diff.sales = {
+        product_id: delta for product_id, delta in diff.sales.items()
+        if any(delta)
+    }
+    return diff
+
+
+class OrderService:
+    """订单及其库存变动"""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def _validate(self, order):
+        if not order.customer_id or not order.business_type:
+            raise ServiceError('客户和业务类型为必填项')
+        if not order.lines:
+            raise ServiceError('请至少添加一个商品')
+        # 负数量会被当作入库，绕过库存检查
+        if any(line.quantity <= 0 for line in order.lines):
+            raise ServiceError('商品数量必须大于0')
+        if any(line.price is None or line.price < 0 for line in order.lines):
+            raise ServiceError('商品单价不能为负数')
+
+    def _columns(self, order):
+        return {
+            'customer_id': order.customer_id,
+            'business_type': order.business_type,
+            'total_amount': order.total_amount,
+            'freight_cost': order.freight_cost,
+            'commission': order.commission,
+            'notes': order.notes,
+        }
+
+    def _insert_lines(self, order_id, lines, stock):
+        # 同一商品同一单价的明细合并为一行，库存按商品汇总后一次扣减
+        merged = {}
+        for line in lines:
+            key = (int(line.product_id), line.price)
+            merged[key] = merged.get(key, 0) + line.quantity
+        self.repo.executemany(
+            'INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)',
+            [(order_id, product_id, quantity, price) for (product_id, price), quantity in merged.items()]
+        )
+        for (product_id, _), quantity in merged.items():
+            stock[product_id] = stock.get(product_id, 0) - quantity
+
+    def _restore_lines(self, order_id, stock):
+        # 原有明细的数量退回库存
+        for product_id, quantity in self.repo.fetchall(
+                'SELECT product_id, quantity FROM order_items WHERE order_id = ?', (order_id,)):
+            stock[product_id] = stock.get(product_id, 0) + quantity
+
+    def create_order(self, order, date=None):
+        self._validate(order)
+        date = date or _now()
+        with self.repo.transaction(immediate=True):
+            order_id = self.repo.insert('orders', dict(self._columns(order), date=date))
+            stock = {}
+            self._insert_lines(order_id, order.lines, stock)
+            # 扣减库存并记入库存流水，任何一行不足时整单回滚
+            updated = self.repo.reserve_stock(stock, '销售', order_id, date)
+            self.repo.apply_sales_summary(order_id, 1)
+            self.repo.apply_order_accounts(order_id, 1)
+        return MutationResult(order_id, ChangeSet().inserted('orders', [order_id]).updated('inventory', updated))
+
+    def update_order(self, order_id, order):
+        """修改订单：只写入有变化的明细，库存和汇总按净差额调整"""
+        self._validate(order)
+        with self.repo.transaction(immediate=True):
+            current = self.repo.fetchone(
+                'SELECT customer_id, business_type, substr(date, 1, 10) FROM orders WHERE id = ?', (order_id,)
+            )
+            if current is None:
+                raise NotFoundError(f'记录不存在：订单 {order_id}')
+            diff = diff_order_lines(self.repo.fetchall(
+                'SELECT id, product_id, quantity, price FROM order_items WHERE order_id = ?', (order_id,)
+            ), order.lines)
+            # 客户或业务类型变化时汇总的维度变了，整单移出后再计入
+            regroup = (current[0], current[1]) != (int(order.customer_id), order.business_type)
+            if regroup:
+                self.repo.apply_sales_summary(order_id, -1)
+            # 金额或客户变化时应收按整单移出再计入
+            self.repo.apply_order_accounts(order_id, -1)
+            self.repo.update('orders', order_id, self._columns(order))
+            self.repo.apply_order_accounts(order_id, 1)
+            self._apply_line_diff(order_id, diff)
+            # 按净变动更新库存并记入库存流水，净出库超过可用库存时整单回滚
+            updated = self.repo.reserve_stock(diff.stock, '订单修改', order_id)
+            if regroup:
+                self.repo.apply_sales_summary(order_id, 1)
+            elif diff.sales:
+                self.repo.apply_sales_delta(current[2], current[0], current[1], diff.sales)
+        return MutationResult(order_id, ChangeSet().updated('orders', [order_id]).updated('inventory', updated))
+
+    def _apply_line_diff(self, order_id, diff):
+        self.repo.executemany(
+            'INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)',
+            [(order_id, line.product_id, line.quantity, line.price) for line in diff.inserted]
+        )
+        self.repo.executemany(
+            'UPDATE order_items SET quantity = ?, price = ? WHERE id = ?',
+            [(line.quantity, line.price, item_id) for item_id, line in diff.updated]
+        )
+        if diff.deleted:
+            self.repo.delete_many('order_items', diff.deleted)
+
+    def ensure_can_delete_order(self, order_id):
+        if self.repo.count('transactions', 'order_id', order_id) > 0:
+            raise ServiceError('该订单有关联交易记录，无法删除')
+
+    def delete_order(self, order_id):
+        with self.repo.transaction(immediate=True):
+            self.ensure_can_delete_order(order_id)
+            stock = {}
+            self._restore_lines(order_id, stock)
+            restored = self.repo.apply_stock_changes(stock, '订单删除', order_id)
+            self.repo.apply_sales_summary(order_id, -1)
+            self.repo.apply_order_accounts(order_id, -1)
+            self.repo.execute('DELETE FROM order_items WHERE order_id = ?', (order_id,))
+            self.repo.delete('orders', order_id)
+        return MutationResult(order_id, ChangeSet().deleted('orders', [order_id]).updated('inventory', restored))
+
+    def delete_orders(self, order_ids):
+        """批量删除订单并退回库存，有关联交易记录的订单跳过"""
+        order_ids = [int(order_id) for order_id in order_ids]
+        date = _now()
+        with self.repo.transaction():
+            skipped = self.repo.referenced(order_ids, [('transactions', 'order_id')])
+            deleted = [order_id for order_id in order_ids if order_id not in skipped]
+            restored = []
+            if deleted:
+                ids = id_list(deleted)
+                restored = [row[0] for row in self.repo.fetchall('''
+                    SELECT DISTINCT product_id FROM order_items
+                    WHERE order_id IN (SELECT value FROM json_each(?))
+                ''', (ids,))]
+                # 每个订单的每个商品记一笔流水，结存按订单顺序累加，库存随后一条语句退回
+                self.repo.execute('''
+                    INSERT INTO stock_movements (product_id, date, change, balance, ref_type, ref_id)
+                    SELECT r.product_id, ?, r.quantity,
+                           i.quantity + SUM(r.quantity) OVER (PARTITION BY r.product_id ORDER BY r.order_id),
+                           '订单删除', r.order_id
+                    FROM (
+                        SELECT order_id, product_id, SUM(quantity) AS quantity FROM order_items
+                        WHERE order_id IN (SELECT value FROM json_each(?))
+                        GROUP BY order_id, product_id
+                    ) r JOIN inventory i ON i.id = r.product_id
+                ''', (date, ids))
+                self.repo.execute('''
+                    UPDATE inventory SET quantity = quantity + (
+                        SELECT SUM(quantity) FROM order_items
+                        WHERE product_id = inventory.id AND order_id IN (SELECT value FROM json_each(?))
+                    )
+                    WHERE id IN (SELECT value FROM json_each(?))
+                ''', (ids, id_list(restored)))
+                self.repo.apply_sales_summary(deleted, -1)
+                self.repo.apply_order_accounts(deleted, -1)
+                self.repo.delete_many('order_items', deleted, 'order_id')
+                self.repo.delete_many('orders', deleted)
+        return MutationResult(
+            None, ChangeSet().deleted('orders', deleted).updated('inventory', restored), sorted(skipped)
+        )
+
+
+class LedgerService:
+    """资金往来"""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def _validate(self, transaction):
+        if not transaction.type or not transaction.business_type or transaction.amount <= 0:
+            raise ServiceError('交易类型、业务类型和金额为必填项，且金额必须大于0')
+
+    def _columns(self, transaction):
+        return {
+            'type': transaction.type,
+            'business_type': transaction.business_type,
+            'amount': transaction.amount,
+            'description': transaction.description,
+            'customer_id': transaction.customer_id,
+            'supplier_id': transaction.supplier_id,
+            'order_id': transaction.order_id,
+        }
+
+    def add_transaction(self, transaction, date=None):
+        self._validate(transaction)
+        with self.repo.transaction():
+            transaction_id = self.repo.insert('transactions', dict(self._columns(transaction), date=date or _now()))
+            self.repo.apply_cash_summary(transaction_id, 1)
+            self.repo.apply_transaction_accounts(transaction_id, 1)
+        return MutationResult(transaction_id, ChangeSet().inserted('transactions', [transaction_id]))
+
+    def update_transaction(self, transaction_id, transaction):
+        self._validate(transaction)
+        with self.repo.transaction():
+            self.repo.apply_cash_summary(transaction_id, -1)
+            self.repo.apply_transaction_accounts(transaction_id, -1)
+            self.repo.update('transactions', transaction_id, self._columns(transaction))
+            self.repo.apply_cash_summary(transaction_id, 1)
+            self.repo.apply_transaction_accounts(transaction_id, 1)
+        return MutationResult(transaction_id, ChangeSet().updated('transactions', [transaction_id]))
+
+    def delete_transaction(self, transaction_id):
+        with self.repo.transaction():
+            self.repo.apply_cash_summary(transaction_id, -1)
+            self.repo.apply_transaction_accounts(transaction_id, -1)
+            self.repo.delete('transactions', transaction_id)
+        return MutationResult(transaction_id, ChangeSet().deleted('transactions', [transaction_id]))
+
+    def delete_transactions(self, transaction_ids):
+        """批量删除资金往来"""
+        transaction_ids = [int(transaction_id) for transaction_id in transaction_ids]
+        with self.repo.transaction():
+            self.repo.apply_cash_summary(transaction_ids, -1)
+            self.repo.apply_transaction_accounts(transaction_ids, -1)
+            self.repo.delete_many('transactions', transaction_ids)
+        return MutationResult(None, ChangeSet().deleted('transactions', transaction_ids))
+
+
+class PricingService:
+    """价格表及其阶梯价"""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def add_price_list(self, price_list):
+        if not price_list.name:
+            raise ServiceError('价格表名称不能为空')
+        try:
+            with self.repo.transaction():
+                list_id = self.repo.insert('price_lists', {
+                    'name': price_list.name,
+                    'customer_id': price_list.customer_id or None,
+                    'customer_type': price_list.customer_type or None,
+                    'priority': price_list.priority,
+                })
+        except sqlite3.IntegrityError:
+            raise ServiceError('该价格表名称已存在或客户不存在')
+        return MutationResult(list_id, ChangeSet().inserted('price_lists', [list_id]))
+
+    def delete_price_list(self, list_id):
+        with self.repo.transaction():
+            self.repo.execute('DELETE FROM price_list_items WHERE price_list_id = ?', (list_id,))
+            self.repo.delete('price_lists', list_id)
+        return MutationResult(list_id, ChangeSet().deleted('price_lists', [list_id]))
+
+    def set_price(self, list_id, product_id, min_quantity, price):
+        """设置商品在价格表中某一档起订数量的价格，已有则覆盖"""
+        if not product_id:
+            raise ServiceError('请选择商品')
+        if min_quantity < 1 or price < 0:
+            raise ServiceError('起订数量至少为1，价格不能为负数')
+        with self.repo.transaction():
+            self.repo.execute('''
+                INSERT INTO price_list_items (price_list_id, product_id, min_quantity, price)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (price_list_id, product_id, min_quantity) DO UPDATE SET price = excluded.price
+            ''', (list_id, product_id, min_quantity, price))
+        return MutationResult(list_id, ChangeSet().updated('price_lists', [list_id]))
+
+    def delete_price(self, list_id, product_id, min_quantity):
+        with self.repo.transaction():
+            self.repo.execute('''
+                DELETE FROM price_list_items
+                WHERE price_list_id = ? AND product_id = ? AND min_quantity = ?
+            ''', (list_id, product_id, min_quantity))
+        return MutationResult(list_id, ChangeSet().updated('price_lists', [list_id]))
+
+
+class ErpServices:
+    """一个账套连接上的全部业务服务"""
+
+    def __init__(self, conn):
+        self.repo = SqliteRepository(conn)
+        self.inventory = InventoryService(self.repo)
+        self.customers = CustomerService(self.repo)
+        self.suppliers = SupplierService(self.repo)
+        self.orders = OrderService(self.repo)
+        self.ledger = LedgerService(self.repo)
+        self.pricing = PricingService(self.repo)
+
+
+class ApiError(Exception):
+    """HTTP 接口的请求错误，带有响应状态码"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+HTTP_REASONS = {
+    200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 409: 'Conflict', 500: 'Internal Server Error',
+}
+
+# 可以通过接口读取的表
+API_TABLES = ('categories', 'inventory', 'customers', 'suppliers', 'orders', 'transactions')
+
+
+def _money_input(table, body):
+    """接口中的金额以元传入，转换为整数分"""
+    return dict(body, **{
+        column: to_fen(body[column]) for column in MONEY_COLUMNS[table] if body.get(column) is not None
+    })
+
+
+def _order_input(body):
+    lines = body.get('lines', [])
+    if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+        raise ValueError('lines 必须是对象数组')
+    return OrderInput(**dict(
+        _money_input('orders', body),
+        lines=[OrderLine(**_money_input('order_items', line)) for line in lines]
+    ))
+
+
+# 写操作：(表名, 方法, 是否带ID) -> handler(services, row_id, body)
+API_WRITERS = {
+    ('categories', 'POST', False): lambda s, _, b: s.inventory.add_category(b.get('name')),
+    ('categories', 'DELETE', True): lambda s, row_id, _: s.inventory.delete_category(row_id),
+    ('inventory', 'POST', False): lambda s, _, b: s.inventory.add_product(ProductInput(**_money_input('inventory', b))),
+    ('inventory', 'PUT', True): lambda s, row_id, b: s.inventory.update_product(row_id, ProductInput(**_money_input('inventory', b))),
+    ('inventory', 'DELETE', True): lambda s, row_id, _: s.inventory.delete_product(row_id),
+    ('customers', 'POST', False): lambda s, _, b: s.customers.add(PartyInput(**b)),
+    ('customers', 'PUT', True): lambda s, row_id, b: s.customers.update(row_id, PartyInput(**b)),
+    ('customers', 'DELETE', True): lambda s, row_id, _: s.customers.delete(row_id),
+    ('suppliers', 'POST', False): lambda s, _, b: s.suppliers.add(PartyInput(**b)),
+    ('suppliers', 'PUT', True): lambda s, row_id, b: s.suppliers.update(row_id, PartyInput(**b)),
+    ('suppliers', 'DELETE', True): lambda s, row_id, _: s.suppliers.delete(row_id),
+    ('orders', 'POST', False): lambda s, _, b: s.orders.create_order(_order_input(b)),
+    ('orders', 'PUT', True): lambda s, row_id, b: s.orders.update_order(row_id, _order_input(b)),
+    ('orders', 'DELETE', True): lambda s, row_id, _: s.orders.delete_order(row_id),
+    ('transactions', 'POST', False): lambda s, _, b: s.ledger.add_transaction(TransactionInput(**_money_input('transactions', b))),
+    ('transactions', 'PUT', True): lambda s, row_id, b: s.ledger.update_transaction(row_id, TransactionInput(**_money_input('transactions', b))),
+    ('transactions', 'DELETE', True): lambda s, row_id, _: s.ledger.delete_transaction(row_id),
+}
+
+
+def _row_dicts(cursor, table):
+    """查询结果转为字典，金额由整数分换算为 “12.50” 形式的元字符串，不经过浮点数"""
+    names = [column[0] for column in cursor.description]
+    money = [n for n, name in enumerate(names) if name in MONEY_COLUMNS.get(table, ())]
+    rows = []
+    for row in cursor.fetchall():
+        row = list(row)
+        for n in money:
+            if row[n] is not None:
+                row[n] = format_money(row[n])
+        rows.append(dict(zip(names, row)))
+    return rows
+
+
+def api_read(conn, table, row_id, sub, query):
+    """处理读请求：列表按ID分页（after/limit），或按ID取单条记录及订单明细"""
+    cursor = conn.cursor()
+    if row_id is None:
+        after = int(query.get('after', ['0'])[0])
+        limit = max(1, min(int(query.get('limit', ['100'])[0]), 1000))
+        cursor.execute(f'SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?', (after, limit))
+        rows = _row_dicts(cursor, table)
+        return {'rows': rows, 'next': rows[-1]['id'] if len(rows) == limit else None}
+    if sub == ['items'] and table == 'orders':
+        cursor.execute('SELECT * FROM order_items WHERE order_id = ? ORDER BY id', (row_id,))
+        return {'rows': _row_dicts(cursor, 'order_items')}
+    if sub:
+        raise ApiError(404, '接口不存在')
+    cursor.execute(f'SELECT * FROM {table} WHERE id = ?', (row_id,))
+    rows = _row_dicts(cursor, table)
+    if not rows:
+        raise ApiError(404, '记录不存在')
+    return rows[0]
+
+
+def changes_to_json(changes):
+    return {
+        table: {'inserted': sorted(inserted), 'updated': sorted(updated), 'deleted': sorted(deleted)}
+        for table, inserted, updated, deleted in changes
+    }
+
+
+class ApiServer:
+    """账套的 HTTP/JSON 接口：写操作由单个写任务串行执行，读操作由只读连接池并发执行"""
+
+    def __init__(self, db_file, host='127.0.0.1', port=8080, readers=4):
+        self.db_file = db_file
+        self.host = host
+        self.port = port
+        self.reader_count = readers
+        self.server = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.write_executor = ThreadPoolExecutor(1, thread_name_prefix='erp-writer')
+        self.read_executor = ThreadPoolExecutor(self.reader_count, thread_name_prefix='erp-reader')
+        # 写连接在写线程中创建并只在该线程中使用，打开时完成结构迁移
+        self.write_services = await loop.run_in_executor(
+            self.write_executor, lambda: ErpServices(connect_database(self.db_file))
+        )
+        self.readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            self.readers.put_nowait(connect_database(self.db_file, readonly=True))
+        self.write_queue = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self._writer())
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.writer_task.cancel()
+        while not self.readers.empty():
+            self.readers.get_nowait().close()
+        self.write_executor.submit(self.write_services.repo.conn.close).result()
+        self.write_executor.shutdown()
+        self.read_executor.shutdown()
+
+    async def serve_forever(self):
+        await self.server.serve_forever()
+
+    async def _writer(self):
+        """唯一的写任务：按到达顺序逐个执行写操作"""
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, future = await self.write_queue.get()
+            try:
+                result = await loop.run_in_executor(self.write_executor, fn, self.write_services)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    async def write(self, fn):
+        """把写操作交给写任务，等待其结果"""
+        future = asyncio.get_running_loop().create_future()
+        await self.write_queue.put((fn, future))
+        return await future
+
+    async def read(self, fn):
+        """从连接池取一个只读连接执行读操作"""
+        conn = await self.readers.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.read_executor, fn, conn)
+        finally:
+            self.readers.put_nowait(conn)
+
+    async def dispatch(self, method, target, body):
+        """处理一个请求，返回 (状态码, JSON 数据)"""
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            if parts == ['api', 'search'] and method == 'GET':
+                query = parse_qs(url.query)
+                text = query.get('q', [''])[0]
+                tables = [table for table in query.get('table', []) if table in SEARCH_KINDS] or None
+                limit = max(1, min(int(query.get('limit', ['20'])[0]), 200))
+                rows = await self.read(lambda conn: search(conn, text, tables, limit))
+                return 200, {'rows': [{'table': table, 'id': row_id, 'name': name} for table, row_id, name in rows]}
+            if len(parts) < 2 or parts[0] != 'api' or parts[1] not in API_TABLES:
+                raise ApiError(404, '接口不存在')
+            table = parts[1]
+            row_id = int(parts[2]) if len(parts) > 2 else None
+            if method == 'GET':
+                query = parse_qs(url.query)
+                return 200, await self.read(lambda conn: api_read(conn, table, row_id, parts[3:], query))
+            handler = API_WRITERS.get((table, method, row_id is not None))
+            if handler is None or len(parts) > 3:
+                raise ApiError(405, '不支持的操作')
+            data = json.loads(body or b'{}')
+            if not isinstance(data, dict):
+                raise ApiError(400, '请求体必须是 JSON 对象')
+            result = await self.write(lambda services: handler(services, row_id, data))
+            return (201 if method == 'POST' else 200), {'id': result.id, 'changes': changes_to_json(result.changes)}
+        except ApiError as e:
+            return e.status, {'error': str(e)}
+        except InsufficientStockError as e:
+            return 409, {'error': str(e), 'shortages': [asdict(shortage) for shortage in e.shortages]}
+        except NotFoundError as e:
+            return 404, {'error': str(e)}
+        except ServiceError as e:
+            return 409, {'error': str(e)}
+        except (ValueError, TypeError) as e:
+            return 400, {'error': f'请求格式错误: {e}'}
+        except sqlite3.IntegrityError as e:
+            # 外键等约束拒绝了写入，如引用了不存在的客户或商品
+            return 409, {'error': f'数据约束错误: {e}'}
+        except sqlite3.Error as e:
+            return 500, {'error': f'数据库错误: {e}'}
+        except Exception as e:
+            # 其他未预料的错误也要返回响应，不能让连接处理任务异常退出
+            return 500, {'error': f'服务器内部错误: {e}'}
+
+    async def _handle(self, reader, writer):
+        """一个客户端连接，支持 HTTP/1.1 长连接"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+                
+                status, payload = await self.dispatch(method, target, body)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                head = [
+                    f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}',
+                    'Content-Type: application/json; charset=utf-8',
+                    f'Content-Length: {len(data)}',
+                ]
+                if not keep_alive:
+                    head.append('Connection: close')
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # 服务停止时仍在等待请求的长连接
+            pass
+        finally:
+            writer.close()
+
+
+async def http_request(reader, writer, method, path, payload=None):
+    """在已建立的长连接上发送一个请求，返回 (状态码, 响应体)"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else b''
+    writer.write((
+        f'{method} {path} HTTP/1.1\r\n'
+        'Host: erp\r\n'
+        'Content-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'
+    ).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+def percentile(values, p):
+    """最近秩法求百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, -(-len(ordered) * p // 100) - 1))]
+
+
+LOAD_TEST_READS = ('/api/inventory?limit=50', '/api/customers?limit=50', '/api/orders?limit=50')
+
+
+async def run_load_test(host, port, requests=2000, concurrency=32, write_ratio=0.1):
+    """对 HTTP 接口施加并发负载（读写混合，写操作为资金往来记录），返回延迟统计（毫秒）"""
+    remaining = iter(range(requests))
+    latencies = []
+    errors = 0
+    
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for n in remaining:
+                if random.random() < write_ratio:
+                    method, path = 'POST', '/api/transactions'
+                    payload = {'type': '收入', 'business_type': '对公', 'amount': 1, 'description': '压测'}
+                else:
+                    method, path, payload = 'GET', LOAD_TEST_READS[n % len(LOAD_TEST_READS)], None
+                start = time.perf_counter()
+                status, _ = await http_request(reader, writer, method, path, payload)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if status >= 400:
+                    errors += 1
+        finally:
+            writer.close()
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies, default=0.0),
+    }
+
+
+def _stress_worker(db_file, customer_id, product_ids, orders, seed):
+    """压测子进程：连续下单，返回 (成功单数, 因库存不足被拒单数, 等锁超时单数)"""
+    rng = random.Random(seed)
+    conn = connect_database(db_file, migrate=False)
+    service = ErpServices(conn).orders
+    placed = rejected = busy = 0
+    for _ in range(orders):
+        lines = [
+            OrderLine(product_id, rng.randint(1, 5), 100)
+            for product_id in rng.sample(product_ids, rng.randint(1, len(product_ids)))
+        ]
+        try:
+            service.create_order(OrderInput(customer_id, '对公', lines))
+            placed += 1
+        except InsufficientStockError:
+            rejected += 1
+        except sqlite3.OperationalError:
+            busy += 1
+    conn.close()
+    return placed, rejected, busy
+
+
+def run_stock_stress(processes=8, orders=200, products=5, stock=100):
+    """多进程并发下单，检查库存是否被超卖；在临时账套上运行，不影响现有数据"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'stress.db')
+        conn = connect_database(db_file)
+        services = ErpServices(conn)
+        category_id = services.inventory.add_category('压测').id
+        customer_id = services.customers.add(PartyInput('压测客户', '意向客户')).id
+        product_ids = [
+            services.inventory.add_product(ProductInput(f'压测商品{n}', category_id, quantity=stock)).id
+            for n in range(products)
+        ]
+        
+        start = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(_stress_worker, [
+                (db_file, customer_id, product_ids, orders, seed) for seed in range(processes)
+            ])
+        elapsed = time.perf_counter() - start
+        
+        # 库存不能为负，且必须等于期初减去已售数量、等于最后一条流水的结存
+        negative = conn.execute('SELECT COUNT(*) FROM inventory WHERE quantity < 0').fetchone()[0]
+        mismatched = conn.execute('''
+            SELECT COUNT(*) FROM inventory i
+            WHERE i.quantity != ? - COALESCE((SELECT SUM(quantity) FROM order_items WHERE product_id = i.id), 0)
+               OR i.quantity != (SELECT balance FROM stock_movements WHERE product_id = i.id ORDER BY id DESC LIMIT 1)
+        ''', (stock,)).fetchone()[0]
+        conn.close()
+    
+    placed, rejected, busy = (sum(column) for column in zip(*results))
+    return {
+        'placed': placed,
+        'rejected': rejected,
+        'busy': busy,
+        'seconds': elapsed,
+        'throughput': (placed + rejected) / elapsed if elapsed else 0.0,
+        'negative': negative,
+        'mismatched': mismatched,
+    }
+
+
+def run_order_edit_benchmark(lines=1000, changes=(0, 1, 10, 100, 1000)):
+    """在临时账套上修改一张大订单，统计每次修改写入的行数（含库存、流水和汇总）和耗时：
+    返回 [(修改的明细行数, 写入行数, 毫秒), ...]"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = connect_database(os.path.join(tmp, 'bench.db'))
+        services = ErpServices(conn)
+        category_id = services.inventory.add_category('压测').id
+        customer_id = services.customers.add(PartyInput('压测客户', '意向客户')).id
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO inventory (name, category_id, quantity, purchase_price, selling_price) VALUES (?, ?, ?, 100, 200)',
+            [(f'压测商品{n}', category_id, 1000000) for n in range(lines)]
+        )
+        conn.commit()
+        product_ids = [row[0] for row in conn.execute('SELECT id FROM inventory ORDER BY id')]
+        order_lines = [OrderLine(product_id, 1, 200) for product_id in product_ids]
+        order_id = services.orders.create_order(OrderInput(customer_id, '对公', order_lines)).id
+        
+        for count in changes:
+            # 改动前 count 行的数量
+            order_lines = [
+                OrderLine(line.product_id, line.quantity + (1 if n < count else 0), line.price)
+                for n, line in enumerate(order_lines)
+            ]
+            before = conn.total_changes
+            start = time.perf_counter()
+            services.orders.update_order(order_id, OrderInput(customer_id, '对公', order_lines))
+            elapsed = time.perf_counter() - start
+            results.append((count, conn.total_changes - before, elapsed * 1000))
+        conn.close()
+    return results
+
+
+def run_order_service_benchmark(orders=10000, lines_per_order=3, products=1000):
+    """不启动界面，在临时账套上通过业务服务逐单下单、改单、删单（每单一个事务），
+    返回 {'operations': [(操作, 单数, 秒数), ...], 'issues': 结束时一致性检查发现的问题数}"""
+    rng = random.Random(1)
+    operations = []
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = connect_database(os.path.join(tmp, 'bench.db'))
+        services = ErpServices(conn)
+        category_id = services.inventory.add_category('压测').id
+        customer_ids = [services.customers.add(PartyInput(f'压测客户{n}', '已合作客户')).id for n in range(100)]
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO inventory (name, category_id, quantity, purchase_price, selling_price) VALUES (?, ?, ?, 100, 200)',
+            [(f'压测商品{n}', category_id, 1000000) for n in range(products)]
+        )
+        conn.execute('''
+            INSERT INTO stock_movements (product_id, date, change, balance, ref_type)
+            SELECT id, ?, quantity, quantity, '期初' FROM inventory
+        ''', (_now(),))
+        conn.commit()
+        product_ids = [row[0] for row in conn.execute('SELECT id FROM inventory')]
+
+        def random_order():
+            lines = [OrderLine(product_id, rng.randint(1, 5), rng.randint(100, 900))
+                     for product_id in rng.sample(product_ids, lines_per_order)]
+            return OrderInput(rng.choice(customer_ids), rng.choice(BUSINESS_TYPES), lines)
+
+        inputs = [random_order() for _ in range(orders)]
+        start = time.perf_counter()
+        order_ids = [services.orders.create_order(order).id for order in inputs]
+        operations.append(('下单', orders, time.perf_counter() - start))
+
+        # 每单改动第一行的数量
+        changed = [
+            OrderInput(order.customer_id, order.business_type,
+                       [OrderLine(line.product_id, line.quantity + (n == 0), line.price) for n, line in enumerate(order.lines)])
+            for order in inputs
+        ]
+        start = time.perf_counter()
+        for order_id, order in zip(order_ids, changed):
+            services.orders.update_order(order_id, order)
+        operations.append(('改单', orders, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        for order_id in order_ids[::2]:
+            services.orders.delete_order(order_id)
+        operations.append(('删单', len(order_ids[::2]), time.perf_counter() - start))
+
+        issues = len(IntegrityChecker(conn).run())
+        conn.close()
+    return {'operations': operations, 'issues': issues}
+
+
+# 修改前订单列表的刷新方式：读取全部订单后重建表格
+FULL_ORDER_RELOAD_SQL = '''
+    SELECT o.*, c.name AS customer_name
+    FROM orders o
+    JOIN customers c ON o.customer_id = c.id
+    ORDER BY o.date DESC
+'''
+
+
+def run_order_refresh_benchmark(sizes=(10000, 100000, 1000000), repeat=5, lines_per_order=3):
+    """在临时账套上依次把订单数补到 sizes 中的各个规模，每个规模下单 repeat 次，
+    分别计时下单事务、按行修补订单列表、重新加载列表首页和旧的全表重新加载（不含界面绘制）。
+    返回 [(已有订单数, {操作: 中位数毫秒}), ...]"""
+    rng = random.Random(1)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = connect_database(os.path.join(tmp, 'bench.db'))
+        services = ErpServices(conn)
+        category_id = services.inventory.add_category('压测').id
+        conn.execute('BEGIN')
+        conn.executemany("INSERT INTO customers (name, type) VALUES (?, '已合作客户')", [(f'压测客户{n}',) for n in range(1000)])
+        conn.executemany(
+            'INSERT INTO inventory (name, category_id, quantity, purchase_price, selling_price) VALUES (?, ?, ?, 100, 200)',
+            [(f'压测商品{n}', category_id, 10 ** 9) for n in range(1000)]
+        )
+        conn.execute('''
+            INSERT INTO stock_movements (product_id, date, change, balance, ref_type)
+            SELECT id, '2000-01-01 00:00:00', quantity, quantity, '期初' FROM inventory
+        ''')
+        conn.commit()
+        pager = GRID_VIEWS['orders'].pager()
+        start = datetime(2020, 1, 1)
+        existing = 0
+
+        for size in sizes:
+            # 直接写入历史订单补足规模，随后重建汇总表和往来账
+            conn.execute('BEGIN')
+            while existing < size:
+                batch = range(existing + 1, min(size, existing + 100000) + 1)
+                conn.executemany(
+                    'INSERT INTO orders (id, customer_id, date, business_type, total_amount) VALUES (?, ?, ?, ?, ?)',
+                    [(order_id, rng.randint(1, 1000), str(start + timedelta(minutes=order_id)),
+                      rng.choice(BUSINESS_TYPES), 200 * lines_per_order) for order_id in batch]
+                )
+                conn.executemany(
+                    'INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, 1, 200)',
+                    [(order_id, rng.randint(1, 1000)) for order_id in batch for _ in range(lines_per_order)]
+                )
+                existing = batch[-1]
+            conn.commit()
+            rebuild_summaries(conn)
+            rebuild_accounts(conn)
+
+            timings = {'下单': [], '按行修补': [], '重新加载首页': [], '全表重新加载': []}
+            for _ in range(repeat):
+                order = OrderInput(rng.randint(1, 1000), rng.choice(BUSINESS_TYPES), [
+                    OrderLine(rng.randint(1, 1000), 1, 200) for _ in range(lines_per_order)
+                ])
+                begin = time.perf_counter()
+                result = services.orders.create_order(order)
+                timings['下单'].append(time.perf_counter() - begin)
+                begin = time.perf_counter()
+                pager.fetch_rows(conn, result.changes.tables['orders']['inserted'])
+                timings['按行修补'].append(time.perf_counter() - begin)
+                begin = time.perf_counter()
+                pager.fetch(conn)
+                timings['重新加载首页'].append(time.perf_counter() - begin)
+                begin = time.perf_counter()
+                conn.execute(FULL_ORDER_RELOAD_SQL).fetchall()
+                timings['全表重新加载'].append(time.perf_counter() - begin)
+            existing += repeat
+            results.append((size, {label: percentile(values, 50) * 1000 for label, values in timings.items()}))
+        conn.close()
+    return results
+
+
+def run_connection_profile_benchmark(commits=300, rows=100000, seconds=2.0):
+    """比较 SQLite 默认连接参数和账套连接配置（WAL 等）：逐笔提交资金往来的延迟，
+    以及另一个连接持续逐笔写入时按页刷新资金往来列表的吞吐量。
+    返回 {'默认参数' 或 '连接配置': {'commit_p50': 毫秒, 'commit_p95': 毫秒, 'pages': 页/秒, 'writes': 笔/秒}}"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, profiled in (('默认参数', False), ('连接配置', True)):
+            path = os.path.join(tmp, f'{profiled}.db')
+
+            def connect(migrate):
+                if profiled:
+                    return connect_database(path, migrate=migrate)
+                conn = sqlite3.connect(path, cached_statements=256)
+                if migrate:
+                    migrate_database(conn)
+                return conn
+
+            conn = connect(True)
+            conn.execute('BEGIN')
+            conn.executemany(
+                "INSERT INTO transactions (date, type, business_type, amount) VALUES (?, ?, '对公', ?)",
+                [(f'2024-01-01 {n // 3600 % 24:02d}:{n // 60 % 60:02d}:{n % 60:02d}', ('收入', '支出')[n % 2], 100 + n)
+                 for n in range(rows)]
+            )
+            conn.commit()
+            rebuild_summaries(conn)
+            services = ErpServices(conn)
+
+            def add(services):
+                return services.ledger.add_transaction(TransactionInput('收入', '对公', 100))
+
+            latencies = []
+            for _ in range(commits):
+                begin = time.perf_counter()
+                add(services)
+                latencies.append(time.perf_counter() - begin)
+
+            # 后台连接持续写入，当前连接翻页读取列表
+            stop = threading.Event()
+            writes = [0]
+
+            def write():
+                writer = connect(False)
+                writer_services = ErpServices(writer)
+                while not stop.is_set():
+                    add(writer_services)
+                    writes[0] += 1
+                writer.close()
+
+            thread = threading.Thread(target=write)
+            thread.start()
+            pager = GRID_VIEWS['transactions'].pager()
+            pages = 0
+            key = None
+            begin = time.perf_counter()
+            while time.perf_counter() - begin < seconds:
+                page = pager.fetch(conn, key)
+                key = page[-1][0] if len(page) == pager.page_size else None
+                pages += 1
+            elapsed = time.perf_counter() - begin
+            stop.set()
+            thread.join()
+            conn.close()
+            results[label] = {
+                'commit_p50': percentile(latencies, 50) * 1000,
+                'commit_p95': percentile(latencies, 95) * 1000,
+                'pages': pages / elapsed,
+                'writes': writes[0] / elapsed,
+            }
+    return results
+
+
+# 金额基准使用的报表查询：(说明, SQL)，直接在明细表上聚合；SQL 为空表示重建汇总表
+MONEY_BENCHMARK_QUERIES = [
+    ('按月销售额', '''
+        SELECT substr(o.date, 1, 7), SUM(i.quantity * i.price)
+        FROM order_items i JOIN orders o ON o.id = i.order_id GROUP BY 1
+    '''),
+    ('订单明细合计', 'SELECT COUNT(*), SUM(amount) FROM (SELECT SUM(quantity * price) AS amount FROM order_items GROUP BY order_id)'),
+    ('客户订单金额', 'SELECT customer_id, SUM(total_amount), SUM(freight_cost), SUM(commission) FROM orders GROUP BY 1'),
+    ('资金收支汇总', 'SELECT type, business_type, SUM(amount) FROM transactions GROUP BY 1, 2'),
+    ('重建汇总表', None),
+]
+
+
+def run_money_benchmark(orders=100000, lines_per_order=3, transactions=100000, repeat=3):
+    """在临时账套上比较金额存为 REAL 元和 INTEGER 分时的报表查询耗时和文件大小：
+    先按金额转换之前的结构写入随机数据并计时，再执行金额迁移后重新计时。
+    返回 {'size': (迁移前, 迁移后), 'migrate': 迁移秒数, 'queries': [(说明, 迁移前毫秒, 迁移后毫秒), ...]}"""
+    rng = random.Random(1)
+    money_version = next(version for version, statements in SCHEMA_MIGRATIONS if statements is migrate_money_to_fen)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        migrate_database(conn, money_version - 1)
+        apply_connection_profile(conn)
+        conn.execute('BEGIN')
+        conn.execute("INSERT INTO categories (name) VALUES ('压测')")
+        conn.executemany("INSERT INTO customers (name, type) VALUES (?, '已合作客户')", [(f'压测客户{n}',) for n in range(1000)])
+        conn.executemany(
+            'INSERT INTO inventory (name, category_id, quantity, purchase_price, selling_price) VALUES (?, 1, 1000000, ?, ?)',
+            [(f'压测商品{n}', rng.randint(100, 50000) / 100, rng.randint(100, 90000) / 100) for n in range(1000)]
+        )
+        start = datetime(2024, 1, 1)
+        for order_id in range(1, orders + 1):
+            items = [(order_id, rng.randint(1, 1000), rng.randint(1, 20), rng.randint(100, 90000) / 100)
+                     for _ in range(lines_per_order)]
+            freight, commission = rng.randint(0, 5000) / 100, rng.randint(0, 2000) / 100
+            conn.execute(
+                'INSERT INTO orders (id, customer_id, date, business_type, total_amount, freight_cost, commission) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (order_id, rng.randint(1, 1000), str(start + timedelta(minutes=order_id * 5)), rng.choice(BUSINESS_TYPES),
+                 round(sum(q * p for _, _, q, p in items) + freight - commission, 2), freight, commission)
+            )
+            conn.executemany('INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)', items)
+        conn.executemany(
+            'INSERT INTO transactions (date, type, business_type, amount, customer_id) VALUES (?, ?, ?, ?, ?)',
+            [(str(start + timedelta(minutes=n * 5)), rng.choice(('收入', '支出')), rng.choice(BUSINESS_TYPES),
+              rng.randint(100, 1000000) / 100, rng.randint(1, 1000)) for n in range(transactions)]
+        )
+        conn.commit()
+        # 汇总表和往来账迁移后会重建，迁移前也先建好，文件大小才可比
+        rebuild_summaries(conn)
+        rebuild_accounts(conn)
+
+        def measure():
+            timings = []
+            for _, sql in MONEY_BENCHMARK_QUERIES:
+                best = None
+                for _ in range(repeat):
+                    began = time.perf_counter()
+                    if sql is None:
+                        rebuild_summaries(conn)
+                    else:
+                        conn.execute(sql).fetchall()
+                    elapsed = (time.perf_counter() - began) * 1000
+                    best = elapsed if best is None else min(best, elapsed)
+                timings.append(best)
+            return timings
+
+        def size():
+            # 整理后再比较，不计迁移留下的空闲页
+            conn.execute('VACUUM')
+            return conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+
+        size_before = size()
+        before = measure()
+        began = time.perf_counter()
+        migrate_database(conn)
+        migrate_seconds = time.perf_counter() - began
+        size_after = size()
+        after = measure()
+        conn.close()
+    return {
+        'size': (size_before, size_after),
+        'migrate': migrate_seconds,
+        'queries': [(label, b, a) for (label, _), b, a in zip(MONEY_BENCHMARK_QUERIES, before, after)],
+    }
+
 
 class InventorySystem:
     def __init__(self, root):
@@ -19,6 +4341,13 @@ class InventorySystem:
         # 设置默认账套
         self.current_db_file = "账套1.db"
         
+        # 已打开账套的连接池，切换账套时复用
+        self.connection_pool = ConnectionPool()
+        self.master_data_caches = {}
+        
+        # 后台数据库线程，耗时的查询和事务都在这里执行
+        self.db_executor = DbExecutor(root)
+        
         # 创建数据库连接
         self.init_database()
         
@@ -36,6 +4365,11 @@ class InventorySystem:
         self.customers_frame = ttk.Frame(self.notebook)
         self.suppliers_frame = ttk.Frame(self.notebook)  # 新增供应商页面
         self.orders_frame = ttk.Frame(self.notebook)
+        self.reports_frame = ttk.Frame(self.notebook)
+        self.low_stock_frame = ttk.Frame(self.notebook)
+        self.aging_frame = ttk.Frame(self.notebook)
+        self.integrity_frame = ttk.Frame(self.notebook)
+        self.price_lists_frame = ttk.Frame(self.notebook)
         
         # 添加标签页
         self.notebook.add(self.inventory_frame, text="库存管理")
@@ -43,6 +4377,21 @@ class InventorySystem:
         self.notebook.add(self.customers_frame, text="客户管理")
         self.notebook.add(self.suppliers_frame, text="供应商管理")
         self.notebook.add(self.orders_frame, text="订单管理")
+        self.notebook.add(self.reports_frame, text="报表")
+        self.notebook.add(self.low_stock_frame, text="库存预警")
+        self.notebook.add(self.aging_frame, text="往来账龄")
+        self.notebook.add(self.price_lists_frame, text="价格表")
+        self.notebook.add(self.integrity_frame, text="数据检查")
+        
+        # 各列表的搜索框内容：表名 -> StringVar
+        self.search_vars = {}
+        # 各列表的排序 (列标题, 方向) 和筛选框：表名 -> {标签: StringVar 或 (下限, 上限)}
+        self.grid_sorts = {}
+        self.grid_filters = {}
+
+        # 下拉框的候选项查询和缓存，以及使用它们的下拉框
+        self.completions = {name: CompletionSource(name) for name in COMPLETIONS}
+        self.completion_widgets = {name: [] for name in COMPLETIONS}
         
         # 初始化各个页面
         self.init_inventory_page()
@@ -50,6 +4399,11 @@ class InventorySystem:
         self.init_customers_page()
         self.init_suppliers_page()
         self.init_orders_page()
+        self.init_reports_page()
+        self.init_low_stock_page()
+        self.init_aging_page()
+        self.init_price_lists_page()
+        self.init_integrity_page()
         
         # 初始化所有下拉列表数据
         self.refresh_all_combos()
@@ -57,111 +4411,35 @@ class InventorySystem:
         #刷新一下所有界面
         self.refresh_all()
 
+        # 关闭窗口时先让后台线程写完已提交的任务，再关闭连接
+        self.root.protocol('WM_DELETE_WINDOW', self.on_close)
+
+    def on_close(self):
+        """关闭主窗口：等待后台队列执行完毕，关闭后台线程和界面线程的所有连接后退出"""
+        self.root.withdraw()
+        self.db_executor.stop()
+        self.connection_pool.close_all()
+        self.root.destroy()
+
     def init_database(self):
         """初始化数据库结构"""
         if self.current_db_file is None:
             messagebox.showerror("错误", "请选择一个账套")
             return
                 
-        self.conn = sqlite3.connect(self.current_db_file)
+        # 从连接池取得连接；首次打开时创建或升级表结构并应用连接配置
+        self.conn = self.connection_pool.get(self.current_db_file)
         self.cursor = self.conn.cursor()
-        
-        # 创建商品分类表
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            )
-        ''')
-        
-        # 创建供应商表
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS suppliers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact TEXT,
-                address TEXT,
-                notes TEXT,
-                type TEXT NOT NULL
-            )
-        ''')
-        
-        # 创建库存表
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS inventory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                category_id INTEGER,
-                quantity INTEGER NOT NULL,
-                purchase_price REAL NOT NULL,  -- 进货价
-                selling_price REAL NOT NULL,   -- 销售价
-                supplier_id INTEGER,
-                warning_level INTEGER DEFAULT 10,
-                FOREIGN KEY (category_id) REFERENCES categories (id),
-                FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
-            )
-        ''')
-        
-        # 创建客户表
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact TEXT,
-                address TEXT,
-                notes TEXT,
-                type TEXT NOT NULL  -- 客户类型：意向客户/已合作客户/已联系客户
-            )
-        ''')
-        
-        # 创建订单表
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                customer_id INTEGER NOT NULL,
-                date TEXT NOT NULL,
-                business_type TEXT NOT NULL,  -- 对公/对私
-                total_amount REAL NOT NULL,   -- 订单总金额
-                freight_cost REAL DEFAULT 0,  -- 运费
-                commission REAL DEFAULT 0,    -- 回扣
-                notes TEXT,                   -- 备注
-                FOREIGN KEY (customer_id) REFERENCES customers (id)
-            )
-        ''')
-        
-        # 创建订单明细表
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS order_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id INTEGER NOT NULL,
-                product_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL,
-                price REAL NOT NULL,
-                FOREIGN KEY (order_id) REFERENCES orders (id),
-                FOREIGN KEY (product_id) REFERENCES inventory (id)
-            )
-        ''')
-        
-        # 创建资金往来表
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                type TEXT NOT NULL,           -- 收入/支出
-                business_type TEXT NOT NULL,   -- 对公/对私
-                amount REAL NOT NULL,
-                description TEXT,
-                customer_id INTEGER,
-                supplier_id INTEGER,
-                order_id INTEGER,
-                FOREIGN KEY (customer_id) REFERENCES customers (id),
-                FOREIGN KEY (supplier_id) REFERENCES suppliers (id),
-                FOREIGN KEY (order_id) REFERENCES orders (id)
-            )
-        ''')
-        
-        # 提交事务
-        self.conn.commit()
+        self.services = ErpServices(self.conn)
+        # 主数据缓存随连接保留，切换账套后再切回无需重新读取
+        cache = self.master_data_caches.get(self.current_db_file)
+        if cache is None or cache.conn is not self.conn:
+            self.master_data_caches[self.current_db_file] = MasterDataCache(self.conn)
+        self.master_data = self.master_data_caches[self.current_db_file]
+        self.pricing = PricingEngine(self.conn, self.master_data)
+        
+        # 后台线程使用自己的连接
+        self.db_executor.open(self.current_db_file)
 
     def init_inventory_page(self):
         """初始化库存管理页面"""
@@ -188,6 +4466,7 @@ class InventorySystem:
         # 创建右侧商品列表
         product_frame = ttk.Frame(self.inventory_frame)
         product_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.init_search_box(product_frame, 'inventory', self.refresh_inventory)
         
         # 商品列表
         self.inventory_tree = ttk.Treeview(
@@ -212,6 +4491,10 @@ class InventorySystem:
             self.inventory_tree.column(col, width=100)
         
         self.inventory_tree.pack(fill=tk.BOTH, expand=True)
+        self.inventory_loader = VirtualTreeLoader(
+            self.inventory_tree, self.db_executor, format_row=self.format_inventory_row
+        )
+        self.init_grid_controls('inventory', self.inventory_tree, self.refresh_inventory)
         
         # 添加商品输入框
         input_frame = ttk.LabelFrame(product_frame, text="商品信息")
@@ -227,12 +4510,12 @@ class InventorySystem:
         
         ttk.Label(row1, text='分类:').pack(side=tk.LEFT, padx=5)
         self.category_var = tk.StringVar()
-        self.category_combo = ttk.Combobox(row1, textvariable=self.category_var, state='readonly')
+        self.category_combo = self.autocomplete(row1, 'categories', self.category_var)
         self.category_combo.pack(side=tk.LEFT, padx=5)
         
         ttk.Label(row1, text='供应商:').pack(side=tk.LEFT, padx=5)
         self.supplier_var = tk.StringVar()
-        self.supplier_combo = ttk.Combobox(row1, textvariable=self.supplier_var, state='readonly')
+        self.supplier_combo = self.autocomplete(row1, 'suppliers', self.supplier_var)
         self.supplier_combo.pack(side=tk.LEFT, padx=5)
         
         # 第二行
@@ -262,11 +4545,17 @@ class InventorySystem:
         ttk.Button(btn_frame, text='添加商品', command=self.add_inventory).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text='编辑商品', command=self.edit_inventory).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text='删除商品', command=self.delete_inventory).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text='批量导入', command=lambda: self.bulk_import('inventory')).pack(side=tk.LEFT, padx=5)
         
         # 添加右键菜单
         self.inventory_menu = tk.Menu(self.inventory_tree, tearoff=0)
         self.inventory_menu.add_command(label="编辑", command=self.edit_inventory)
         self.inventory_menu.add_command(label="删除", command=self.delete_inventory)
+        self.inventory_menu.add_command(label="库存流水", command=self.show_stock_movements)
+        self.inventory_menu.add_separator()
+        self.inventory_menu.add_command(label="修改分类", command=self.bulk_set_category)
+        self.inventory_menu.add_command(label="设置供应商", command=self.bulk_set_supplier)
+        self.inventory_menu.add_command(label="调整价格", command=self.bulk_adjust_prices)
         
         # 绑定右键事件
         self.inventory_tree.bind("<Button-3>", self.show_inventory_menu)
@@ -304,6 +4593,8 @@ class InventorySystem:
         self.transactions_tree.column('描述', width=200)
         
         self.transactions_tree.pack(fill=tk.BOTH, expand=True)
+        self.transactions_loader = VirtualTreeLoader(self.transactions_tree, self.db_executor)
+        self.init_grid_controls('transactions', self.transactions_tree, self.refresh_transactions)
         
         # 创建输入框架
         input_frame = ttk.LabelFrame(main_frame, text="交易信息")
@@ -341,29 +4632,17 @@ class InventorySystem:
         
         ttk.Label(row2, text='客户:').pack(side=tk.LEFT, padx=5)
         self.trans_customer_var = tk.StringVar()
-        self.trans_customer_combo = ttk.Combobox(
-            row2,
-            textvariable=self.trans_customer_var,
-            state='readonly'
-        )
+        self.trans_customer_combo = self.autocomplete(row2, 'customers', self.trans_customer_var)
         self.trans_customer_combo.pack(side=tk.LEFT, padx=5)
         
         ttk.Label(row2, text='供应商:').pack(side=tk.LEFT, padx=5)
         self.trans_supplier_var = tk.StringVar()
-        self.trans_supplier_combo = ttk.Combobox(
-            row2,
-            textvariable=self.trans_supplier_var,
-            state='readonly'
-        )
+        self.trans_supplier_combo = self.autocomplete(row2, 'suppliers', self.trans_supplier_var)
         self.trans_supplier_combo.pack(side=tk.LEFT, padx=5)
         
         ttk.Label(row2, text='关联订单:').pack(side=tk.LEFT, padx=5)
         self.trans_order_var = tk.StringVar()
-        self.trans_order_combo = ttk.Combobox(
-            row2,
-            textvariable=self.trans_order_var,
-            state='readonly'
-        )
+        self.trans_order_combo = self.autocomplete(row2, 'orders', self.trans_order_var)
         self.trans_order_combo.pack(side=tk.LEFT, padx=5)
         
         # 第三行
@@ -395,6 +4674,7 @@ class InventorySystem:
         # 创建主框架
         main_frame = ttk.Frame(self.customers_frame)
         main_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.init_search_box(main_frame, 'customers', self.refresh_customers)
         
         # 创建客户列表
         self.customers_tree = ttk.Treeview(
@@ -419,6 +4699,8 @@ class InventorySystem:
         self.customers_tree.column('备注', width=200)
         
         self.customers_tree.pack(fill=tk.BOTH, expand=True)
+        self.customers_loader = VirtualTreeLoader(self.customers_tree, self.db_executor)
+        self.init_grid_controls('customers', self.customers_tree, self.refresh_customers)
         
         # 创建输入框架
         input_frame = ttk.LabelFrame(main_frame, text="客户信息")
@@ -468,6 +4750,7 @@ class InventorySystem:
         ttk.Button(btn_frame, text='添加客户', command=self.add_customer).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text='编辑客户', command=self.edit_customer).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text='删除客户', command=self.delete_customer).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text='批量导入', command=lambda: self.bulk_import('customers')).pack(side=tk.LEFT, padx=5)
         
         # 添加右键菜单
         self.customers_menu = tk.Menu(self.customers_tree, tearoff=0)
@@ -482,6 +4765,7 @@ class InventorySystem:
         # 创建主框架
         main_frame = ttk.Frame(self.suppliers_frame)
         main_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.init_search_box(main_frame, 'suppliers', self.refresh_suppliers)
         
         # 创建供应商列表
         self.suppliers_tree = ttk.Treeview(
@@ -506,6 +4790,8 @@ class InventorySystem:
         self.suppliers_tree.column('备注', width=200)
         
         self.suppliers_tree.pack(fill=tk.BOTH, expand=True)
+        self.suppliers_loader = VirtualTreeLoader(self.suppliers_tree, self.db_executor)
+        self.init_grid_controls('suppliers', self.suppliers_tree, self.refresh_suppliers)
         
         # 创建输入框架
         input_frame = ttk.LabelFrame(main_frame, text="供应商信息")
@@ -555,6 +4841,7 @@ class InventorySystem:
         ttk.Button(btn_frame, text='添加供应商', command=self.add_supplier).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text='编辑供应商', command=self.edit_supplier).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text='删除供应商', command=self.delete_supplier).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text='批量导入', command=lambda: self.bulk_import('suppliers')).pack(side=tk.LEFT, padx=5)
         
         # 添加右键菜单
         self.suppliers_menu = tk.Menu(self.suppliers_tree, tearoff=0)
@@ -594,6 +4881,8 @@ class InventorySystem:
         self.orders_tree.column('备注', width=200)
         
         self.orders_tree.pack(fill=tk.BOTH, expand=True)
+        self.orders_loader = VirtualTreeLoader(self.orders_tree, self.db_executor)
+        self.init_grid_controls('orders', self.orders_tree, self.refresh_orders)
         
         # 创建订单明细列表
         detail_frame = ttk.LabelFrame(main_frame, text="订单明细")
@@ -619,6 +4908,8 @@ class InventorySystem:
             self.order_items_tree.column(col, width=100)
         
         self.order_items_tree.pack(fill=tk.BOTH, expand=True)
+        # 订单明细的数据：表格行ID -> OrderLine，合计和保存都从这里读取
+        self.order_lines = {}
         
         # 创建输入框架
         input_frame = ttk.LabelFrame(main_frame, text="订单信息")
@@ -630,12 +4921,10 @@ class InventorySystem:
         
         ttk.Label(row1, text='客户:').pack(side=tk.LEFT, padx=5)
         self.order_customer_var = tk.StringVar()
-        self.order_customer_combo = ttk.Combobox(
-            row1,
-            textvariable=self.order_customer_var,
-            state='readonly'
-        )
+        self.order_customer_combo = self.autocomplete(row1, 'customers', self.order_customer_var)
         self.order_customer_combo.pack(side=tk.LEFT, padx=5)
+        # 客户不同价格可能不同，换客户后重新定价
+        self.order_customer_var.trace_add('write', lambda *args: self.reprice_order())
         
         ttk.Label(row1, text='业务类型:').pack(side=tk.LEFT, padx=5)
         self.order_business_type_var = tk.StringVar()
@@ -692,11 +4981,7 @@ class InventorySystem:
         
         ttk.Label(p_row1, text='商品:').pack(side=tk.LEFT, padx=5)
         self.order_product_var = tk.StringVar()
-        self.order_product_combo = ttk.Combobox(
-            p_row1,
-            textvariable=self.order_product_var,
-            state='readonly'
-        )
+        self.order_product_combo = self.autocomplete(p_row1, 'products', self.order_product_var)
         self.order_product_combo.pack(side=tk.LEFT, padx=5)
         
         ttk.Label(p_row1, text='数量:').pack(side=tk.LEFT, padx=5)
@@ -723,6 +5008,568 @@ class InventorySystem:
         self.orders_tree.bind("<Button-3>", self.show_orders_menu)
 
 
+    def init_search_box(self, parent, table, refresh):
+        """在列表上方添加搜索框，输入停顿后按检索词重新加载列表"""
+        frame = ttk.Frame(parent)
+        frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(frame, text='搜索:').pack(side=tk.LEFT, padx=5)
+        var = tk.StringVar()
+        ttk.Entry(frame, textvariable=var, width=30).pack(side=tk.LEFT, padx=5)
+        self.search_vars[table] = var
+        
+        pending = [None]
+        
+        def run():
+            pending[0] = None
+            refresh()
+        
+        def on_change(*args):
+            # 连续输入时只在停顿后查询一次
+            if pending[0] is not None:
+                self.root.after_cancel(pending[0])
+            pending[0] = self.root.after(200, run)
+        
+        var.trace_add('write', on_change)
+
+    def search_filter(self, table, alias):
+        """当前搜索框对应的列表筛选条件 (SQL, 参数)，没有输入时不筛选"""
+        var = self.search_vars.get(table)
+        query = var.get().strip() if var else ''
+        if not query:
+            return '', ()
+        return search_condition(table, alias, query)
+
+    def init_grid_controls(self, name, tree, refresh):
+        """为列表添加表头点击排序和按列筛选栏，条件变化后重新加载列表"""
+        view = GRID_VIEWS[name]
+        frame = ttk.Frame(tree.master)
+        frame.pack(fill=tk.X, pady=(0, 5), before=tree)
+        filters = self.grid_filters[name] = {}
+
+        pending = [None]
+
+        def run():
+            pending[0] = None
+            refresh()
+
+        def on_change(*args):
+            # 连续输入时只在停顿后查询一次
+            if pending[0] is not None:
+                self.root.after_cancel(pending[0])
+            pending[0] = self.root.after(300, run)
+
+        for item in view.filters:
+            ttk.Label(frame, text=f'{item.label}:').pack(side=tk.LEFT, padx=(5, 2))
+            if item.kind in ('date', 'range', 'money'):
+                low, high = tk.StringVar(), tk.StringVar()
+                ttk.Entry(frame, textvariable=low, width=10).pack(side=tk.LEFT)
+                ttk.Label(frame, text='-').pack(side=tk.LEFT)
+                ttk.Entry(frame, textvariable=high, width=10).pack(side=tk.LEFT)
+                filters[item.label] = (low, high)
+            elif item.kind == 'choice':
+                var = tk.StringVar()
+                ttk.Combobox(frame, textvariable=var, values=('',) + item.choices,
+                             state='readonly', width=10).pack(side=tk.LEFT)
+                filters[item.label] = var
+            else:
+                var = tk.StringVar()
+                self.autocomplete(frame, item.choices[0], var, width=15).pack(side=tk.LEFT)
+                filters[item.label] = var
+
+        def clear():
+            for var in filters.values():
+                for v in (var if isinstance(var, tuple) else (var,)):
+                    v.set('')
+
+        ttk.Button(frame, text='清除筛选', command=clear).pack(side=tk.LEFT, padx=5)
+        for var in filters.values():
+            for v in (var if isinstance(var, tuple) else (var,)):
+                v.trace_add('write', on_change)
+
+        def sort_by(heading):
+            current, direction = self.grid_sorts.get(name) or view.default_sort
+            if heading == current:
+                direction = 'ASC' if direction == 'DESC' else 'DESC'
+            else:
+                direction = 'ASC'
+            self.grid_sorts[name] = (heading, direction)
+            show_headings()
+            refresh()
+
+        def show_headings():
+            current, direction = self.grid_sorts.get(name) or view.default_sort
+            for col in view.columns:
+                arrow = (' ▲' if direction == 'ASC' else ' ▼') if col.heading == current else ''
+                tree.heading(col.heading, text=col.heading + arrow)
+
+        for col in view.columns:
+            if col.sortable:
+                tree.heading(col.heading, command=lambda heading=col.heading: sort_by(heading))
+        show_headings()
+
+    def grid_pager(self, name, where='', params=()):
+        """按列表当前的排序和筛选生成分页查询，where/params 为额外条件"""
+        values = {
+            label: tuple(v.get() for v in var) if isinstance(var, tuple) else var.get()
+            for label, var in self.grid_filters.get(name, {}).items()
+        }
+        return GRID_VIEWS[name].pager(self.grid_sorts.get(name), values, where, params)
+
+    def init_reports_page(self):
+        """初始化报表页面"""
+        reports = {'销售汇总': 'sales', '资金汇总': 'cash'}
+        
+        # 查询条件
+        input_frame = ttk.LabelFrame(self.reports_frame, text="查询条件")
+        input_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Label(input_frame, text='报表:').pack(side=tk.LEFT, padx=5)
+        report_var = tk.StringVar(value='销售汇总')
+        report_combo = ttk.Combobox(input_frame, textvariable=report_var, values=list(reports), state='readonly', width=10)
+        report_combo.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(input_frame, text='分组:').pack(side=tk.LEFT, padx=5)
+        group_vars = [tk.StringVar(), tk.StringVar()]
+        group_combos = []
+        for var in group_vars:
+            combo = ttk.Combobox(input_frame, textvariable=var, state='readonly', width=8)
+            combo.pack(side=tk.LEFT, padx=2)
+            group_combos.append(combo)
+        
+        ttk.Label(input_frame, text='开始日期:').pack(side=tk.LEFT, padx=5)
+        from_var = tk.StringVar()
+        ttk.Entry(input_frame, textvariable=from_var, width=12).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(input_frame, text='结束日期:').pack(side=tk.LEFT, padx=5)
+        to_var = tk.StringVar()
+        ttk.Entry(input_frame, textvariable=to_var, width=12).pack(side=tk.LEFT, padx=5)
+        
+        # 查询结果
+        self.reports_tree = ttk.Treeview(self.reports_frame, show='headings', height=20)
+        self.reports_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        status_var = tk.StringVar()
+        ttk.Label(self.reports_frame, textvariable=status_var).pack(anchor=tk.W, padx=5)
+        
+        def dimensions():
+            # 维度名 -> 显示名称
+            return {name: label for name, (_, label) in SUMMARY_REPORTS[reports[report_var.get()]][1].items()}
+        
+        def on_report_changed(event=None):
+            labels = [''] + list(dimensions().values())
+            for combo, var, default in zip(group_combos, group_vars, ('月份', '')):
+                combo['values'] = labels
+                var.set(default)
+        
+        def query():
+            names = {label: name for name, label in dimensions().items()}
+            group_by = [names[var.get()] for var in group_vars if var.get()]
+            report = reports[report_var.get()]
+            date_from = from_var.get().strip() or None
+            date_to = to_var.get().strip() or None
+            
+            def done(result):
+                columns, rows = result
+                tree = self.reports_tree
+                tree.delete(*tree.get_children())
+                tree['columns'] = columns
+                for col in columns:
+                    tree.heading(col, text=col)
+                    tree.column(col, width=120)
+                for row in rows:
+                    tree.insert('', tk.END, values=row)
+                status_var.set(f'共 {len(rows)} 行')
+            
+            def failed(error):
+                messagebox.showerror('错误', f'查询报表失败: {error}')
+            
+            self.db_executor.submit(
+                lambda conn: summary_report(conn, report, group_by, date_from, date_to),
+                done, failed, tag='report'
+            )
+        
+        def rebuild():
+            if not messagebox.askyesno('确认', '按现有订单和资金往来重建汇总表？'):
+                return
+            
+            def done(_):
+                status_var.set('汇总表已重建')
+                query()
+            
+            def failed(error):
+                messagebox.showerror('错误', f'重建汇总失败: {error}')
+            
+            status_var.set('正在重建汇总...')
+            self.db_executor.submit(rebuild_summaries, done, failed)
+        
+        report_combo.bind('<<ComboboxSelected>>', on_report_changed)
+        on_report_changed()
+        
+        ttk.Button(input_frame, text='查询', command=query).pack(side=tk.LEFT, padx=5)
+        ttk.Button(input_frame, text='重建汇总', command=rebuild).pack(side=tk.LEFT, padx=5)
+
+    def init_low_stock_page(self):
+        """初始化库存预警页面：列出库存不高于预警值的商品"""
+        self.low_stock_var = tk.StringVar()
+        ttk.Label(self.low_stock_frame, textvariable=self.low_stock_var).pack(anchor=tk.W, padx=5, pady=5)
+        
+        self.low_stock_tree = ttk.Treeview(
+            self.low_stock_frame,
+            columns=('ID', '商品名称', '分类', '供应商', '库存', '预警值', '缺口'),
+            show='headings',
+            height=20
+        )
+        for col in self.low_stock_tree['columns']:
+            self.low_stock_tree.heading(col, text=col)
+            self.low_stock_tree.column(col, width=100)
+        self.low_stock_tree.column('商品名称', width=200)
+        self.low_stock_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.low_stock_loader = VirtualTreeLoader(self.low_stock_tree, self.db_executor)
+        
+        ttk.Button(self.low_stock_frame, text='刷新', command=self.refresh_low_stock).pack(pady=5)
+
+    def refresh_low_stock(self):
+        """刷新库存预警列表和预警商品数"""
+        pager = KeysetPager(
+            'i.id, i.name, c.name, s.name, i.quantity, i.warning_level, i.warning_level - i.quantity',
+            '''inventory i
+            LEFT JOIN categories c ON i.category_id = c.id
+            LEFT JOIN suppliers s ON i.supplier_id = s.id''',
+            [('i.id', 'ASC')],
+            LOW_STOCK_CONDITION
+        )
+        self.low_stock_loader.load(pager)
+        
+        def show_count(count):
+            self.low_stock_var.set(f'库存不高于预警值的商品: {count} 个')
+            # 有预警时在标签页标题上提示数量
+            self.notebook.tab(self.low_stock_frame, text=f'库存预警 ({count})' if count else '库存预警')
+        
+        self.db_executor.submit(low_stock_count, show_count, tag='low_stock_count')
+
+    def init_aging_page(self):
+        """初始化往来账龄页面：按余额从大到小列出客户应收或供应商应付及账龄区间"""
+        top = ttk.Frame(self.aging_frame)
+        top.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(top, text='类别:').pack(side=tk.LEFT, padx=5)
+        self.aging_kind_var = tk.StringVar(value='应收')
+        combo = ttk.Combobox(top, textvariable=self.aging_kind_var, values=list(ACCOUNT_PARTIES),
+                             state='readonly', width=8)
+        combo.pack(side=tk.LEFT, padx=5)
+        combo.bind('<<ComboboxSelected>>', lambda event: self.refresh_aging())
+        ttk.Button(top, text='刷新', command=self.refresh_aging).pack(side=tk.LEFT, padx=5)
+        self.aging_summary_var = tk.StringVar()
+        ttk.Label(top, textvariable=self.aging_summary_var).pack(side=tk.LEFT, padx=10)
+        
+        self.aging_tree = ttk.Treeview(
+            self.aging_frame,
+            columns=('ID', '名称', '余额', '0-30天', '31-60天', '61-90天', '90天以上'),
+            show='headings',
+            height=20
+        )
+        for col in self.aging_tree['columns']:
+            self.aging_tree.heading(col, text=col)
+            self.aging_tree.column(col, width=100)
+        self.aging_tree.column('名称', width=200)
+        self.aging_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.aging_loader = VirtualTreeLoader(self.aging_tree, self.db_executor, format_row=aging_row)
+        self.aging_stale = False
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+
+    def on_tab_changed(self, event=None):
+        """切换到账龄页时，若期间往来有变化则刷新账龄表和合计"""
+        if self.aging_stale and self.notebook.select() == str(self.aging_frame):
+            self.refresh_aging()
+
+    def refresh_aging(self):
+        """刷新账龄表和合计"""
+        self.aging_stale = False
+        kind = self.aging_kind_var.get()
+        self.aging_loader.load(aging_pager(kind))
+        
+        def show_summary(summary):
+            buckets = '，'.join(
+                f'{label} {format_money(amount)}' for label, amount in zip(self.aging_tree['columns'][3:], summary['buckets'])
+            )
+            self.aging_summary_var.set(
+                f"{summary['parties']} 个往来单位，余额合计 {format_money(summary['balance'])}（{buckets}）"
+            )
+        
+        self.db_executor.submit(lambda conn: aging_summary(conn, kind), show_summary, tag='aging_summary')
+
+    def init_price_lists_page(self):
+        """初始化价格表页面：左侧为价格表，右侧为选中价格表的商品阶梯价"""
+        list_frame = ttk.Frame(self.price_lists_frame)
+        list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        self.price_lists_tree = ttk.Treeview(
+            list_frame,
+            columns=('ID', '名称', '客户', '客户类型', '优先级'),
+            show='headings',
+            height=15
+        )
+        for col in self.price_lists_tree['columns']:
+            self.price_lists_tree.heading(col, text=col)
+            self.price_lists_tree.column(col, width=90)
+        self.price_lists_tree.pack(fill=tk.BOTH, expand=True)
+        self.price_lists_tree.bind('<<TreeviewSelect>>', lambda event: self.refresh_price_list_items())
+        
+        input_frame = ttk.LabelFrame(list_frame, text='价格表')
+        input_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(input_frame, text='名称:').grid(row=0, column=0, padx=5, pady=5)
+        self.price_list_name_var = tk.StringVar()
+        ttk.Entry(input_frame, textvariable=self.price_list_name_var).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Label(input_frame, text='优先级:').grid(row=0, column=2, padx=5, pady=5)
+        self.price_list_priority_var = tk.StringVar(value='0')
+        ttk.Entry(input_frame, textvariable=self.price_list_priority_var, width=8).grid(row=0, column=3, padx=5, pady=5)
+        ttk.Label(input_frame, text='客户:').grid(row=1, column=0, padx=5, pady=5)
+        self.price_list_customer_var = tk.StringVar()
+        self.autocomplete(input_frame, 'customers', self.price_list_customer_var).grid(row=1, column=1, padx=5, pady=5)
+        ttk.Label(input_frame, text='客户类型:').grid(row=1, column=2, padx=5, pady=5)
+        self.price_list_type_var = tk.StringVar()
+        ttk.Combobox(
+            input_frame,
+            textvariable=self.price_list_type_var,
+            values=['', '意向客户', '已合作客户', '已联系客户'],
+            state='readonly'
+        ).grid(row=1, column=3, padx=5, pady=5)
+        btn_frame = ttk.Frame(input_frame)
+        btn_frame.grid(row=2, column=0, columnspan=4, pady=5)
+        ttk.Button(btn_frame, text='添加价格表', command=self.add_price_list).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text='删除价格表', command=self.delete_price_list).pack(side=tk.LEFT, padx=5)
+        
+        item_frame = ttk.Frame(self.price_lists_frame)
+        item_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        self.price_items_tree = ttk.Treeview(
+            item_frame,
+            columns=('商品ID', '商品名称', '起订数量', '价格'),
+            show='headings',
+            height=15
+        )
+        for col in self.price_items_tree['columns']:
+            self.price_items_tree.heading(col, text=col)
+            self.price_items_tree.column(col, width=90)
+        self.price_items_tree.pack(fill=tk.BOTH, expand=True)
+        
+        price_frame = ttk.LabelFrame(item_frame, text='阶梯价')
+        price_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(price_frame, text='商品:').grid(row=0, column=0, padx=5, pady=5)
+        self.price_product_var = tk.StringVar()
+        self.autocomplete(price_frame, 'products', self.price_product_var).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Label(price_frame, text='起订数量:').grid(row=1, column=0, padx=5, pady=5)
+        self.price_min_quantity_var = tk.StringVar(value='1')
+        ttk.Entry(price_frame, textvariable=self.price_min_quantity_var).grid(row=1, column=1, padx=5, pady=5)
+        ttk.Label(price_frame, text='价格:').grid(row=2, column=0, padx=5, pady=5)
+        self.price_value_var = tk.StringVar()
+        ttk.Entry(price_frame, textvariable=self.price_value_var).grid(row=2, column=1, padx=5, pady=5)
+        btn_frame = ttk.Frame(price_frame)
+        btn_frame.grid(row=3, column=0, columnspan=2, pady=5)
+        ttk.Button(btn_frame, text='设置价格', command=self.set_list_price).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text='删除价格', command=self.delete_list_price).pack(side=tk.LEFT, padx=5)
+
+    def selected_price_list(self):
+        selected = self.price_lists_tree.selection()
+        if not selected:
+            messagebox.showwarning('警告', '请选择价格表')
+            return None
+        return int(selected[0])
+
+    def refresh_price_lists(self):
+        """刷新价格表列表"""
+        self.price_lists_tree.delete(*self.price_lists_tree.get_children())
+        self.cursor.execute('''
+            SELECT p.id, p.name, c.name, p.customer_type, p.priority
+            FROM price_lists p LEFT JOIN customers c ON p.customer_id = c.id
+            ORDER BY p.id
+        ''')
+        for row in self.cursor.fetchall():
+            self.price_lists_tree.insert('', 'end', iid=str(row[0]), values=['' if value is None else value for value in row])
+        self.price_items_tree.delete(*self.price_items_tree.get_children())
+
+    def refresh_price_list_items(self):
+        """刷新选中价格表的阶梯价"""
+        self.price_items_tree.delete(*self.price_items_tree.get_children())
+        selected = self.price_lists_tree.selection()
+        if not selected:
+            return
+        self.cursor.execute('''
+            SELECT product_id, min_quantity, price FROM price_list_items
+            WHERE price_list_id = ? ORDER BY product_id, min_quantity
+        ''', (int(selected[0]),))
+        for product_id, min_quantity, price in self.cursor.fetchall():
+            self.price_items_tree.insert('', 'end', values=(
+                product_id, self.master_data.name('inventory', product_id), min_quantity, format_money(price)
+            ))
+
+    def add_price_list(self):
+        """添加价格表"""
+        try:
+            price_list = PriceListInput(
+                name=self.price_list_name_var.get(),
+                customer_id=self.selected_id(self.price_list_customer_var.get()),
+                customer_type=self.price_list_type_var.get() or None,
+                priority=int(self.price_list_priority_var.get() or 0)
+            )
+            self.services.pricing.add_price_list(price_list)
+            self.refresh_price_lists()
+            self.price_list_name_var.set('')
+            self.price_list_customer_var.set('')
+            self.price_list_type_var.set('')
+            self.price_list_priority_var.set('0')
+        except ValueError:
+            messagebox.showerror('错误', '优先级必须是整数')
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'添加价格表失败: {e}')
+
+    def delete_price_list(self):
+        """删除价格表及其全部阶梯价"""
+        list_id = self.selected_price_list()
+        if list_id is None or not messagebox.askyesno('确认', '确定要删除该价格表吗？'):
+            return
+        try:
+            self.services.pricing.delete_price_list(list_id)
+            self.refresh_price_lists()
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'删除价格表失败: {e}')
+
+    def set_list_price(self):
+        """设置选中价格表中商品某一档的价格"""
+        list_id = self.selected_price_list()
+        if list_id is None:
+            return
+        try:
+            self.services.pricing.set_price(
+                list_id,
+                self.selected_id(self.price_product_var.get()),
+                int(self.price_min_quantity_var.get()),
+                to_fen(self.price_value_var.get())
+            )
+            self.refresh_price_list_items()
+        except ValueError:
+            messagebox.showerror('错误', '请输入有效的数字')
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'设置价格失败: {e}')
+
+    def delete_list_price(self):
+        """删除选中的阶梯价"""
+        list_id = self.selected_price_list()
+        selected = self.price_items_tree.selection()
+        if list_id is None or not selected:
+            return
+        try:
+            for iid in selected:
+                product_id, _, min_quantity, _ = self.price_items_tree.item(iid)['values']
+                self.services.pricing.delete_price(list_id, product_id, min_quantity)
+            self.refresh_price_list_items()
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'删除价格失败: {e}')
+
+    def init_integrity_page(self):
+        """初始化数据检查页面：后台分块检查一致性，列出问题并可按修复计划修复"""
+        self.integrity_checker = None
+        
+        btn_frame = ttk.Frame(self.integrity_frame)
+        btn_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Button(btn_frame, text='开始检查', command=self.start_integrity_check).pack(side=tk.LEFT, padx=2)
+        ttk.Button(btn_frame, text='停止', command=self.stop_integrity_check).pack(side=tk.LEFT, padx=2)
+        ttk.Button(btn_frame, text='执行修复', command=self.repair_integrity_issues).pack(side=tk.LEFT, padx=2)
+        self.integrity_var = tk.StringVar(value='尚未检查')
+        ttk.Label(btn_frame, textvariable=self.integrity_var).pack(side=tk.LEFT, padx=10)
+        
+        self.integrity_progress = ttk.Progressbar(self.integrity_frame, mode='determinate')
+        self.integrity_progress.pack(fill=tk.X, padx=5)
+        
+        self.integrity_tree = ttk.Treeview(
+            self.integrity_frame,
+            columns=('检查项', '表', 'ID', '说明', '修复'),
+            show='headings',
+            height=20
+        )
+        for col in self.integrity_tree['columns']:
+            self.integrity_tree.heading(col, text=col)
+            self.integrity_tree.column(col, width=100)
+        self.integrity_tree.column('说明', width=300)
+        self.integrity_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+    def start_integrity_check(self):
+        """在后台线程中逐块检查，每块一个任务，其间列表的查询可以插队执行"""
+        self.stop_integrity_check()
+        self.integrity_tree.delete(*self.integrity_tree.get_children())
+        self.integrity_progress['value'] = 0
+        self.integrity_var.set('正在检查...')
+        shown = [0]
+        
+        def failed(error):
+            self.integrity_var.set(f'检查失败: {error}')
+        
+        def next_step():
+            checker = self.integrity_checker
+            self.db_executor.submit(lambda conn: checker.step(), on_step, failed, tag='integrity')
+        
+        def on_created(checker):
+            self.integrity_checker = checker
+            next_step()
+        
+        def on_step(progress):
+            position, total = progress
+            checker = self.integrity_checker
+            for issue in checker.issues[shown[0]:]:
+                self.integrity_tree.insert('', 'end', values=(
+                    issue.check, issue.table, issue.row_id, issue.detail, '自动' if issue.repair else '人工'
+                ))
+            shown[0] = len(checker.issues)
+            self.integrity_progress['value'] = position * 100 / total if total else 100
+            if not checker.done:
+                self.integrity_var.set(f'正在检查 {position}/{total}，发现问题 {checker.total_issues} 个')
+                next_step()
+            elif checker.total_issues:
+                self.integrity_var.set(f'检查完成，发现问题 {checker.total_issues} 个，'
+                                       f'可自动修复 {sum(1 for issue in checker.issues if issue.repair)} 个')
+            else:
+                self.integrity_var.set('检查完成，未发现问题')
+        
+        self.db_executor.submit(IntegrityChecker, on_created, failed, tag='integrity')
+
+    def stop_integrity_check(self):
+        """取消尚未执行的检查块"""
+        self.db_executor.cancel('integrity')
+        checker = self.integrity_checker
+        if checker is not None and not checker.done:
+            self.integrity_var.set(f'已停止，已检查 {checker.position}/{len(checker.steps)}')
+
+    def repair_integrity_issues(self):
+        """按检查结果生成修复计划并在一个事务中执行"""
+        checker = self.integrity_checker
+        if checker is None or not checker.done:
+            messagebox.showwarning('警告', '请先完成检查')
+            return
+        plan = repair_plan(checker.issues)
+        if not plan:
+            messagebox.showinfo('提示', '没有可自动修复的问题')
+            return
+        manual = sum(1 for issue in checker.issues if not issue.repair)
+        message = f'将执行 {len(plan)} 条修复语句'
+        if manual:
+            message += f'，另有 {manual} 个问题需要人工处理'
+        if not messagebox.askyesno('确认', message + '，是否继续？'):
+            return
+        
+        def done(count):
+            self.refresh_all()
+            messagebox.showinfo('成功', f'已执行 {count} 条修复语句')
+            # 重新检查，确认修复结果
+            self.start_integrity_check()
+        
+        def failed(error):
+            messagebox.showerror('错误', f'修复失败: {error}')
+        
+        self.db_executor.submit(lambda conn: apply_repair_plan(conn, plan), done, failed)
+
     def refresh_all_combos(self):
         """刷新所有下拉列表的数据"""
         self.update_customer_combos()
@@ -731,85 +5578,81 @@ class InventorySystem:
         self.update_category_combos()
         self.update_order_combo()
 
+    def autocomplete(self, parent, name, textvariable, **kw):
+        """创建按输入查询候选项的下拉框"""
+        combo = AutocompleteCombobox(parent, self.db_executor, self.completions[name], textvariable=textvariable, **kw)
+        self.completion_widgets[name].append(combo)
+        return combo
+
+    def invalidate_completions(self, *names):
+        """数据变化后清空候选项缓存，下拉框在下次输入或展开时重新查询"""
+        for name in names:
+            self.completions[name].invalidate()
+            widgets = [combo for combo in self.completion_widgets[name] if combo.winfo_exists()]
+            for combo in widgets:
+                combo.reset()
+            self.completion_widgets[name] = widgets
+
     def update_customer_combos(self):
         """更新所有客户下拉列表"""
-        self.cursor.execute('SELECT id, name FROM customers')
-        customers = self.cursor.fetchall()
-        customer_list = [f"{id} - {name}" for id, name in customers]
-        
-        self.order_customer_combo['values'] = customer_list
-        self.trans_customer_combo['values'] = customer_list
+        # 订单下拉框显示客户名称
+        self.invalidate_completions('customers', 'orders')
 
     def update_supplier_combos(self):
         """更新所有供应商下拉列表"""
-        self.cursor.execute('SELECT id, name FROM suppliers')
-        suppliers = self.cursor.fetchall()
-        supplier_list = [f"{id} - {name}" for id, name in suppliers]
-        
-        self.supplier_combo['values'] = supplier_list
-        self.trans_supplier_combo['values'] = supplier_list
+        self.invalidate_completions('suppliers')
 
     def update_product_combos(self):
         """更新所有商品下拉列表"""
-        self.cursor.execute('SELECT id, name, selling_price FROM inventory')
-        products = self.cursor.fetchall()
-        product_list = [f"{id} - {name} (¥{price})" for id, name, price in products]
-        
-        self.order_product_combo['values'] = product_list
+        self.invalidate_completions('products')
 
     def update_category_combos(self):
         """更新所有分类下拉列表"""
-        self.cursor.execute('SELECT id, name FROM categories')
-        categories = self.cursor.fetchall()
-        category_list = [f"{id} - {name}" for id, name in categories]
-        
-        self.category_combo['values'] = category_list
+        self.invalidate_completions('categories')
 
     def update_order_combo(self):
         """更新订单下拉列表"""
-        self.cursor.execute('''
-            SELECT o.id, c.name, o.total_amount 
-            FROM orders o 
-            JOIN customers c ON o.customer_id = c.id
-        ''')
-        orders = self.cursor.fetchall()
-        order_list = [f"{id} - {name} (¥{amount})" for id, name, amount in orders]
-        
-        self.trans_order_combo['values'] = order_list
+        self.invalidate_completions('orders')
 
     def show_inventory_menu(self, event):
         """显示库存右键菜单"""
         item = self.inventory_tree.identify_row(event.y)
         if item:
-            self.inventory_tree.selection_set(item)
+            # 右键点在已选中的行上时保留多选
+            if item not in self.inventory_tree.selection():
+                self.inventory_tree.selection_set(item)
             self.inventory_menu.post(event.x_root, event.y_root)
 
     def show_transactions_menu(self, event):
         """显示交易记录右键菜单"""
         item = self.transactions_tree.identify_row(event.y)
         if item:
-            self.transactions_tree.selection_set(item)
+            if item not in self.transactions_tree.selection():
+                self.transactions_tree.selection_set(item)
             self.transactions_menu.post(event.x_root, event.y_root)
 
     def show_customers_menu(self, event):
         """显示客户右键菜单"""
         item = self.customers_tree.identify_row(event.y)
         if item:
-            self.customers_tree.selection_set(item)
+            if item not in self.customers_tree.selection():
+                self.customers_tree.selection_set(item)
             self.customers_menu.post(event.x_root, event.y_root)
 
     def show_suppliers_menu(self, event):
         """显示供应商右键菜单"""
         item = self.suppliers_tree.identify_row(event.y)
         if item:
-            self.suppliers_tree.selection_set(item)
+            if item not in self.suppliers_tree.selection():
+                self.suppliers_tree.selection_set(item)
             self.suppliers_menu.post(event.x_root, event.y_root)
 
     def show_orders_menu(self, event):
         """显示订单右键菜单"""
         item = self.orders_tree.identify_row(event.y)
         if item:
-            self.orders_tree.selection_set(item)
+            if item not in self.orders_tree.selection():
+                self.orders_tree.selection_set(item)
             self.orders_menu.post(event.x_root, event.y_root)
 
     def add_category(self):
@@ -817,13 +5660,13 @@ class InventorySystem:
         name = simpledialog.askstring("添加分类", "请输入分类名称:")
         if name:
             try:
-                self.cursor.execute('INSERT INTO categories (name) VALUES (?)', (name,))
-                self.conn.commit()
+                result = self.services.inventory.add_category(name)
+                self.apply_changes(result.changes)
                 self.refresh_categories()
                 self.update_category_combos()
                 messagebox.showinfo('成功', '分类添加成功')
-            except sqlite3.IntegrityError:
-                messagebox.showerror('错误', '该分类名称已存在')
+            except ServiceError as e:
+                messagebox.showerror('错误', str(e))
             except sqlite3.Error as e:
                 messagebox.showerror('错误', f'添加分类失败: {e}')
 
@@ -836,21 +5679,19 @@ class InventorySystem:
             
         category_id = self.category_tree.item(selected)['values'][0]
         
-        # 检查是否有商品使用此分类
-        self.cursor.execute('SELECT COUNT(*) FROM inventory WHERE category_id = ?', (category_id,))
-        if self.cursor.fetchone()[0] > 0:
-            messagebox.showerror('错误', '该分类下有商品，无法删除')
-            return
-            
-        if messagebox.askyesno('确认', '确定要删除该分类吗？'):
-            try:
-                self.cursor.execute('DELETE FROM categories WHERE id = ?', (category_id,))
-                self.conn.commit()
+        try:
+            # 检查是否有商品使用此分类
+            self.services.inventory.ensure_can_delete_category(category_id)
+            if messagebox.askyesno('确认', '确定要删除该分类吗？'):
+                result = self.services.inventory.delete_category(category_id)
+                self.apply_changes(result.changes)
                 self.refresh_categories()
                 self.update_category_combos()
                 messagebox.showinfo('成功', '分类删除成功')
-            except sqlite3.Error as e:
-                messagebox.showerror('错误', f'删除分类失败: {e}')
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'删除分类失败: {e}')
 
     def refresh_categories(self):
         """刷新分类列表"""
@@ -870,41 +5711,22 @@ class InventorySystem:
 
     def refresh_inventory_by_category(self, category_id):
         """根据分类刷新商品列表"""
-        for item in self.inventory_tree.get_children():
-            self.inventory_tree.delete(item)
-            
-        self.cursor.execute('''
-            SELECT i.*, c.name as category_name, s.name as supplier_name
-            FROM inventory i
-            LEFT JOIN categories c ON i.category_id = c.id
-            LEFT JOIN suppliers s ON i.supplier_id = s.id
-            WHERE i.category_id = ?
-        ''', (category_id,))
-        
-        for row in self.cursor.fetchall():
-            self.inventory_tree.insert('', 'end', values=row)
+        self.inventory_loader.load(self.grid_pager('inventory', 'i.category_id = ?', (category_id,)))
 
 #商品库存模块开始=======================================================
 
     def refresh_inventory(self):
         """刷新库存列表"""
-        # 清空当前列表
-        for i in self.inventory_tree.get_children():
-            self.inventory_tree.delete(i)
-        
-        # 查询最新数据
-        self.cursor.execute('SELECT * FROM inventory')
-        rows = self.cursor.fetchall()
-        
-        # 插入新数据
-        for row in rows:
-            self.inventory_tree.insert("", "end", values=row)
-    
-    def update_product_combos(self):
-        """更新产品组合框"""
-        # 更新产品组合框的代码
-        pass
+        # 分页加载，滚动到底部时再读取下一页；排序和筛选由表头和筛选栏决定
+        self.inventory_loader.load(self.grid_pager('inventory', *self.search_filter('inventory', 'i')))
     
+    def format_inventory_row(self, row):
+        """分类和供应商列显示名称，名称取自主数据缓存"""
+        row = list(row)
+        row[2] = self.master_data.name('categories', row[2])
+        row[6] = self.master_data.name('suppliers', row[6])
+        return row
+
     def clear_inventory_inputs(self):
         """清空输入框"""
         self.name_var.set('')
@@ -919,40 +5741,26 @@ class InventorySystem:
         """添加库存商品"""
         try:
             # 获取输入值
-            name = self.name_var.get()
-            category = self.category_var.get().split(' - ')[0] if self.category_var.get() else None
-            supplier = self.supplier_var.get().split(' - ')[0] if self.supplier_var.get() else None
-            quantity = int(self.quantity_var.get() or 0)
-            purchase_price = float(self.purchase_price_var.get() or 0)
-            selling_price = float(self.selling_price_var.get() or 0)
-            warning_level = int(self.warning_level_var.get() or 0)
-            
-            # 验证必填项
-            if not name or not category:
-                messagebox.showerror('错误', '商品名称和分类为必填项')
-                return
-                
-            # 验证数值(验证添加商品时，数量、价格和预警值不能为负数，暂时注释掉)
-            #if quantity <= 0 or purchase_price <= 0 or selling_price <= 0 or warning_level <= 0:
-            #    messagebox.showerror('错误', '数量、价格和预警值不能为负数')
-            #    return
-                
-            # 插入数据
-            self.cursor.execute('''
-                INSERT INTO inventory (
-                    name, category_id, supplier_id, quantity,
-                    purchase_price, selling_price, warning_level
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (name, category, supplier, quantity, purchase_price, selling_price, warning_level))
+            product = ProductInput(
+                name=self.name_var.get(),
+                category_id=self.category_var.get().split(' - ')[0] if self.category_var.get() else None,
+                supplier_id=self.supplier_var.get().split(' - ')[0] if self.supplier_var.get() else None,
+                quantity=int(self.quantity_var.get() or 0),
+                purchase_price=to_fen(self.purchase_price_var.get() or 0),
+                selling_price=to_fen(self.selling_price_var.get() or 0),
+                warning_level=int(self.warning_level_var.get() or 0)
+            )
             
-            self.conn.commit()
-            self.refresh_inventory()
+            result = self.services.inventory.add_product(product)
+            self.apply_changes(result.changes)
             self.update_product_combos()
             self.clear_inventory_inputs()
             messagebox.showinfo('成功', '商品添加成功')
             
         except ValueError:
             messagebox.showerror('错误', '请输入有效的数字')
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
         except sqlite3.Error as e:
             messagebox.showerror('错误', f'添加商品失败: {e}')
 
@@ -965,19 +5773,13 @@ class InventorySystem:
             
         item_id = self.inventory_tree.item(selected)['values'][0]
         
-        # 获取商品信息
-        self.cursor.execute('''
-            SELECT i.*, c.name as category_name, s.name as supplier_name
-            FROM inventory i
-            LEFT JOIN categories c ON i.category_id = c.id
-            LEFT JOIN suppliers s ON i.supplier_id = s.id
-            WHERE i.id = ?
-        ''', (item_id,))
-        
-        item = self.cursor.fetchone()
+        # 获取商品信息：资料取自主数据缓存，库存数量随时变化，单独读取
+        item = self.master_data.get('inventory', item_id)
         if not item:
             messagebox.showerror('错误', '商品不存在')
             return
+        self.cursor.execute('SELECT quantity FROM inventory WHERE id = ?', (item_id,))
+        quantity = self.cursor.fetchone()[0]
             
         # 创建编辑窗口
         edit_window = tk.Toplevel(self.root)
@@ -990,186 +5792,389 @@ class InventorySystem:
         
         # 商品名称
         ttk.Label(input_frame, text="商品名称:").grid(row=0, column=0, padx=5, pady=5)
-        name_var = tk.StringVar(value=item[1])
+        name_var = tk.StringVar(value=item.name)
         ttk.Entry(input_frame, textvariable=name_var).grid(row=0, column=1, padx=5, pady=5)
         
         # 分类
         ttk.Label(input_frame, text="分类:").grid(row=1, column=0, padx=5, pady=5)
-        category_var = tk.StringVar(value=f"{item[2]} - {item[-2]}" if item[2] else "")
-        category_combo = ttk.Combobox(input_frame, textvariable=category_var, state='readonly')
-        category_combo['values'] = self.category_combo['values']
+        category_var = tk.StringVar(value=self.master_data.label('categories', item.category_id))
+        category_combo = self.autocomplete(input_frame, 'categories', category_var)
         category_combo.grid(row=1, column=1, padx=5, pady=5)
         
         # 供应商
         ttk.Label(input_frame, text="供应商:").grid(row=2, column=0, padx=5, pady=5)
-        supplier_var = tk.StringVar(value=f"{item[6]} - {item[-1]}" if item[6] else "")
-        supplier_combo = ttk.Combobox(input_frame, textvariable=supplier_var, state='readonly')
-        supplier_combo['values'] = self.supplier_combo['values']
+        supplier_var = tk.StringVar(value=self.master_data.label('suppliers', item.supplier_id))
+        supplier_combo = self.autocomplete(input_frame, 'suppliers', supplier_var)
         supplier_combo.grid(row=2, column=1, padx=5, pady=5)
         
         # 数量
         ttk.Label(input_frame, text="数量:").grid(row=3, column=0, padx=5, pady=5)
-        quantity_var = tk.StringVar(value=item[3])
+        quantity_var = tk.StringVar(value=quantity)
         ttk.Entry(input_frame, textvariable=quantity_var).grid(row=3, column=1, padx=5, pady=5)
         
         # 进货价
         ttk.Label(input_frame, text="进货价:").grid(row=4, column=0, padx=5, pady=5)
-        purchase_price_var = tk.StringVar(value=item[4])
+        purchase_price_var = tk.StringVar(value=format_money(item.purchase_price))
         ttk.Entry(input_frame, textvariable=purchase_price_var).grid(row=4, column=1, padx=5, pady=5)
         
         # 销售价
         ttk.Label(input_frame, text="销售价:").grid(row=5, column=0, padx=5, pady=5)
-        selling_price_var = tk.StringVar(value=item[5])
+        selling_price_var = tk.StringVar(value=format_money(item.selling_price))
         ttk.Entry(input_frame, textvariable=selling_price_var).grid(row=5, column=1, padx=5, pady=5)
         
         # 预警值
         ttk.Label(input_frame, text="预警值:").grid(row=6, column=0, padx=5, pady=5)
-        warning_level_var = tk.StringVar(value=item[7])
+        warning_level_var = tk.StringVar(value=item.warning_level)
         ttk.Entry(input_frame, textvariable=warning_level_var).grid(row=6, column=1, padx=5, pady=5)
         
         def save_changes():
             try:
                 # 获取输入值
-                name = name_var.get()
-                category = category_var.get().split(' - ')[0] if category_var.get() else None
-                supplier = supplier_var.get().split(' - ')[0] if supplier_var.get() else None
-                quantity = int(quantity_var.get())
-                purchase_price = float(purchase_price_var.get())
-                selling_price = float(selling_price_var.get())
-                warning_level = int(warning_level_var.get())
-                
-                # 验证必填项
-                if not name or not category:
-                    messagebox.showerror('错误', '商品名称和分类为必填项')
-                    return
-                    
-                # 验证数值
-                if quantity < 0 or purchase_price < 0 or selling_price < 0 or warning_level < 0:
-                    messagebox.showerror('错误', '数量、价格和预警值不能为负数')
-                    return
-                    
-                # 更新数据
-                self.cursor.execute('''
-                    UPDATE inventory SET
-                        name = ?, category_id = ?, supplier_id = ?,
-                        quantity = ?, purchase_price = ?, selling_price = ?,
-                        warning_level = ?
-                    WHERE id = ?
-                ''', (name, category, supplier, quantity, purchase_price,
-                      selling_price, warning_level, item_id))
+                product = ProductInput(
+                    name=name_var.get(),
+                    category_id=category_var.get().split(' - ')[0] if category_var.get() else None,
+                    supplier_id=supplier_var.get().split(' - ')[0] if supplier_var.get() else None,
+                    quantity=int(quantity_var.get()),
+                    purchase_price=to_fen(purchase_price_var.get()),
+                    selling_price=to_fen(selling_price_var.get()),
+                    warning_level=int(warning_level_var.get())
+                )
                 
-                self.conn.commit()
-                self.refresh_inventory()
+                result = self.services.inventory.update_product(item_id, product)
+                self.apply_changes(result.changes)
                 self.update_product_combos()
                 edit_window.destroy()
                 messagebox.showinfo('成功', '商品信息更新成功')
                 
             except ValueError:
                 messagebox.showerror('错误', '请输入有效的数字')
+            except ServiceError as e:
+                messagebox.showerror('错误', str(e))
             except sqlite3.Error as e:
                 messagebox.showerror('错误', f'更新商品失败: {e}')
         
         # 保存按钮
         ttk.Button(input_frame, text="保存", command=save_changes).grid(row=7, column=0, columnspan=2, pady=20)
 
+    def bulk_delete(self, ids, label, delete_many, reason='', on_done=None):
+        """删除选中的多行：一次关联检查、一条删除语句，列表按行修补；
+        delete_many(services, ids) 在后台线程中执行"""
+        if not messagebox.askyesno('确认', f'确定要删除选中的 {len(ids)} {label}吗？'):
+            return
+
+        def done(result):
+            self.apply_changes(result.changes)
+            if on_done:
+                on_done()
+            message = f'已删除 {len(ids) - len(result.skipped)} {label}'
+            if result.skipped:
+                message += f'，{len(result.skipped)} {label}{reason}，已跳过'
+            messagebox.showinfo('完成', message)
+
+        def failed(error):
+            if isinstance(error, ServiceError):
+                messagebox.showerror('错误', str(error))
+            else:
+                messagebox.showerror('错误', f'批量删除失败: {error}')
+
+        self.db_executor.submit(lambda conn: delete_many(ErpServices(conn), ids), done, failed)
+
+    def selected_products(self):
+        """库存列表中选中的商品ID"""
+        selected = self.inventory_tree.selection()
+        if not selected:
+            messagebox.showwarning('警告', '请选择商品')
+        return [int(iid) for iid in selected]
+
+    def bulk_update_products(self, window, update):
+        """在后台线程中执行批量修改商品的操作 update(services)，成功后关闭窗口"""
+
+        def done(result):
+            self.apply_changes(result.changes)
+            self.update_product_combos()
+            window.destroy()
+            messagebox.showinfo('成功', f'已修改 {len(result.changes.tables["inventory"]["updated"])} 个商品')
+
+        def failed(error):
+            if isinstance(error, ValueError):
+                messagebox.showerror('错误', '请输入有效的数字')
+            elif isinstance(error, ServiceError):
+                messagebox.showerror('错误', str(error))
+            else:
+                messagebox.showerror('错误', f'批量修改失败: {error}')
+
+        self.db_executor.submit(lambda conn: update(ErpServices(conn)), done, failed)
+
+    def bulk_set_category(self):
+        """批量修改选中商品的分类"""
+        ids = self.selected_products()
+        if not ids:
+            return
+        window = tk.Toplevel(self.root)
+        window.title(f'修改分类（{len(ids)} 个商品）')
+        frame = ttk.Frame(window)
+        frame.pack(padx=10, pady=10)
+        ttk.Label(frame, text='分类:').grid(row=0, column=0, padx=5, pady=5)
+        category_var = tk.StringVar()
+        self.autocomplete(frame, 'categories', category_var).grid(row=0, column=1, padx=5, pady=5)
+
+        def save():
+            # 界面变量只在界面线程中读取
+            category_id = category_var.get().split(' - ')[0]
+            self.bulk_update_products(window, lambda services: services.inventory.set_category(ids, category_id))
+
+        ttk.Button(frame, text='保存', command=save).grid(row=1, column=0, columnspan=2, pady=10)
+
+    def bulk_set_supplier(self):
+        """批量设置选中商品的供应商，留空则清除"""
+        ids = self.selected_products()
+        if not ids:
+            return
+        window = tk.Toplevel(self.root)
+        window.title(f'设置供应商（{len(ids)} 个商品）')
+        frame = ttk.Frame(window)
+        frame.pack(padx=10, pady=10)
+        ttk.Label(frame, text='供应商:').grid(row=0, column=0, padx=5, pady=5)
+        supplier_var = tk.StringVar()
+        self.autocomplete(frame, 'suppliers', supplier_var).grid(row=0, column=1, padx=5, pady=5)
+
+        def save():
+            supplier_id = supplier_var.get().split(' - ')[0]
+            self.bulk_update_products(window, lambda services: services.inventory.set_supplier(ids, supplier_id))
+
+        ttk.Button(frame, text='保存', command=save).grid(row=1, column=0, columnspan=2, pady=10)
+
+    def bulk_adjust_prices(self):
+        """按百分比批量调整选中商品的进货价和销售价"""
+        ids = self.selected_products()
+        if not ids:
+            return
+        window = tk.Toplevel(self.root)
+        window.title(f'调整价格（{len(ids)} 个商品）')
+        frame = ttk.Frame(window)
+        frame.pack(padx=10, pady=10)
+        ttk.Label(frame, text='进货价调整(%):').grid(row=0, column=0, padx=5, pady=5)
+        purchase_var = tk.StringVar(value='0')
+        ttk.Entry(frame, textvariable=purchase_var).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Label(frame, text='销售价调整(%):').grid(row=1, column=0, padx=5, pady=5)
+        selling_var = tk.StringVar(value='0')
+        ttk.Entry(frame, textvariable=selling_var).grid(row=1, column=1, padx=5, pady=5)
+
+        def save():
+            try:
+                purchase, selling = float(purchase_var.get() or 0), float(selling_var.get() or 0)
+            except ValueError:
+                messagebox.showerror('错误', '请输入有效的数字')
+                return
+            self.bulk_update_products(
+                window, lambda services: services.inventory.adjust_prices(ids, purchase, selling)
+            )
+
+        ttk.Button(frame, text='保存', command=save).grid(row=2, column=0, columnspan=2, pady=10)
+
+    def show_stock_movements(self):
+        """查看商品的库存流水和历史库存"""
+        selected = self.inventory_tree.selection()
+        if not selected:
+            messagebox.showwarning('警告', '请选择要查看的商品')
+            return
+            
+        item_id = self.inventory_tree.item(selected)['values'][0]
+        
+        # 创建流水窗口
+        window = tk.Toplevel(self.root)
+        window.title("库存流水")
+        window.geometry("700x500")
+        
+        tree = ttk.Treeview(
+            window,
+            columns=('ID', '日期', '变动', '结存', '来源', '单据ID'),
+            show='headings',
+            height=15
+        )
+        for col in tree['columns']:
+            tree.heading(col, text=col)
+            tree.column(col, width=100)
+        tree.column('日期', width=150)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        loader = VirtualTreeLoader(tree, self.db_executor)
+        tree.bind('<Destroy>', lambda event: loader.detach())
+        loader.load(KeysetPager(
+            'm.id, m.date, m.change, m.balance, m.ref_type, m.ref_id',
+            'stock_movements m',
+            [('m.date', 'DESC'), ('m.id', 'DESC')],
+            'm.product_id = ?',
+            (item_id,)
+        ))
+        
+        # 历史库存查询
+        query_frame = ttk.Frame(window)
+        query_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(query_frame, text='截至日期:').pack(side=tk.LEFT, padx=5)
+        date_var = tk.StringVar(value=datetime.now().strftime('%Y-%m-%d'))
+        ttk.Entry(query_frame, textvariable=date_var).pack(side=tk.LEFT, padx=5)
+        
+        result_var = tk.StringVar()
+        
+        def query():
+            result_var.set(f'结存: {stock_as_of(self.conn, item_id, date_var.get())}')
+        
+        ttk.Button(query_frame, text='查询', command=query).pack(side=tk.LEFT, padx=5)
+        ttk.Label(query_frame, textvariable=result_var).pack(side=tk.LEFT, padx=5)
+
     def delete_inventory(self):
         """删除库存商品"""
         selected = self.inventory_tree.selection()
         if not selected:
             messagebox.showwarning('警告', '请选择要删除的商品')
             return
+        if len(selected) > 1:
+            self.bulk_delete(
+                [int(iid) for iid in selected], '个商品',
+                lambda services, ids: services.inventory.delete_products(ids),
+                '已被订单使用', self.update_product_combos
+            )
+            return
             
         item_id = self.inventory_tree.item(selected)['values'][0]
         
-        # 检查是否有订单使用此商品
-        self.cursor.execute('SELECT COUNT(*) FROM order_items WHERE product_id = ?', (item_id,))
-        if self.cursor.fetchone()[0] > 0:
-            messagebox.showerror('错误', '该商品已被订单使用，无法删除')
-            return
-            
-        if messagebox.askyesno('确认', '确定要删除该商品吗？'):
-            try:
-                self.cursor.execute('DELETE FROM inventory WHERE id = ?', (item_id,))
-                self.conn.commit()
-                self.refresh_inventory()
+        try:
+            # 检查是否有订单使用此商品
+            self.services.inventory.ensure_can_delete_product(item_id)
+            if messagebox.askyesno('确认', '确定要删除该商品吗？'):
+                result = self.services.inventory.delete_product(item_id)
+                self.apply_changes(result.changes)
                 self.update_product_combos()
                 messagebox.showinfo('成功', '商品删除成功')
-            except sqlite3.Error as e:
-                messagebox.showerror('错误', f'删除商品失败: {e}')
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'删除商品失败: {e}')
 
     def add_transaction(self):
         """添加交易记录"""
         try:
             # 获取输入值
-            trans_type = self.trans_type_var.get()
-            business_type = self.business_type_var.get()
-            amount = float(self.amount_var.get())
-            description = self.description_var.get()
-            customer = self.trans_customer_var.get().split(' - ')[0] if self.trans_customer_var.get() else None
-            supplier = self.trans_supplier_var.get().split(' - ')[0] if self.trans_supplier_var.get() else None
-            order = self.trans_order_var.get().split(' - ')[0] if self.trans_order_var.get() else None
-            date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            transaction = TransactionInput(
+                type=self.trans_type_var.get(),
+                business_type=self.business_type_var.get(),
+                amount=to_fen(self.amount_var.get()),
+                description=self.description_var.get(),
+                customer_id=self.trans_customer_var.get().split(' - ')[0] if self.trans_customer_var.get() else None,
+                supplier_id=self.trans_supplier_var.get().split(' - ')[0] if self.trans_supplier_var.get() else None,
+                order_id=self.trans_order_var.get().split(' - ')[0] if self.trans_order_var.get() else None
+            )
             
-            # 验证必填项
-            if not trans_type or not business_type or amount <= 0:
-                messagebox.showerror('错误', '交易类型、业务类型和金额为必填项，且金额必须大于0')
-                return
+            result = self.services.ledger.add_transaction(transaction)
+            self.apply_changes(result.changes)
+            self.clear_transaction_inputs()
+            messagebox.showinfo('成功', '交易记录添加成功')
+            
+        except ValueError:
+            messagebox.showerror('错误', '请输入有效的金额')
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'添加交易记录失败: {e}')
+
+    def edit_transaction(self):
+        """编辑交易记录"""
+        selected = self.transactions_tree.selection()
+        if not selected:
+            messagebox.showwarning('警告', '请选择要编辑的交易记录')
+            return
+            
+        trans_id = self.transactions_tree.item(selected)['values'][0]
+        
+        # 获取交易记录
+        trans = self.services.repo.get('transactions', trans_id)
+        if not trans:
+            messagebox.showerror('错误', '交易记录不存在')
+            return
+            
+        # 创建编辑窗口
+        edit_window = tk.Toplevel(self.root)
+        edit_window.title("编辑交易记录")
+        edit_window.geometry("500x400")
+        
+        # 创建输入框架
+        input_frame = ttk.LabelFrame(edit_window, text="交易信息")
+        input_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        
+        # 交易类型
+        ttk.Label(input_frame, text="交易类型:").grid(row=0, column=0, padx=5, pady=5)
+        type_var = tk.StringVar(value=trans[2])
+        ttk.Combobox(
+            input_frame,
+            textvariable=type_var,
+            values=['收入', '支出'],
+            state='readonly'
+        ).grid(row=0, column=1, padx=5, pady=5)
+        
+        # 业务类型
+        ttk.Label(input_frame, text="业务类型:").grid(row=1, column=0, padx=5, pady=5)
+        business_type_var = tk.StringVar(value=trans[3])
+        ttk.Combobox(
+            input_frame,
+            textvariable=business_type_var,
+            values=['对公', '对私'],
+            state='readonly'
+        ).grid(row=1, column=1, padx=5, pady=5)
+        
+        # 金额
+        ttk.Label(input_frame, text="金额:").grid(row=2, column=0, padx=5, pady=5)
+        amount_var = tk.StringVar(value=format_money(trans[4]))
+        ttk.Entry(input_frame, textvariable=amount_var).grid(row=2, column=1, padx=5, pady=5)
+        
+        # 描述
+        ttk.Label(input_frame, text="描述:").grid(row=3, column=0, padx=5, pady=5)
+        description_var = tk.StringVar(value=trans[5] or '')
+        ttk.Entry(input_frame, textvariable=description_var).grid(row=3, column=1, padx=5, pady=5)
+        
+        # 关联客户
+        ttk.Label(input_frame, text="关联客户:").grid(row=4, column=0, padx=5, pady=5)
+        customer_var = tk.StringVar(value=self.master_data.label('customers', trans[6]))
+        self.autocomplete(input_frame, 'customers', customer_var).grid(row=4, column=1, padx=5, pady=5)
+        
+        # 关联供应商
+        ttk.Label(input_frame, text="关联供应商:").grid(row=5, column=0, padx=5, pady=5)
+        supplier_var = tk.StringVar(value=self.master_data.label('suppliers', trans[7]))
+        self.autocomplete(input_frame, 'suppliers', supplier_var).grid(row=5, column=1, padx=5, pady=5)
+        
+        # 关联订单
+        ttk.Label(input_frame, text="关联订单:").grid(row=6, column=0, padx=5, pady=5)
+        order_var = tk.StringVar(value=completion_label(self.conn, 'orders', trans[8]))
+        self.autocomplete(input_frame, 'orders', order_var).grid(row=6, column=1, padx=5, pady=5)
+        
+        def save_changes():
+            try:
+                # 获取输入值
+                transaction = TransactionInput(
+                    type=type_var.get(),
+                    business_type=business_type_var.get(),
+                    amount=to_fen(amount_var.get()),
+                    description=description_var.get(),
+                    customer_id=customer_var.get().split(' - ')[0] if customer_var.get() else None,
+                    supplier_id=supplier_var.get().split(' - ')[0] if supplier_var.get() else None,
+                    order_id=order_var.get().split(' - ')[0] if order_var.get() else None
+                )
                 
-            # 插入数据
-            self.cursor.execute('''
-                INSERT INTO transactions (
-                    date, type, business_type, amount, description,
-                    customer_id, supplier_id, order_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (date, trans_type, business_type, amount, description,
-                  customer, supplier, order))
-            
-            self.conn.commit()
-            self.refresh_transactions()
-            self.clear_transaction_inputs()
-            messagebox.showinfo('成功', '交易记录添加成功')
-            
-        except ValueError:
-            messagebox.showerror('错误', '请输入有效的金额')
-        except sqlite3.Error as e:
-            messagebox.showerror('错误', f'添加交易记录失败: {e}')
-
-    def edit_transaction(self):
-    #"""编辑交易记录"""
-        try:
-            # 获取输入值
-            trans_type = type_var.get()
-            business_type = business_type_var.get()
-            amount = float(amount_var.get())
-            description = description_var.get()
-            customer = customer_var.get().split(' - ')[0] if customer_var.get() else None
-            supplier = supplier_var.get().split(' - ')[0] if supplier_var.get() else None
-            order = order_var.get().split(' - ')[0] if order_var.get() else None
-            
-            # 验证必填项
-            if not trans_type or not business_type or amount <= 0:
-                messagebox.showerror('错误', '交易类型、业务类型和金额为必填项，且金额必须大于0')
-                return
+                result = self.services.ledger.update_transaction(trans_id, transaction)
+                self.apply_changes(result.changes)
+                edit_window.destroy()
+                messagebox.showinfo('成功', '交易记录更新成功')
                 
-            # 更新数据
-            self.cursor.execute('''
-                UPDATE transactions SET
-                    type = ?, business_type = ?, amount = ?,
-                    description = ?, customer_id = ?, supplier_id = ?,
-                    order_id = ?
-                WHERE id = ?
-            ''', (trans_type, business_type, amount, description,
-                customer, supplier, order, trans_id))
-            
-            self.conn.commit()
-            self.refresh_transactions()
-            edit_window.destroy()
-            messagebox.showinfo('成功', '交易记录更新成功')
-            
-        except ValueError:
-            messagebox.showerror('错误', '请输入有效的金额')
-        except sqlite3.Error as e:
-            messagebox.showerror('错误', f'更新交易记录失败: {e}')
+            except ValueError:
+                messagebox.showerror('错误', '请输入有效的金额')
+            except ServiceError as e:
+                messagebox.showerror('错误', str(e))
+            except sqlite3.Error as e:
+                messagebox.showerror('错误', f'更新交易记录失败: {e}')
+        
+        # 保存按钮
+        ttk.Button(input_frame, text="保存", command=save_changes).grid(row=7, column=0, columnspan=2, pady=20)
 
     def delete_transaction(self):
         """删除交易记录"""
@@ -1177,33 +6182,26 @@ class InventorySystem:
         if not selected:
             messagebox.showwarning('警告', '请选择要删除的交易记录')
             return
+        if len(selected) > 1:
+            self.bulk_delete(
+                [int(iid) for iid in selected], '条交易记录',
+                lambda services, ids: services.ledger.delete_transactions(ids)
+            )
+            return
             
         trans_id = self.transactions_tree.item(selected)['values'][0]
         
         if messagebox.askyesno('确认', '确定要删除该交易记录吗？'):
             try:
-                self.cursor.execute('DELETE FROM transactions WHERE id = ?', (trans_id,))
-                self.conn.commit()
-                self.refresh_transactions()
+                result = self.services.ledger.delete_transaction(trans_id)
+                self.apply_changes(result.changes)
                 messagebox.showinfo('成功', '交易记录删除成功')
             except sqlite3.Error as e:
                 messagebox.showerror('错误', f'删除交易记录失败: {e}')
 
     def refresh_transactions(self):
         """刷新交易记录列表"""
-        for item in self.transactions_tree.get_children():
-            self.transactions_tree.delete(item)
-            
-        self.cursor.execute('''
-            SELECT t.*, c.name as customer_name, s.name as supplier_name
-            FROM transactions t
-            LEFT JOIN customers c ON t.customer_id = c.id
-            LEFT JOIN suppliers s ON t.supplier_id = s.id
-            ORDER BY t.date DESC
-        ''')
-        
-        for row in self.cursor.fetchall():
-            self.transactions_tree.insert('', 'end', values=row)
+        self.transactions_loader.load(self.grid_pager('transactions'))
 
     def clear_transaction_inputs(self):
         """清空交易记录输入框"""
@@ -1219,29 +6217,22 @@ class InventorySystem:
         """添加客户"""
         try:
             # 获取输入值
-            name = self.customer_name_var.get()
-            contact = self.contact_var.get()
-            customer_type = self.customer_type_var.get()
-            address = self.address_var.get()
-            notes = self.notes_var.get()
-            
-            # 验证必填项
-            if not name or not customer_type:
-                messagebox.showerror('错误', '客户名称和类型为必填项')
-                return
-                
-            # 插入数据
-            self.cursor.execute('''
-                INSERT INTO customers (name, contact, type, address, notes)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (name, contact, customer_type, address, notes))
+            party = PartyInput(
+                name=self.customer_name_var.get(),
+                type=self.customer_type_var.get(),
+                contact=self.contact_var.get(),
+                address=self.address_var.get(),
+                notes=self.notes_var.get()
+            )
             
-            self.conn.commit()
-            self.refresh_customers()
+            result = self.services.customers.add(party)
+            self.apply_changes(result.changes)
             self.update_customer_combos()
             self.clear_customer_inputs()
             messagebox.showinfo('成功', '客户添加成功')
             
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
         except sqlite3.Error as e:
             messagebox.showerror('错误', f'添加客户失败: {e}')
 
@@ -1255,8 +6246,7 @@ class InventorySystem:
         customer_id = self.customers_tree.item(selected)['values'][0]
         
         # 获取客户信息
-        self.cursor.execute('SELECT * FROM customers WHERE id = ?', (customer_id,))
-        customer = self.cursor.fetchone()
+        customer = self.master_data.get('customers', customer_id)
         if not customer:
             messagebox.showerror('错误', '客户不存在')
             return
@@ -1272,17 +6262,17 @@ class InventorySystem:
         
         # 客户名称
         ttk.Label(input_frame, text="客户名称:").grid(row=0, column=0, padx=5, pady=5)
-        name_var = tk.StringVar(value=customer[1])
+        name_var = tk.StringVar(value=customer.name)
         ttk.Entry(input_frame, textvariable=name_var).grid(row=0, column=1, padx=5, pady=5)
         
         # 联系方式
         ttk.Label(input_frame, text="联系方式:").grid(row=1, column=0, padx=5, pady=5)
-        contact_var = tk.StringVar(value=customer[2])
+        contact_var = tk.StringVar(value=customer.contact)
         ttk.Entry(input_frame, textvariable=contact_var).grid(row=1, column=1, padx=5, pady=5)
         
         # 客户类型
         ttk.Label(input_frame, text="客户类型:").grid(row=2, column=0, padx=5, pady=5)
-        type_var = tk.StringVar(value=customer[5])
+        type_var = tk.StringVar(value=customer.type)
         ttk.Combobox(
             input_frame,
             textvariable=type_var,
@@ -1292,42 +6282,33 @@ class InventorySystem:
         
         # 地址
         ttk.Label(input_frame, text="地址:").grid(row=3, column=0, padx=5, pady=5)
-        address_var = tk.StringVar(value=customer[3])
+        address_var = tk.StringVar(value=customer.address)
         ttk.Entry(input_frame, textvariable=address_var).grid(row=3, column=1, padx=5, pady=5)
         
         # 备注
         ttk.Label(input_frame, text="备注:").grid(row=4, column=0, padx=5, pady=5)
-        notes_var = tk.StringVar(value=customer[4])
+        notes_var = tk.StringVar(value=customer.notes)
         ttk.Entry(input_frame, textvariable=notes_var).grid(row=4, column=1, padx=5, pady=5)
         
         def save_changes():
             try:
                 # 获取输入值
-                name = name_var.get()
-                contact = contact_var.get()
-                customer_type = type_var.get()
-                address = address_var.get()
-                notes = notes_var.get()
-                
-                # 验证必填项
-                if not name or not customer_type:
-                    messagebox.showerror('错误', '客户名称和类型为必填项')
-                    return
-                    
-                # 更新数据
-                self.cursor.execute('''
-                    UPDATE customers SET
-                        name = ?, contact = ?, type = ?,
-                        address = ?, notes = ?
-                    WHERE id = ?
-                ''', (name, contact, customer_type, address, notes, customer_id))
+                party = PartyInput(
+                    name=name_var.get(),
+                    type=type_var.get(),
+                    contact=contact_var.get(),
+                    address=address_var.get(),
+                    notes=notes_var.get()
+                )
                 
-                self.conn.commit()
-                self.refresh_customers()
+                result = self.services.customers.update(customer_id, party)
+                self.apply_changes(result.changes)
                 self.update_customer_combos()
                 edit_window.destroy()
                 messagebox.showinfo('成功', '客户信息更新成功')
                 
+            except ServiceError as e:
+                messagebox.showerror('错误', str(e))
             except sqlite3.Error as e:
                 messagebox.showerror('错误', f'更新客户信息失败: {e}')
         
@@ -1340,39 +6321,32 @@ class InventorySystem:
         if not selected:
             messagebox.showwarning('警告', '请选择要删除的客户')
             return
+        if len(selected) > 1:
+            self.bulk_delete(
+                [int(iid) for iid in selected], '个客户',
+                lambda services, ids: services.customers.delete_many(ids),
+                '有关联订单或交易记录', self.update_customer_combos
+            )
+            return
             
         customer_id = self.customers_tree.item(selected)['values'][0]
         
-        # 检查是否有订单使用此客户
-        self.cursor.execute('SELECT COUNT(*) FROM orders WHERE customer_id = ?', (customer_id,))
-        if self.cursor.fetchone()[0] > 0:
-            messagebox.showerror('错误', '该客户有关联订单，无法删除')
-            return
-            
-        # 检查是否有交易记录使用此客户
-        self.cursor.execute('SELECT COUNT(*) FROM transactions WHERE customer_id = ?', (customer_id,))
-        if self.cursor.fetchone()[0] > 0:
-            messagebox.showerror('错误', '该客户有关联交易记录，无法删除')
-            return
-            
-        if messagebox.askyesno('确认', '确定要删除该客户吗？'):
-            try:
-                self.cursor.execute('DELETE FROM customers WHERE id = ?', (customer_id,))
-                self.conn.commit()
-                self.refresh_customers()
+        try:
+            # 检查是否有订单、商品或交易记录关联此客户
+            self.services.customers.ensure_can_delete(customer_id)
+            if messagebox.askyesno('确认', '确定要删除该客户吗？'):
+                result = self.services.customers.delete(customer_id)
+                self.apply_changes(result.changes)
                 self.update_customer_combos()
                 messagebox.showinfo('成功', '客户删除成功')
-            except sqlite3.Error as e:
-                messagebox.showerror('错误', f'删除客户失败: {e}')
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'删除客户失败: {e}')
 
     def refresh_customers(self):
         """刷新客户列表"""
-        for item in self.customers_tree.get_children():
-            self.customers_tree.delete(item)
-            
-        self.cursor.execute('SELECT * FROM customers')
-        for row in self.cursor.fetchall():
-            self.customers_tree.insert('', 'end', values=row)
+        self.customers_loader.load(self.grid_pager('customers', *self.search_filter('customers', 'c')))
 
     def clear_customer_inputs(self):
         """清空客户输入框"""
@@ -1386,29 +6360,22 @@ class InventorySystem:
         """添加供应商"""
         try:
             # 获取输入值
-            name = self.supplier_name_var.get()
-            contact = self.supplier_contact_var.get()
-            supplier_type = self.supplier_type_var.get()
-            address = self.supplier_address_var.get()
-            notes = self.supplier_notes_var.get()
-            
-            # 验证必填项
-            if not name or not supplier_type:
-                messagebox.showerror('错误', '供应商名称和类型为必填项')
-                return
-                
-            # 插入数据
-            self.cursor.execute('''
-                INSERT INTO suppliers (name, contact, type, address, notes)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (name, contact, supplier_type, address, notes))
+            party = PartyInput(
+                name=self.supplier_name_var.get(),
+                type=self.supplier_type_var.get(),
+                contact=self.supplier_contact_var.get(),
+                address=self.supplier_address_var.get(),
+                notes=self.supplier_notes_var.get()
+            )
             
-            self.conn.commit()
-            self.refresh_suppliers()
+            result = self.services.suppliers.add(party)
+            self.apply_changes(result.changes)
             self.update_supplier_combos()
             self.clear_supplier_inputs()
             messagebox.showinfo('成功', '供应商添加成功')
             
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
         except sqlite3.Error as e:
             messagebox.showerror('错误', f'添加供应商失败: {e}')
 
@@ -1422,8 +6389,7 @@ class InventorySystem:
         supplier_id = self.suppliers_tree.item(selected)['values'][0]
         
         # 获取供应商信息
-        self.cursor.execute('SELECT * FROM suppliers WHERE id = ?', (supplier_id,))
-        supplier = self.cursor.fetchone()
+        supplier = self.master_data.get('suppliers', supplier_id)
         if not supplier:
             messagebox.showerror('错误', '供应商不存在')
             return
@@ -1439,17 +6405,17 @@ class InventorySystem:
         
         # 供应商名称
         ttk.Label(input_frame, text="供应商名称:").grid(row=0, column=0, padx=5, pady=5)
-        name_var = tk.StringVar(value=supplier[1])
+        name_var = tk.StringVar(value=supplier.name)
         ttk.Entry(input_frame, textvariable=name_var).grid(row=0, column=1, padx=5, pady=5)
         
         # 联系方式
         ttk.Label(input_frame, text="联系方式:").grid(row=1, column=0, padx=5, pady=5)
-        contact_var = tk.StringVar(value=supplier[2])
+        contact_var = tk.StringVar(value=supplier.contact)
         ttk.Entry(input_frame, textvariable=contact_var).grid(row=1, column=1, padx=5, pady=5)
         
         # 供应商类型
         ttk.Label(input_frame, text="供应商类型:").grid(row=2, column=0, padx=5, pady=5)
-        type_var = tk.StringVar(value=supplier[5])
+        type_var = tk.StringVar(value=supplier.type)
         ttk.Combobox(
             input_frame,
             textvariable=type_var,
@@ -1459,42 +6425,33 @@ class InventorySystem:
         
         # 地址
         ttk.Label(input_frame, text="地址:").grid(row=3, column=0, padx=5, pady=5)
-        address_var = tk.StringVar(value=supplier[3])
+        address_var = tk.StringVar(value=supplier.address)
         ttk.Entry(input_frame, textvariable=address_var).grid(row=3, column=1, padx=5, pady=5)
         
         # 备注
         ttk.Label(input_frame, text="备注:").grid(row=4, column=0, padx=5, pady=5)
-        notes_var = tk.StringVar(value=supplier[4])
+        notes_var = tk.StringVar(value=supplier.notes)
         ttk.Entry(input_frame, textvariable=notes_var).grid(row=4, column=1, padx=5, pady=5)
         
         def save_changes():
             try:
                 # 获取输入值
-                name = name_var.get()
-                contact = contact_var.get()
-                supplier_type = type_var.get()
-                address = address_var.get()
-                notes = notes_var.get()
-                
-                # 验证必填项
-                if not name or not supplier_type:
-                    messagebox.showerror('错误', '供应商名称和类型为必填项')
-                    return
-                    
-                # 更新数据
-                self.cursor.execute('''
-                    UPDATE suppliers SET
-                        name = ?, contact = ?, type = ?,
-                        address = ?, notes = ?
-                    WHERE id = ?
-                ''', (name, contact, supplier_type, address, notes, supplier_id))
+                party = PartyInput(
+                    name=name_var.get(),
+                    type=type_var.get(),
+                    contact=contact_var.get(),
+                    address=address_var.get(),
+                    notes=notes_var.get()
+                )
                 
-                self.conn.commit()
-                self.refresh_suppliers()
+                result = self.services.suppliers.update(supplier_id, party)
+                self.apply_changes(result.changes)
                 self.update_supplier_combos()
                 edit_window.destroy()
                 messagebox.showinfo('成功', '供应商信息更新成功')
                 
+            except ServiceError as e:
+                messagebox.showerror('错误', str(e))
             except sqlite3.Error as e:
                 messagebox.showerror('错误', f'更新供应商信息失败: {e}')
         
@@ -1507,39 +6464,32 @@ class InventorySystem:
         if not selected:
             messagebox.showwarning('警告', '请选择要删除的供应商')
             return
+        if len(selected) > 1:
+            self.bulk_delete(
+                [int(iid) for iid in selected], '个供应商',
+                lambda services, ids: services.suppliers.delete_many(ids),
+                '有关联商品或交易记录', self.update_supplier_combos
+            )
+            return
             
         supplier_id = self.suppliers_tree.item(selected)['values'][0]
         
-        # 检查是否有商品使用此供应商
-        self.cursor.execute('SELECT COUNT(*) FROM inventory WHERE supplier_id = ?', (supplier_id,))
-        if self.cursor.fetchone()[0] > 0:
-            messagebox.showerror('错误', '该供应商有关联商品，无法删除')
-            return
-            
-        # 检查是否有交易记录使用此供应商
-        self.cursor.execute('SELECT COUNT(*) FROM transactions WHERE supplier_id = ?', (supplier_id,))
-        if self.cursor.fetchone()[0] > 0:
-            messagebox.showerror('错误', '该供应商有关联交易记录，无法删除')
-            return
-            
-        if messagebox.askyesno('确认', '确定要删除该供应商吗？'):
-            try:
-                self.cursor.execute('DELETE FROM suppliers WHERE id = ?', (supplier_id,))
-                self.conn.commit()
-                self.refresh_suppliers()
+        try:
+            # 检查是否有订单、商品或交易记录关联此供应商
+            self.services.suppliers.ensure_can_delete(supplier_id)
+            if messagebox.askyesno('确认', '确定要删除该供应商吗？'):
+                result = self.services.suppliers.delete(supplier_id)
+                self.apply_changes(result.changes)
                 self.update_supplier_combos()
                 messagebox.showinfo('成功', '供应商删除成功')
-            except sqlite3.Error as e:
-                messagebox.showerror('错误', f'删除供应商失败: {e}')
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'删除供应商失败: {e}')
 
     def refresh_suppliers(self):
         """刷新供应商列表"""
-        for item in self.suppliers_tree.get_children():
-            self.suppliers_tree.delete(item)
-            
-        self.cursor.execute('SELECT * FROM suppliers')
-        for row in self.cursor.fetchall():
-            self.suppliers_tree.insert('', 'end', values=row)
+        self.suppliers_loader.load(self.grid_pager('suppliers', *self.search_filter('suppliers', 's')))
 
     def clear_supplier_inputs(self):
         """清空供应商输入框"""
@@ -1549,6 +6499,43 @@ class InventorySystem:
         self.supplier_address_var.set('')
         self.supplier_notes_var.set('')
 
+    def selected_id(self, text):
+        """从下拉框的 “ID - 名称” 中取出ID，尚未选定时返回 None"""
+        row_id = text.split(' - ')[0].strip()
+        return int(row_id) if row_id.isdigit() else None
+
+    def order_line_values(self, line):
+        """订单明细行在表格中的显示值"""
+        return (
+            line.product_id,
+            self.master_data.name('inventory', line.product_id),
+            line.quantity,
+            format_money(line.price),
+            format_money(line.subtotal)
+        )
+
+    def add_order_line(self, tree, lines, customer_id, product_id, quantity):
+        """向订单明细添加商品：同一商品合并为一行，按合并后的数量定价"""
+        for iid, line in lines.items():
+            if line.product_id == product_id:
+                line.quantity += quantity
+                break
+        else:
+            line = OrderLine(product_id, quantity, 0)
+            iid = tree.insert('', 'end')
+            lines[iid] = line
+        line.price = self.pricing.price(customer_id, product_id, line.quantity)
+        tree.item(iid, values=self.order_line_values(line))
+
+    def order_lines_total(self, lines, freight_cost, commission):
+        """明细小计 + 运费 - 回扣（整数分），只读内存中的明细"""
+        total = sum(line.subtotal for line in lines.values())
+        try:
+            total += to_fen(freight_cost) - to_fen(commission)
+        except ValueError:
+            pass
+        return total
+
     def add_order_item(self):
         """添加订单商品"""
         if not self.order_product_var.get():
@@ -1556,27 +6543,21 @@ class InventorySystem:
             return
             
         try:
-            product_id = self.order_product_var.get().split(' - ')[0]
+            product_id = int(self.order_product_var.get().split(' - ')[0])
             quantity = int(self.order_quantity_var.get())
+            if quantity <= 0:
+                raise ValueError('数量必须大于0')
             
-            # 获取商品信息
-            self.cursor.execute('SELECT name, selling_price FROM inventory WHERE id = ?', (product_id,))
-            product = self.cursor.fetchone()
-            if not product:
+            # 商品信息取自主数据缓存
+            if not self.master_data.get('inventory', product_id):
                 messagebox.showerror('错误', '商品不存在')
                 return
-                
-            # 计算小计
-            subtotal = quantity * product[1]
             
-            # 添加到订单明细列表
-            self.order_items_tree.insert('', 'end', values=(
-                product_id,
-                product[0],
-                quantity,
-                product[1],
-                subtotal
-            ))
+            # 按客户的价格表和数量阶梯定价
+            self.add_order_line(
+                self.order_items_tree, self.order_lines,
+                self.selected_id(self.order_customer_var.get()), product_id, quantity
+            )
             
             # 更新总金额
             self.update_order_total()
@@ -1591,100 +6572,61 @@ class InventorySystem:
             messagebox.showwarning('警告', '请选择要删除的商品')
             return
             
-        self.order_items_tree.delete(selected)
+        self.order_items_tree.delete(*selected)
+        for iid in selected:
+            del self.order_lines[iid]
+        self.update_order_total()
+
+    def reprice_order(self):
+        """按当前客户为全部明细一次重新定价"""
+        if not self.order_lines:
+            return
+        lines = self.order_lines
+        prices = self.pricing.price_lines(
+            self.selected_id(self.order_customer_var.get()),
+            [(line.product_id, line.quantity) for line in lines.values()]
+        )
+        for (iid, line), price in zip(lines.items(), prices):
+            if price is not None and price != line.price:
+                line.price = price
+                self.order_items_tree.item(iid, values=self.order_line_values(line))
         self.update_order_total()
 
     def update_order_total(self):
         """更新订单总金额"""
-        total = 0
-        for item in self.order_items_tree.get_children():
-            total += float(self.order_items_tree.item(item)['values'][4])
-        
-        # 添加运费和回扣
-        try:
-            freight = float(self.freight_cost_var.get())
-            commission = float(self.commission_var.get())
-            total = total + freight - commission
-        except ValueError:
-            pass
-        
-        self.order_total_var.set(f'{total:.2f}')
+        total = self.order_lines_total(self.order_lines, self.freight_cost_var.get(), self.commission_var.get())
+        self.order_total_var.set(format_money(total))
 
     def save_order(self):
         """保存订单"""
         try:
-            # 获取输入值
-            customer = self.order_customer_var.get().split(' - ')[0] if self.order_customer_var.get() else None
-            business_type = self.order_business_type_var.get()
-            freight_cost = float(self.freight_cost_var.get())
-            commission = float(self.commission_var.get())
-            notes = self.order_notes_var.get()
-            date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # 验证必填项
-            if not customer or not business_type:
-                messagebox.showerror('错误', '客户和业务类型为必填项')
-                return
-                
-            # 验证是否有商品
-            if not self.order_items_tree.get_children():
-                messagebox.showerror('错误', '请至少添加一个商品')
-                return
-                
-            # 开始事务
-            self.conn.execute('BEGIN')
+            # 在界面线程中读取订单和明细，事务交给后台线程执行
+            order = OrderInput(
+                customer_id=self.order_customer_var.get().split(' - ')[0] if self.order_customer_var.get() else None,
+                business_type=self.order_business_type_var.get(),
+                lines=[OrderLine(line.product_id, line.quantity, line.price) for line in self.order_lines.values()],
+                freight_cost=to_fen(self.freight_cost_var.get()),
+                commission=to_fen(self.commission_var.get()),
+                notes=self.order_notes_var.get()
+            )
             
-            try:
-                # 插入订单
-                self.cursor.execute('''
-                    INSERT INTO orders (
-                        customer_id, date, business_type,
-                        total_amount, freight_cost, commission, notes
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (customer, date, business_type,
-                    float(self.order_total_var.get()), freight_cost,
-                    commission, notes))
-                
-                order_id = self.cursor.lastrowid
-                
-                # 插入订单明细
-                for item in self.order_items_tree.get_children():
-                    values = self.order_items_tree.item(item)['values']
-                    product_id = values[0]
-                    quantity = values[2]
-                    price = values[3]
-                    
-                    self.cursor.execute('''
-                        INSERT INTO order_items (
-                            order_id, product_id, quantity, price
-                        ) VALUES (?, ?, ?, ?)
-                    ''', (order_id, product_id, quantity, price))
-                    
-                    # 更新库存
-                    self.cursor.execute('''
-                        UPDATE inventory
-                        SET quantity = quantity - ?
-                        WHERE id = ?
-                    ''', (quantity, product_id))
-                
-                # 提交事务
-                self.conn.commit()
-                
+            def done(result):
                 # 刷新界面
-                self.refresh_orders()
+                self.apply_changes(result.changes)
                 self.clear_order_inputs()
                 self.update_order_combo()
                 messagebox.showinfo('成功', '订单保存成功')
-                
-            except sqlite3.Error as e:
-                # 回滚事务
-                self.conn.rollback()
-                raise e
+            
+            def failed(error):
+                if isinstance(error, ServiceError):
+                    messagebox.showerror('错误', str(error))
+                else:
+                    messagebox.showerror('错误', f'保存订单失败: {error}')
+            
+            self.db_executor.submit(lambda conn: ErpServices(conn).orders.create_order(order), done, failed)
                 
         except ValueError:
             messagebox.showerror('错误', '请输入有效的数字')
-        except sqlite3.Error as e:
-            messagebox.showerror('错误', f'保存订单失败: {e}')
 
     def edit_order(self):
         """编辑订单"""
@@ -1696,13 +6638,7 @@ class InventorySystem:
         order_id = self.orders_tree.item(selected)['values'][0]
         
         # 获取订单信息
-        self.cursor.execute('''
-            SELECT o.*, c.name as customer_name
-            FROM orders o
-            JOIN customers c ON o.customer_id = c.id
-            WHERE o.id = ?
-        ''', (order_id,))
-        
+        self.cursor.execute('SELECT * FROM orders WHERE id = ?', (order_id,))
         order = self.cursor.fetchone()
         if not order:
             messagebox.showerror('错误', '订单不存在')
@@ -1722,13 +6658,8 @@ class InventorySystem:
         row1.pack(fill=tk.X, padx=5, pady=5)
         
         ttk.Label(row1, text="客户:").pack(side=tk.LEFT, padx=5)
-        customer_var = tk.StringVar(value=f"{order[1]} - {order[-1]}")
-        customer_combo = ttk.Combobox(
-            row1,
-            textvariable=customer_var,
-            values=self.order_customer_combo['values'],
-            state='readonly'
-        )
+        customer_var = tk.StringVar(value=self.master_data.label('customers', order[1]))
+        customer_combo = self.autocomplete(row1, 'customers', customer_var)
         customer_combo.pack(side=tk.LEFT, padx=5)
         
         ttk.Label(row1, text="业务类型:").pack(side=tk.LEFT, padx=5)
@@ -1745,11 +6676,11 @@ class InventorySystem:
         row2.pack(fill=tk.X, padx=5, pady=5)
         
         ttk.Label(row2, text="运费:").pack(side=tk.LEFT, padx=5)
-        freight_cost_var = tk.StringVar(value=order[5])
+        freight_cost_var = tk.StringVar(value=format_money(order[5] or 0))
         ttk.Entry(row2, textvariable=freight_cost_var).pack(side=tk.LEFT, padx=5)
         
         ttk.Label(row2, text="回扣:").pack(side=tk.LEFT, padx=5)
-        commission_var = tk.StringVar(value=order[6])
+        commission_var = tk.StringVar(value=format_money(order[6] or 0))
         ttk.Entry(row2, textvariable=commission_var).pack(side=tk.LEFT, padx=5)
         
         # 第三行
@@ -1785,22 +6716,12 @@ class InventorySystem:
         
         items_tree.pack(fill=tk.BOTH, expand=True)
         
-        # 获取订单明细
-        self.cursor.execute('''
-            SELECT oi.*, i.name
-            FROM order_items oi
-            JOIN inventory i ON oi.product_id = i.id
-            WHERE oi.order_id = ?
-        ''', (order_id,))
-        
-        for item in self.cursor.fetchall():
-            items_tree.insert('', 'end', values=(
-                item[2],  # product_id
-                item[-1],  # product_name
-                item[3],  # quantity
-                item[4],  # price
-                item[3] * item[4]  # subtotal
-            ))
+        # 获取订单明细，已有明细保持下单时的价格
+        lines = {}
+        self.cursor.execute('SELECT product_id, quantity, price FROM order_items WHERE order_id = ?', (order_id,))
+        for product_id, quantity, price in self.cursor.fetchall():
+            line = OrderLine(product_id, quantity, price)
+            lines[items_tree.insert('', 'end', values=self.order_line_values(line))] = line
         
         # 商品选择框架
         product_frame = ttk.Frame(detail_frame)
@@ -1808,12 +6729,7 @@ class InventorySystem:
         
         ttk.Label(product_frame, text="商品:").pack(side=tk.LEFT, padx=5)
         product_var = tk.StringVar()
-        product_combo = ttk.Combobox(
-            product_frame,
-            textvariable=product_var,
-            values=self.order_product_combo['values'],
-            state='readonly'
-        )
+        product_combo = self.autocomplete(product_frame, 'products', product_var)
         product_combo.pack(side=tk.LEFT, padx=5)
         
         ttk.Label(product_frame, text="数量:").pack(side=tk.LEFT, padx=5)
@@ -1827,27 +6743,18 @@ class InventorySystem:
                 
             #try```python
             try:
-                product_id = product_var.get().split(' - ')[0]
+                product_id = int(product_var.get().split(' - ')[0])
                 quantity = int(quantity_var.get())
+                if quantity <= 0:
+                    raise ValueError('数量必须大于0')
                 
-                # 获取商品信息
-                self.cursor.execute('SELECT name, selling_price FROM inventory WHERE id = ?', (product_id,))
-                product = self.cursor.fetchone()
-                if not product:
+                # 商品信息取自主数据缓存
+                if not self.master_data.get('inventory', product_id):
                     messagebox.showerror('错误', '商品不存在')
                     return
-                    
-                # 计算小计
-                subtotal = quantity * product[1]
                 
-                # 添加到订单明细列表
-                items_tree.insert('', 'end', values=(
-                    product_id,
-                    product[0],
-                    quantity,
-                    product[1],
-                    subtotal
-                ))
+                # 按客户的价格表和数量阶梯定价
+                self.add_order_line(items_tree, lines, self.selected_id(customer_var.get()), product_id, quantity)
                 
                 # 更新总金额
                 update_total()
@@ -1861,22 +6768,14 @@ class InventorySystem:
                 messagebox.showwarning('警告', '请选择要删除的商品')
                 return
                 
-            items_tree.delete(selected)
+            items_tree.delete(*selected)
+            for iid in selected:
+                del lines[iid]
             update_total()
         
         def update_total():
-            total = 0
-            for item in items_tree.get_children():
-                total += float(items_tree.item(item)['values'][4])
-            
-            try:
-                freight = float(freight_cost_var.get())
-                commission = float(commission_var.get())
-                total = total + freight - commission
-            except ValueError:
-                pass
-            
-            total_var.set(f'{total:.2f}')
+            total = self.order_lines_total(lines, freight_cost_var.get(), commission_var.get())
+            total_var.set(format_money(total))
         
         ttk.Button(product_frame, text='添加商品', command=add_item).pack(side=tk.LEFT, padx=5)
         ttk.Button(product_frame, text='删除商品', command=delete_item).pack(side=tk.LEFT, padx=5)
@@ -1886,83 +6785,40 @@ class InventorySystem:
         total_frame.pack(fill=tk.X, padx=5, pady=5)
         
         ttk.Label(total_frame, text="总金额:").pack(side=tk.LEFT, padx=5)
-        total_var = tk.StringVar(value=order[4])
+        total_var = tk.StringVar(value=format_money(order[4]))
         ttk.Label(total_frame, textvariable=total_var).pack(side=tk.LEFT, padx=5)
         
         def save_changes():
             try:
-                # 获取输入值
-                customer = customer_var.get().split(' - ')[0]
-                business_type = business_type_var.get()
-                freight_cost = float(freight_cost_var.get())
-                commission = float(commission_var.get())
-                notes = notes_var.get()
-                
-                # 验证必填项
-                if not customer or not business_type:
-                    messagebox.showerror('错误', '客户和业务类型为必填项')
-                    return
-                    
-                # 验证是否有商品
-                if not items_tree.get_children():
-                    messagebox.showerror('错误', '请至少添加一个商品')
-                    return
-                    
-                # 开始事务
-                self.conn.execute('BEGIN')
+                # 在界面线程中读取订单和明细，事务交给后台线程执行
+                order = OrderInput(
+                    customer_id=customer_var.get().split(' - ')[0] if customer_var.get() else None,
+                    business_type=business_type_var.get(),
+                    lines=[OrderLine(line.product_id, line.quantity, line.price) for line in lines.values()],
+                    freight_cost=to_fen(freight_cost_var.get()),
+                    commission=to_fen(commission_var.get()),
+                    notes=notes_var.get()
+                )
                 
-                try:
-                    # 更新订单
-                    self.cursor.execute('''
-                        UPDATE orders SET
-                            customer_id = ?, business_type = ?,
-                            total_amount = ?, freight_cost = ?,
-                            commission = ?, notes = ?
-                        WHERE id = ?
-                    ''', (customer, business_type,
-                        float(total_var.get()), freight_cost,
-                        commission, notes, order_id))
-                    
-                    # 删除原有订单明细
-                    self.cursor.execute('DELETE FROM order_items WHERE order_id = ?', (order_id,))
-                    
-                    # 插入新的订单明细
-                    for item in items_tree.get_children():
-                        values = items_tree.item(item)['values']
-                        product_id = values[0]
-                        quantity = values[2]
-                        price = values[3]
-                        
-                        self.cursor.execute('''
-                            INSERT INTO order_items (
-                                order_id, product_id, quantity, price
-                            ) VALUES (?, ?, ?, ?)
-                        ''', (order_id, product_id, quantity, price))
-                        
-                        # 更新库存
-                        self.cursor.execute('''
-                            UPDATE inventory
-                            SET quantity = quantity - ?
-                            WHERE id = ?
-                        ''', (quantity, product_id))
-                    
-                    # 提交事务
-                    self.conn.commit()
-                    
+                def done(result):
                     # 刷新界面
-                    self.refresh_orders()
+                    self.apply_changes(result.changes)
                     edit_window.destroy()
                     messagebox.showinfo('成功', '订单更新成功')
-                    
-                except sqlite3.Error as e:
-                    # 回滚事务
-                    self.conn.rollback()
-                    raise e
+                
+                def failed(error):
+                    if isinstance(error, ServiceError):
+                        messagebox.showerror('错误', str(error))
+                    else:
+                        messagebox.showerror('错误', f'更新订单失败: {error}')
+                
+                self.db_executor.submit(
+                    lambda conn: ErpServices(conn).orders.update_order(order_id, order),
+                    done, failed
+                )
                     
             except ValueError:
                 messagebox.showerror('错误', '请输入有效的数字')
-            except sqlite3.Error as e:
-                messagebox.showerror('错误', f'更新订单失败: {e}')
         
         # 保存按钮
         ttk.Button(edit_window, text="保存", command=save_changes).pack(pady=10)
@@ -1973,60 +6829,36 @@ class InventorySystem:
         if not selected:
             messagebox.showwarning('警告', '请选择要删除的订单')
             return
+        if len(selected) > 1:
+            self.bulk_delete(
+                [int(iid) for iid in selected], '个订单',
+                lambda services, ids: services.orders.delete_orders(ids),
+                '有关联交易记录', self.update_order_combo
+            )
+            return
             
         order_id = self.orders_tree.item(selected)['values'][0]
         
-        # 检查是否有交易记录使用此订单
-        self.cursor.execute('SELECT COUNT(*) FROM transactions WHERE order_id = ?', (order_id,))
-        if self.cursor.fetchone()[0] > 0:
-            messagebox.showerror('错误', '该订单有关联交易记录，无法删除')
-            return
-            
-        if messagebox.askyesno('确认', '确定要删除该订单吗？'):
-            try:
-                # 开始事务
-                self.conn.execute('BEGIN')
-                
-                try:
-                    # 删除订单明细
-                    self.cursor.execute('DELETE FROM order_items WHERE order_id = ?', (order_id,))
-                    
-                    # 删除订单
-                    self.cursor.execute('DELETE FROM orders WHERE id = ?', (order_id,))
-                    
-                    # 提交事务
-                    self.conn.commit()
-                    
-                    # 刷新界面
-                    self.refresh_orders()
-                    self.update_order_combo()
-                    messagebox.showinfo('成功', '订单删除成功')
-                    
-                except sqlite3.Error as e:
-                    # 回滚事务
-                    self.conn.rollback()
-                    raise e
-                    
-            except sqlite3.Error as e:
-                messagebox.showerror('错误', f'删除订单失败: {e}')
+        try:
+            # 检查是否有交易记录使用此订单
+            self.services.orders.ensure_can_delete_order(order_id)
+            if messagebox.askyesno('确认', '确定要删除该订单吗？'):
+                result = self.services.orders.delete_order(order_id)
+                self.apply_changes(result.changes)
+                self.update_order_combo()
+                messagebox.showinfo('成功', '订单删除成功')
+        except ServiceError as e:
+            messagebox.showerror('错误', str(e))
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'删除订单失败: {e}')
 
     def refresh_orders(self):
         """刷新订单列表"""
-        for item in self.orders_tree.get_children():
-            self.orders_tree.delete(item)
-            
-        self.cursor.execute('''
-            SELECT o.*, c.name as customer_name
-            FROM orders o
-            JOIN customers c ON o.customer_id = c.id
-            ORDER BY o.date DESC
-        ''')
-        
-        for row in self.cursor.fetchall():
-            self.orders_tree.insert('', 'end', values=row)
+        self.orders_loader.load(self.grid_pager('orders'))
 
     def clear_order_inputs(self):
         """清空订单输入框"""
+        self.order_lines.clear()
         self.order_customer_var.set('')
         self.order_business_type_var.set('')
         self.freight_cost_var.set('0.0')
@@ -2058,10 +6890,189 @@ class InventorySystem:
         
         def on_account_set_change(event):
             self.current_db_file = f"{self.account_set_var.get()}.db"
+            self.stop_integrity_check()
+            self.integrity_checker = None
             self.init_database()
             self.refresh_all()
         
         account_set_combo.bind('<<ComboboxSelected>>', on_account_set_change)
+        
+        ttk.Button(selector_frame, text="导出数据", command=self.export_data).pack(side=tk.LEFT, padx=5)
+
+    def export_data(self):
+        """导出订单、订单明细或资金往来"""
+        window = tk.Toplevel(self.root)
+        window.title("导出数据")
+        window.geometry("400x250")
+        
+        input_frame = ttk.LabelFrame(window, text="导出条件")
+        input_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        
+        tables = {'订单': 'orders', '订单明细': 'order_items', '资金往来': 'transactions'}
+        formats = {'CSV': 'csv', '列式文件': 'columnar'}
+        
+        ttk.Label(input_frame, text="数据:").grid(row=0, column=0, padx=5, pady=5)
+        table_var = tk.StringVar(value='订单')
+        ttk.Combobox(input_frame, textvariable=table_var, values=list(tables), state='readonly').grid(row=0, column=1, padx=5, pady=5)
+        
+        ttk.Label(input_frame, text="格式:").grid(row=1, column=0, padx=5, pady=5)
+        format_var = tk.StringVar(value='CSV')
+        ttk.Combobox(input_frame, textvariable=format_var, values=list(formats), state='readonly').grid(row=1, column=1, padx=5, pady=5)
+        
+        ttk.Label(input_frame, text="开始日期:").grid(row=2, column=0, padx=5, pady=5)
+        from_var = tk.StringVar()
+        ttk.Entry(input_frame, textvariable=from_var).grid(row=2, column=1, padx=5, pady=5)
+        
+        ttk.Label(input_frame, text="结束日期:").grid(row=3, column=0, padx=5, pady=5)
+        to_var = tk.StringVar()
+        ttk.Entry(input_frame, textvariable=to_var).grid(row=3, column=1, padx=5, pady=5)
+        
+        status_var = tk.StringVar()
+        ttk.Label(input_frame, textvariable=status_var).grid(row=5, column=0, columnspan=2, pady=5)
+        
+        def start():
+            table = tables[table_var.get()]
+            fmt = formats[format_var.get()]
+            extension = '.csv' if fmt == 'csv' else '.erpcol'
+            path = filedialog.asksaveasfilename(
+                parent=window,
+                defaultextension=extension,
+                initialfile=table + extension
+            )
+            if not path:
+                return
+            date_from = from_var.get().strip() or None
+            date_to = to_var.get().strip() or None
+            
+            exporter = [None]       # 只在后台线程中赋值
+            tag = f'export-{id(window)}'
+            
+            def create(conn):
+                exporter[0] = TableExporter(conn, table, path, fmt, date_from, date_to)
+                return exporter[0]
+            
+            # 每批一个后台任务，批与批之间列表刷新和保存等任务可以插队执行
+            def next_step(_=None):
+                self.db_executor.submit(exporter[0].step, on_step, failed, tag=tag)
+            
+            def on_step(count):
+                if not exporter[0].done:
+                    status_var.set(f'已导出 {count} 行')
+                    next_step()
+                    return
+                if window.winfo_exists():
+                    window.destroy()
+                messagebox.showinfo('成功', f'已导出 {count} 行到 {path}')
+            
+            def failed(error):
+                if exporter[0] is not None:
+                    exporter[0].close()
+                if window.winfo_exists():
+                    export_button.state(['!disabled'])
+                messagebox.showerror('错误', f'导出失败: {error}')
+            
+            def cancel(event):
+                # 关闭窗口即取消导出：丢弃尚未执行的批次，在后台线程中关闭文件，已写入的部分保留
+                if event.widget is window:
+                    self.db_executor.cancel(tag)
+                    self.db_executor.submit(lambda conn: exporter[0] and exporter[0].close())
+            
+            window.bind('<Destroy>', cancel)
+            export_button.state(['disabled'])
+            status_var.set('正在导出...')
+            self.db_executor.submit(create, next_step, failed, tag=tag)
+        
+        export_button = ttk.Button(input_frame, text="导出", command=start)
+        export_button.grid(row=4, column=0, columnspan=2, pady=10)
+
+    def bulk_import(self, table):
+        """从 CSV 文件批量导入商品、客户或供应商"""
+        path = filedialog.askopenfilename(
+            title='选择要导入的 CSV 文件',
+            filetypes=[('CSV 文件', '*.csv'), ('所有文件', '*.*')]
+        )
+        if not path:
+            return
+        
+        # 进度窗口
+        window = tk.Toplevel(self.root)
+        window.title('批量导入')
+        window.geometry('400x120')
+        progress_var = tk.StringVar(value='正在导入...')
+        ttk.Label(window, textvariable=progress_var).pack(padx=10, pady=10)
+        bar = ttk.Progressbar(window, mode='indeterminate')
+        bar.pack(fill=tk.X, padx=10)
+        bar.start()
+        
+        def show_progress(counts):
+            total, inserted, errors = counts
+            progress_var.set(f'已处理 {total} 行，导入 {inserted} 行，错误 {errors} 行')
+        
+        def run(conn):
+            # 在后台线程中导入，进度交回界面线程显示
+            importer = BulkImporter(
+                conn, table,
+                progress=lambda *counts: self.db_executor.post(show_progress, counts)
+            )
+            return importer.run(path)
+        
+        def done(result):
+            window.destroy()
+            message = f'共 {result.total} 行，成功导入 {result.inserted} 行'
+            if result.errors:
+                report = write_import_errors(result, path)
+                message += f'，{len(result.errors)} 行有错误，详见 {report}'
+            refresh = {
+                'inventory': self.refresh_inventory,
+                'customers': self.refresh_customers,
+                'suppliers': self.refresh_suppliers,
+            }
+            refresh[table]()
+            if table == 'inventory':
+                self.refresh_low_stock()
+            self.refresh_categories()
+            self.refresh_all_combos()
+            messagebox.showinfo('导入完成', message)
+        
+        def failed(error):
+            window.destroy()
+            messagebox.showerror('错误', f'导入失败: {error}')
+        
+        self.db_executor.submit(run, done, failed)
+
+    def apply_changes(self, changes):
+        """按行增量刷新受修改影响的列表"""
+        loaders = {
+            'inventory': self.inventory_loader,
+            'transactions': self.transactions_loader,
+            'customers': self.customers_loader,
+            'suppliers': self.suppliers_loader,
+            'orders': self.orders_loader,
+        }
+        # 这些表的名称会显示在其他列表中
+        dependents = {
+            'customers': [self.orders_loader, self.transactions_loader],
+            'suppliers': [self.inventory_loader, self.transactions_loader],
+            'categories': [self.inventory_loader],
+        }
+        self.master_data.invalidate(changes)
+        stale = []
+        for table, inserted, updated, deleted in changes:
+            if table in loaders:
+                loaders[table].patch(inserted, updated, deleted)
+            if updated or deleted:
+                stale.extend(loader for loader in dependents.get(table, []) if loader not in stale)
+            if table == 'inventory':
+                # 库存变动可能使商品进入或离开预警列表，预警列表很短，直接重新加载
+                self.refresh_low_stock()
+        if any(table in ('orders', 'transactions') for table, *_ in changes):
+            # 余额已在事务中增量维护；账龄合计要汇总全部往来单位，只在打开账龄页时重新计算
+            self.aging_stale = True
+            if self.notebook.select() == str(self.aging_frame):
+                # 正在查看时只重新加载首页（余额变化会改变排序）
+                self.aging_loader.load(aging_pager(self.aging_kind_var.get()))
+        for loader in stale:
+            loader.refresh_visible()
 
     def refresh_all(self):
         """刷新所有数据"""
@@ -2071,10 +7082,260 @@ class InventorySystem:
         self.refresh_customers()
         self.refresh_suppliers()
         self.refresh_orders()
+        self.refresh_low_stock()
+        self.refresh_aging()
+        self.refresh_price_lists()
         self.refresh_all_combos()
 
 
-if __name__ == '__main__':
+def main(argv=None):
+    """程序入口：不带子命令时启动图形界面"""
+    parser = argparse.ArgumentParser(description='进销存管理系统')
+    commands = parser.add_subparsers(dest='command')
+    
+    export = commands.add_parser('export', help='导出订单、订单明细或资金往来')
+    export.add_argument('db', help='账套数据库文件，如 账套1.db')
+    export.add_argument('table', choices=sorted(EXPORT_QUERIES))
+    export.add_argument('output', help='导出文件路径')
+    export.add_argument('--format', choices=sorted(EXPORT_WRITERS), default='csv')
+    export.add_argument('--from', dest='date_from', help='开始日期，如 2024-01-01')
+    export.add_argument('--to', dest='date_to', help='结束日期（含当天）')
+    
+    serve = commands.add_parser('serve', help='以 HTTP/JSON 接口共享一个账套')
+    serve.add_argument('db', help='账套数据库文件')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--readers', type=int, default=4, help='只读连接数')
+    
+    loadtest = commands.add_parser('loadtest', help='对 HTTP 接口做并发压测，输出 p50/p99 延迟')
+    loadtest.add_argument('db', nargs='?', help='指定账套时在本进程内启动服务；否则连接 --host/--port 上已运行的服务')
+    loadtest.add_argument('--host', default='127.0.0.1')
+    loadtest.add_argument('--port', type=int, default=8080)
+    loadtest.add_argument('--readers', type=int, default=4, help='只读连接数（本进程内启动服务时）')
+    loadtest.add_argument('--requests', type=int, default=2000)
+    loadtest.add_argument('--concurrency', type=int, default=32)
+    loadtest.add_argument('--write-ratio', type=float, default=0.1, help='写请求比例，写入的是资金往来记录')
+    
+    stress = commands.add_parser('stress', help='多进程并发下单，检查库存是否被超卖（使用临时账套）')
+    stress.add_argument('--processes', type=int, default=8)
+    stress.add_argument('--orders', type=int, default=200, help='每个进程的下单次数')
+    stress.add_argument('--products', type=int, default=5)
+    stress.add_argument('--stock', type=int, default=100, help='每个商品的期初库存')
+    
+    report = commands.add_parser('report', help='从汇总表查询销售或资金报表')
+    report.add_argument('db', help='账套数据库文件')
+    report.add_argument('report', choices=sorted(SUMMARY_REPORTS))
+    report.add_argument('--by', nargs='*', default=['month'],
+                        help='分组维度：day/month/quarter/business_type，销售另有 product/customer，资金另有 type')
+    report.add_argument('--from', dest='date_from', help='开始日期')
+    report.add_argument('--to', dest='date_to', help='结束日期（含当天）')
+    
+    rebuild = commands.add_parser('rebuild-summaries', help='按现有订单和资金往来重建汇总表和往来账')
+    rebuild.add_argument('db', help='账套数据库文件')
+    
+    aging = commands.add_parser('aging', help='列出客户应收或供应商应付的余额和账龄')
+    aging.add_argument('db', help='账套数据库文件')
+    aging.add_argument('--kind', choices=list(ACCOUNT_PARTIES), default='应收')
+    aging.add_argument('--as-of', help='账龄计算日期，默认今天')
+    aging.add_argument('--limit', type=int, default=200, help='最多列出的往来单位数')
+    
+    low_stock = commands.add_parser('low-stock', help='列出库存不高于预警值的商品')
+    low_stock.add_argument('db', help='账套数据库文件')
+    low_stock.add_argument('--limit', type=int, help='最多列出的商品数')
+    
+    bench_edit = commands.add_parser('bench-edit', help='修改大订单的写入量基准（使用临时账套）')
+    bench_edit.add_argument('--lines', type=int, default=1000, help='订单明细行数')
+    
+    bench_orders = commands.add_parser('bench-orders', help='不启动界面逐单下单、改单、删单的吞吐量基准（使用临时账套）')
+    bench_orders.add_argument('--orders', type=int, default=10000, help='订单数')
+    bench_orders.add_argument('--lines', type=int, default=3, help='每单明细行数')
+    
+    bench_refresh = commands.add_parser('bench-refresh', help='已有不同订单数时新增一张订单及刷新列表的耗时基准（使用临时账套）')
+    bench_refresh.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='已有订单数')
+    bench_refresh.add_argument('--repeat', type=int, default=5, help='每个规模的下单次数')
+    
+    bench_profile = commands.add_parser('bench-profile', help='默认连接参数与账套连接配置的提交延迟和列表刷新吞吐量基准（使用临时账套）')
+    bench_profile.add_argument('--commits', type=int, default=300, help='逐笔提交的次数')
+    bench_profile.add_argument('--seconds', type=float, default=2.0, help='读写并发测试的秒数')
+    
+    bench_money = commands.add_parser('bench-money', help='金额由 REAL 元改为整数分前后的报表查询和文件大小基准（使用临时账套）')
+    bench_money.add_argument('--orders', type=int, default=100000, help='订单数')
+    bench_money.add_argument('--transactions', type=int, default=100000, help='资金往来笔数')
+    
+    check = commands.add_parser('check', help='检查账套一致性：孤立记录、金额与汇总不符、负库存等')
+    check.add_argument('db', help='账套数据库文件')
+    check.add_argument('--repair', action='store_true', help='执行可自动修复问题的修复计划')
+    check.add_argument('--chunk-size', type=int, default=50000, help='每块检查的行数')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'export':
+        if not os.path.exists(args.db):
+            parser.error(f'账套文件不存在: {args.db}')
+        conn = connect_database(args.db)
+        count = export_table(conn, args.table, args.output, args.format, args.date_from, args.date_to)
+        conn.close()
+        print(f'已导出 {count} 行到 {args.output}')
+        return
+    
+    if args.command == 'serve':
+        if not os.path.exists(args.db):
+            parser.error(f'账套文件不存在: {args.db}')
+        
+        async def serve_forever():
+            server = ApiServer(args.db, args.host, args.port, args.readers)
+            await server.start()
+            print(f'服务已启动: http://{args.host}:{server.port}/api/')
+            try:
+                await server.serve_forever()
+            finally:
+                await server.stop()
+        
+        try:
+            asyncio.run(serve_forever())
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    if args.command == 'loadtest':
+        if args.db and not os.path.exists(args.db):
+            parser.error(f'账套文件不存在: {args.db}')
+        
+        async def load():
+            server = None
+            host, port = args.host, args.port
+            if args.db:
+                server = ApiServer(args.db, '127.0.0.1', 0, args.readers)
+                await server.start()
+                host, port = server.host, server.port
+            try:
+                return await run_load_test(host, port, args.requests, args.concurrency, args.write_ratio)
+            finally:
+                if server:
+                    await server.stop()
+        
+        stats = asyncio.run(load())
+        print(f"请求 {stats['requests']} 个，失败 {stats['errors']} 个，耗时 {stats['seconds']:.2f} 秒，"
+              f"吞吐 {stats['throughput']:.0f} 次/秒")
+        print(f"延迟 p50 {stats['p50']:.2f} ms，p99 {stats['p99']:.2f} ms，最大 {stats['max']:.2f} ms")
+        return
+    
+    if args.command in ('report', 'rebuild-summaries'):
+        if not os.path.exists(args.db):
+            parser.error(f'账套文件不存在: {args.db}')
+        conn = connect_database(args.db)
+        if args.command == 'rebuild-summaries':
+            rebuild_summaries(conn)
+            rebuild_accounts(conn)
+            print('汇总表和往来账已重建')
+        else:
+            try:
+                columns, rows = summary_report(conn, args.report, args.by, args.date_from, args.date_to)
+            except ValueError as e:
+                parser.error(str(e))
+            writer = csv.writer(sys.stdout)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        conn.close()
+        return
+    
+    if args.command == 'low-stock':
+        if not os.path.exists(args.db):
+            parser.error(f'账套文件不存在: {args.db}')
+        conn = connect_database(args.db)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['ID', '商品名称', '分类', '供应商', '库存', '预警值', '缺口'])
+        writer.writerows(low_stock_items(conn, args.limit))
+        conn.close()
+        return
+    
+    if args.command == 'aging':
+        if not os.path.exists(args.db):
+            parser.error(f'账套文件不存在: {args.db}')
+        conn = connect_database(args.db)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['ID', '名称', '余额', '0-30天', '31-60天', '61-90天', '90天以上'])
+        pager = aging_pager(args.kind, args.as_of, page_size=args.limit)
+        writer.writerows(aging_row(row) for _, row in pager.fetch(conn))
+        summary = aging_summary(conn, args.kind, args.as_of)
+        writer.writerow(['合计', f"{summary['parties']} 个"] + [format_money(v) for v in [summary['balance']] + summary['buckets']])
+        conn.close()
+        return
+    
+    if args.command == 'bench-edit':
+        print(f'订单明细 {args.lines} 行')
+        for count, written, millis in run_order_edit_benchmark(args.lines):
+            print(f'修改 {count} 行：写入 {written} 行，耗时 {millis:.1f} ms')
+        return
+    
+    if args.command == 'bench-orders':
+        result = run_order_service_benchmark(args.orders, args.lines)
+        for label, count, seconds in result['operations']:
+            print(f'{label} {count} 单，耗时 {seconds:.2f} 秒，{count / seconds:.0f} 单/秒')
+        if result['issues']:
+            print(f"一致性检查发现问题 {result['issues']} 个")
+            sys.exit(1)
+        return
+    
+    if args.command == 'bench-refresh':
+        for size, timings in run_order_refresh_benchmark(sorted(args.sizes), args.repeat):
+            print(f'已有 {size} 张订单：' + '，'.join(f'{label} {millis:.2f} ms' for label, millis in timings.items()))
+        return
+    
+    if args.command == 'bench-profile':
+        for label, stats in run_connection_profile_benchmark(args.commits, seconds=args.seconds).items():
+            print(f"{label}：提交延迟 P50 {stats['commit_p50']:.2f} ms，P95 {stats['commit_p95']:.2f} ms；"
+                  f"并发写入时刷新列表 {stats['pages']:.0f} 页/秒，同时写入 {stats['writes']:.0f} 笔/秒")
+        return
+    
+    if args.command == 'bench-money':
+        result = run_money_benchmark(args.orders, transactions=args.transactions)
+        before, after = result['size']
+        print(f"文件大小 {before / 1048576:.1f} MB -> {after / 1048576:.1f} MB，金额迁移耗时 {result['migrate']:.2f} 秒")
+        for label, real_ms, fen_ms in result['queries']:
+            print(f'{label}：REAL {real_ms:.1f} ms，整数分 {fen_ms:.1f} ms')
+        return
+    
+    if args.command == 'check':
+        if not os.path.exists(args.db):
+            parser.error(f'账套文件不存在: {args.db}')
+        conn = connect_database(args.db)
+        checker = IntegrityChecker(conn, chunk_size=args.chunk_size)
+        checker.run(lambda position, total: print(f'\r已检查 {position}/{total} 块', end='', file=sys.stderr))
+        print(file=sys.stderr)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['检查项', '表', 'ID', '说明', '修复'])
+        writer.writerows(
+            (issue.check, issue.table, issue.row_id, issue.detail, '自动' if issue.repair else '人工')
+            for issue in checker.issues
+        )
+        for name, count in checker.counts.items():
+            if count:
+                print(f'{name}: {count} 个', file=sys.stderr)
+        if len(checker.issues) < checker.total_issues:
+            print(f'问题过多，只列出前 {len(checker.issues)} 个', file=sys.stderr)
+        if args.repair and checker.issues:
+            count = apply_repair_plan(conn, repair_plan(checker.issues))
+            print(f'已执行 {count} 条修复语句，请重新检查', file=sys.stderr)
+        conn.close()
+        if checker.total_issues and not args.repair:
+            sys.exit(1)
+        return
+    
+    if args.command == 'stress':
+        stats = run_stock_stress(args.processes, args.orders, args.products, args.stock)
+        print(f"成功 {stats['placed']} 单，库存不足拒绝 {stats['rejected']} 单，等锁超时 {stats['busy']} 单，"
+              f"耗时 {stats['seconds']:.2f} 秒，{stats['throughput']:.0f} 单/秒")
+        if stats['negative'] or stats['mismatched']:
+            print(f"发现超卖：负库存商品 {stats['negative']} 个，库存与订单/流水不一致 {stats['mismatched']} 个")
+            sys.exit(1)
+        print('未发现超卖')
+        return
+    
     root = tk.Tk()
     app = InventorySystem(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+
+
+if __name__ == '__main__':
+    main()
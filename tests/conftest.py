@@ -0,0 +1,29 @@
+import pytest
+
+import erp
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """迁移到最新结构并应用连接配置的临时账套"""
+    conn = erp.connect_database(str(tmp_path / 'test.db'))
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def services(conn):
+    return erp.ErpServices(conn)
+
+
+@pytest.fixture
+def shop(services):
+    """一个分类、一个客户、一个供应商和两个商品（库存各 100，售价 2.00 元）"""
+    category_id = services.inventory.add_category('测试分类').id
+    customer_id = services.customers.add(erp.PartyInput('测试客户', '已合作客户')).id
+    supplier_id = services.suppliers.add(erp.PartyInput('测试供应商', '生产商')).id
+    products = [
+        services.inventory.add_product(erp.ProductInput(f'商品{n}', category_id, supplier_id, 100, 100, 200)).id
+        for n in range(2)
+    ]
+    return {'category': category_id, 'customer': customer_id, 'supplier': supplier_id, 'products': products}
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+import erp
+
+
+def call(tmp_path, *requests):
+    """在临时账套上启动接口服务，依次处理 (方法, 地址, 请求体) 并返回 [(状态码, 数据), ...]；
+    请求体为 bytes 时原样发送，其他值按 JSON 编码"""
+    async def run():
+        server = erp.ApiServer(str(tmp_path / 'api.db'), port=0, readers=2)
+        await server.start()
+        try:
+            responses = []
+            for method, target, body in requests:
+                if not isinstance(body, bytes):
+                    body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                responses.append(await server.dispatch(method, target, body))
+            return responses
+        finally:
+            await server.stop()
+    return asyncio.run(run())
+
+
+SETUP = [
+    ('POST', '/api/categories', {'name': '分类'}),
+    ('POST', '/api/customers', {'name': '客户', 'type': '已合作客户'}),
+    ('POST', '/api/inventory', {'name': '商品', 'category_id': 1, 'quantity': 5,
+                                'purchase_price': '1.10', 'selling_price': '2.35'}),
+]
+
+
+def test_create_and_read(tmp_path):
+    responses = call(tmp_path, *SETUP,
+                     ('POST', '/api/orders', {'customer_id': 1, 'business_type': '对公',
+                                              'lines': [{'product_id': 1, 'quantity': 2, 'price': '2.35'}]}),
+                     ('GET', '/api/inventory/1', b''),
+                     ('GET', '/api/orders/1/items', b''),
+                     ('GET', '/api/orders?limit=1', b''))
+
+    assert [status for status, _ in responses[:4]] == [201, 201, 201, 201]
+    assert responses[3][1]['changes']['inventory']['updated'] == [1]
+    assert responses[4] == (200, {'id': 1, 'name': '商品', 'category_id': 1, 'quantity': 3, 'purchase_price': '1.10',
+                                  'selling_price': '2.35', 'supplier_id': None, 'warning_level': 10})
+    assert [(row['quantity'], row['price']) for row in responses[5][1]['rows']] == [(2, '2.35')]
+    assert responses[6][1]['next'] == 1
+
+
+@pytest.mark.parametrize('method, target, body', [
+    ('GET', '/api/orders/999', b''),
+    ('PUT', '/api/orders/999', {'customer_id': 1, 'business_type': '对公',
+                                'lines': [{'product_id': 1, 'quantity': 1, 'price': '1'}]}),
+    ('DELETE', '/api/orders/999', b''),
+    ('PUT', '/api/transactions/999', {'type': '收入', 'business_type': '对公', 'amount': '1'}),
+    ('DELETE', '/api/transactions/999', b''),
+    ('PUT', '/api/customers/999', {'name': '客户', 'type': '已合作客户'}),
+    ('DELETE', '/api/customers/999', b''),
+    ('DELETE', '/api/suppliers/999', b''),
+    ('PUT', '/api/inventory/999', {'name': '商品', 'category_id': 1}),
+    ('DELETE', '/api/inventory/999', b''),
+    ('DELETE', '/api/categories/999', b''),
+    ('GET', '/api/unknown', b''),
+])
+def test_missing_rows_return_404(tmp_path, method, target, body):
+    *_, (status, data) = call(tmp_path, *SETUP, (method, target, body))
+    assert status == 404
+    assert 'changes' not in data
+
+
+@pytest.mark.parametrize('method, target', [('POST', '/api/orders/1'), ('PATCH', '/api/orders'), ('PUT', '/api/orders')])
+def test_unsupported_operations_return_405(tmp_path, method, target):
+    assert call(tmp_path, (method, target, {}))[0][0] == 405
+
+
+def test_shortage_returns_409_with_shortages(tmp_path):
+    *_, (status, data), (_, product) = call(
+        tmp_path, *SETUP,
+        ('POST', '/api/orders', {'customer_id': 1, 'business_type': '对公',
+                                 'lines': [{'product_id': 1, 'quantity': 6, 'price': '2.35'}]}),
+        ('GET', '/api/inventory/1', b''),
+    )
+    assert status == 409
+    assert data['shortages'] == [{'product_id': 1, 'name': '商品', 'requested': 6, 'available': 5}]
+    assert product['quantity'] == 5
+
+
+def test_referencing_missing_row_returns_409(tmp_path):
+    status, _ = call(tmp_path, ('POST', '/api/inventory', {'name': '商品', 'category_id': 42}))[0]
+    assert status == 409
+
+
+@pytest.mark.parametrize('method, target, body', [
+    ('POST', '/api/categories', b'{bad json'),
+    ('POST', '/api/categories', b'[]'),
+    ('POST', '/api/orders', {'customer_id': 1, 'business_type': '对公', 'lines': [1]}),
+    ('POST', '/api/inventory', {'name': '商品', 'category_id': 1, 'selling_price': 'abc'}),
+    ('POST', '/api/customers', {'name': '客户', 'type': '已合作客户', 'unknown': 1}),
+    ('GET', '/api/orders?limit=abc', b''),
+    ('GET', '/api/orders?after=x', b''),
+])
+def test_malformed_requests_return_400(tmp_path, method, target, body):
+    status, data = call(tmp_path, (method, target, body))[0]
+    assert status == 400
+    assert data['error']
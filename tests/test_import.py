@@ -0,0 +1,61 @@
+import pytest
+
+import erp
+
+
+def write_csv(tmp_path, text):
+    path = tmp_path / 'import.csv'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_import_reports_bad_rows_and_skips_their_categories(conn, tmp_path):
+    path = write_csv(tmp_path, '名称,分类,数量,进货价,销售价\n'
+                               'A,新分类A,1,1,2\n'
+                               'B,新分类B,-1,1,2\n'
+                               'C,新分类C,x,1,2\n'
+                               'D,新分类A,2,1.5,2.25\n')
+    result = erp.BulkImporter(conn, 'inventory').run(path)
+
+    assert result.inserted == 2
+    assert [line for line, _ in result.errors] == [3, 4]
+    assert [row[0] for row in conn.execute('SELECT name FROM categories')] == ['新分类A']
+    assert conn.execute("SELECT purchase_price, selling_price FROM inventory WHERE name = 'D'").fetchone() == (150, 225)
+    assert erp.IntegrityChecker(conn).run() == []
+
+
+@pytest.mark.parametrize('column, value', [('数量', '99999999999999999999'), ('销售价', '99999999999999999999')])
+def test_import_rejects_values_beyond_sqlite_integer(conn, tmp_path, column, value):
+    row = {'名称': 'A', '分类': '分类', '数量': '1', '进货价': '1', '销售价': '2'}
+    row[column] = value
+    path = write_csv(tmp_path, ','.join(row) + '\n' + ','.join(row.values()) + '\nB,分类,1,1,2\n')
+    result = erp.BulkImporter(conn, 'inventory').run(path)
+
+    assert result.inserted == 1
+    assert result.errors == [(2, f'{column}超出范围: {value}')]
+    assert not conn.in_transaction
+
+
+def test_failed_chunk_rolls_back_and_leaves_connection_usable(conn, services, tmp_path, monkeypatch):
+    path = write_csv(tmp_path, '名称,分类,数量\nA,新分类,1\n')
+    importer = erp.BulkImporter(conn, 'inventory')
+    convert_chunk = importer.convert_chunk
+
+    def overflowing(chunk):
+        rows, errors = convert_chunk(chunk)
+        return rows + [('B', rows[0][1], None, 2 ** 64, 0, 0, 10)], errors
+
+    monkeypatch.setattr(importer, 'convert_chunk', overflowing)
+    with pytest.raises(OverflowError):
+        importer.run(path)
+
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM inventory').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM categories').fetchone()[0] == 0
+    assert importer.categories == {}
+
+    # 之后的写入照常提交
+    category_id = services.inventory.add_category('分类').id
+    reopened = erp.connect_database(conn.execute('PRAGMA database_list').fetchone()[2])
+    assert reopened.execute('SELECT id FROM categories').fetchall() == [(category_id,)]
+    reopened.close()
@@ -0,0 +1,89 @@
+import csv
+
+import pytest
+
+import erp
+
+
+@pytest.mark.parametrize('balance, windows, buckets', [
+    # 回款先冲最早的欠款，余额按最近的欠款逐段分配
+    (1000, (100, 300, 600), [100, 200, 300, 400]),
+    (250, (100, 300, 600), [100, 150, 0, 0]),
+    (50, (100, 300, 600), [50, 0, 0, 0]),
+    (600, (0, 0, 600), [0, 0, 600, 0]),
+    (100, (None, None, None), [0, 0, 0, 100]),
+    # 多付的款项不计入任何区间
+    (-300, (100, 300, 600), [0, 0, 0, 0]),
+    (None, (100, 300, 600), [0, 0, 0, 0]),
+])
+def test_aging_buckets(balance, windows, buckets):
+    assert erp.aging_buckets(balance, windows) == buckets
+
+
+def test_aging_summary_matches_the_rows(conn, services, shop):
+    product = shop['products'][0]
+    other = services.customers.add(erp.PartyInput('多付客户', '已合作客户')).id
+    for customer_id, day, price in ((shop['customer'], '2024-06-20', 1000), (shop['customer'], '2024-05-16', 2000),
+                                    (shop['customer'], '2024-04-16', 3000), (shop['customer'], '2024-03-01', 4000),
+                                    (other, '2024-06-01', 500)):
+        order = erp.OrderInput(customer_id, '对公', [erp.OrderLine(product, 1, price)])
+        services.orders.create_order(order, date=f'{day} 10:00:00')
+    for customer_id, amount in ((shop['customer'], 2500), (other, 800)):
+        services.ledger.add_transaction(
+            erp.TransactionInput('收入', '对公', amount, customer_id=customer_id), date='2024-06-25 10:00:00'
+        )
+
+    rows = [erp.aging_row(row) for _, row in erp.aging_pager('应收', '2024-06-30').fetch(conn)]
+    assert rows == [
+        [shop['customer'], '测试客户'] + [erp.from_fen(v) for v in (7500, 1000, 2000, 3000, 1500)],
+        [other, '多付客户'] + [erp.from_fen(v) for v in (-300, 0, 0, 0, 0)],
+    ]
+
+    summary = erp.aging_summary(conn, '应收', '2024-06-30')
+    assert summary == {'parties': 2, 'balance': 7200, 'buckets': [1000, 2000, 3000, 1500]}
+    assert [erp.to_fen(sum(row[n] for row in rows)) for n in range(2, 7)] == [summary['balance']] + summary['buckets']
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'columnar'])
+def test_export_table_round_trips_a_date_range(tmp_path, conn, services, shop, fmt):
+    first, second = shop['products']
+    for day, price in (('2024-01-31', 150), ('2024-02-01', 205), ('2024-02-29', 1999), ('2024-03-01', 300)):
+        order = erp.OrderInput(shop['customer'], '对公', [erp.OrderLine(first, 2, price), erp.OrderLine(second, 1, 5)],
+                               freight_cost=350, commission=1, notes='备注,含"引号"')
+        services.orders.create_order(order, date=f'{day} 23:30:00')
+    services.ledger.add_transaction(erp.TransactionInput('收入', '对私', 12345, '现金'), date='2024-02-10 09:00:00')
+
+    def export(table):
+        path = str(tmp_path / f'{table}.{fmt}')
+        progress = []
+        count = erp.export_table(conn, table, path, fmt, '2024-02-01', '2024-02-29', progress.append)
+        assert progress[-1] == count
+        if fmt == 'csv':
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                rows = list(csv.reader(f))
+            return rows[0], rows[1:]
+        columns, rows = erp.read_columnar(path)
+        return columns, [list(row) for row in rows]
+
+    def money(fen):
+        return erp.format_money(fen) if fmt == 'csv' else erp.from_fen(fen)
+
+    def value(v):
+        return ('' if v is None else str(v)) if fmt == 'csv' else v
+
+    columns, rows = export('orders')
+    assert columns == ['id', 'customer_id', 'date', 'business_type', 'total_amount', 'freight_cost', 'commission', 'notes']
+    assert rows == [
+        [value(2), value(shop['customer']), '2024-02-01 23:30:00', '对公', money(764), money(350), money(1), '备注,含"引号"'],
+        [value(3), value(shop['customer']), '2024-02-29 23:30:00', '对公', money(4352), money(350), money(1), '备注,含"引号"'],
+    ]
+    if fmt == 'csv':
+        assert rows[1][4:7] == ['43.52', '3.50', '0.01']
+
+    columns, rows = export('order_items')
+    assert [row[columns.index('price')] for row in rows] == [money(205), money(5), money(1999), money(5)]
+
+    columns, rows = export('transactions')
+    assert [[row[columns.index(name)] for name in ('amount', 'description', 'customer_id')] for row in rows] == [
+        [money(12345), '现金', value(None)]
+    ]
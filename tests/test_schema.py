@@ -0,0 +1,100 @@
+import sqlite3
+
+import erp
+
+
+def test_fresh_database_hot_queries_use_indexes(conn):
+    assert erp.check_query_plans(conn) == []
+
+
+def test_upgraded_database_hot_queries_use_indexes(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    assert erp.migrate_database(conn, 3) == 3
+    conn.close()
+
+    conn = erp.connect_database(path)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == erp.SCHEMA_VERSION
+    assert erp.check_query_plans(conn) == []
+    conn.close()
+
+
+def test_check_query_plans_reports_scans_and_temp_sorts(conn):
+    problems = erp.check_query_plans(conn, [
+        ('按备注查询订单', 'SELECT id FROM orders WHERE notes = ?', ('x',)),
+        ('按备注排序订单', 'SELECT id FROM orders ORDER BY notes', ()),
+    ])
+    assert {name for name, _ in problems} == {'按备注查询订单', '按备注排序订单'}
+
+
+def test_money_migration_converts_real_yuan_to_fen(tmp_path):
+    path = str(tmp_path / 'v11.db')
+    conn = sqlite3.connect(path)
+    money_version = next(version for version, statements in erp.SCHEMA_MIGRATIONS
+                         if statements is erp.migrate_money_to_fen)
+    assert erp.migrate_database(conn, money_version - 1) == money_version - 1
+    conn.execute("INSERT INTO categories (name) VALUES ('分类')")
+    conn.execute("INSERT INTO customers (name, type) VALUES ('迁移客户', '已合作客户')")
+    conn.execute("INSERT INTO suppliers (name, type) VALUES ('迁移供应商', '生产商')")
+    conn.execute(
+        "INSERT INTO inventory (name, category_id, quantity, purchase_price, selling_price) "
+        "VALUES ('迁移前的商品', 1, 10, 12.34, 19.99)"
+    )
+    conn.execute(
+        "INSERT INTO stock_movements (product_id, date, change, balance, ref_type) "
+        "VALUES (1, '2024-02-01 08:00:00', 10, 10, '期初')"
+    )
+    # 19.99 * 100 和 10.05 * 100 的浮点结果略小于整数，必须四舍五入而不是截断
+    for order_id, total in ((1, 39.88), (2, 5.5)):
+        conn.execute(
+            "INSERT INTO orders (id, customer_id, date, business_type, total_amount, freight_cost, commission) "
+            "VALUES (?, 1, '2024-03-01 10:00:00', '对公', ?, 0.1, 0.2)", (order_id, total)
+        )
+    conn.execute('INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (1, 1, 2, 19.99)')
+    conn.execute('DELETE FROM orders WHERE id = 2')
+    conn.execute(
+        "INSERT INTO transactions (date, type, business_type, amount, customer_id) "
+        "VALUES ('2024-03-02 09:00:00', '收入', '对公', 10.05, 1)"
+    )
+    conn.execute(
+        "INSERT INTO transactions (date, type, business_type, amount, supplier_id) "
+        "VALUES ('2024-03-02 09:30:00', '支出', '对公', 3.3, 1)"
+    )
+    conn.commit()
+    triggers = conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' ORDER BY name").fetchall()
+
+    assert erp.migrate_database(conn) == erp.SCHEMA_VERSION
+
+    assert conn.execute('SELECT purchase_price, selling_price FROM inventory').fetchone() == (1234, 1999)
+    assert conn.execute('SELECT total_amount, freight_cost, commission FROM orders').fetchone() == (3988, 10, 20)
+    assert conn.execute('SELECT price FROM order_items').fetchone() == (1999,)
+    assert conn.execute('SELECT amount FROM transactions ORDER BY id').fetchall() == [(1005,), (330,)]
+    for table, columns in erp.MONEY_COLUMNS.items():
+        types = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info({table})')}
+        assert all(types[column] == 'INTEGER' for column in columns), table
+
+    assert conn.execute('SELECT day, quantity, amount, lines FROM daily_sales').fetchall() == [('2024-03-01', 2, 3998, 1)]
+    assert conn.execute('SELECT type, amount, count FROM daily_cash ORDER BY type').fetchall() == [
+        ('支出', 330, 1), ('收入', 1005, 1)
+    ]
+    assert conn.execute('SELECT kind, party_id, charged, paid, balance FROM account_balances ORDER BY kind').fetchall() == [
+        ('应付', 1, 0, 330, -330), ('应收', 1, 3988, 1005, 2983)
+    ]
+
+    # 已删除订单占用过的ID不会被新订单重用
+    assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'orders'").fetchone() == (2,)
+    conn.close()
+
+    conn = erp.connect_database(path)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' ORDER BY name").fetchall() == triggers
+    services = erp.ErpServices(conn)
+    order = erp.OrderInput(1, '对公', [erp.OrderLine(1, 1, 1999)])
+    assert services.orders.create_order(order).id == 3
+
+    # 检索索引的触发器随表一起恢复
+    assert erp.search(conn, '迁移前') == [('inventory', 1, '迁移前的商品')]
+    conn.execute("UPDATE inventory SET name = '迁移后的商品' WHERE id = 1")
+    assert erp.search(conn, '迁移前') == []
+    assert erp.search(conn, '迁移后') == [('inventory', 1, '迁移后的商品')]
+    assert erp.IntegrityChecker(conn).run() == []
+    conn.close()
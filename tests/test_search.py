@@ -0,0 +1,59 @@
+import erp
+
+
+def matching(conn, table, query):
+    condition, params = erp.search_condition(table, 't', query)
+    return [row[0] for row in conn.execute(f'SELECT t.name FROM {table} t WHERE {condition} ORDER BY t.id', params)]
+
+
+def test_long_terms_use_the_trigram_index(conn, services, shop):
+    services.customers.add(erp.PartyInput('华东贸易', '已合作客户', address='上海市浦东新区'))
+
+    assert erp.search(conn, '测试客户') == [('customers', shop['customer'], '测试客户')]
+    # 客户的联系人、地址和备注也参与检索，词中间的片段同样能匹配
+    assert erp.search(conn, '浦东新区') == [('customers', shop['customer'] + 1, '华东贸易')]
+    assert erp.search(conn, '试供应') == [('suppliers', shop['supplier'], '测试供应商')]
+    assert erp.search(conn, '测试客户', tables=['suppliers']) == []
+    # 多个词同时满足，短词按名称包含过滤
+    assert erp.search(conn, '测试 供应商') == [('suppliers', shop['supplier'], '测试供应商')]
+    assert erp.search(conn, '测试客 户 供') == []
+
+    assert matching(conn, 'customers', '浦东新区') == ['华东贸易']
+    assert matching(conn, 'suppliers', '测试供应商 商') == ['测试供应商']
+    assert matching(conn, 'inventory', '测试客户') == []
+
+
+def test_short_terms_fall_back_to_name_prefix(conn, services, shop):
+    services.inventory.add_product(erp.ProductInput('[特价]*商品', shop['category']))
+
+    assert erp.search(conn, '商品') == [('inventory', shop['products'][0], '商品0'), ('inventory', shop['products'][1], '商品1')]
+    assert erp.search(conn, '测试') == [('customers', shop['customer'], '测试客户'), ('suppliers', shop['supplier'], '测试供应商')]
+    # 只按前缀匹配，GLOB 通配符按字面处理
+    assert erp.search(conn, '品') == []
+    assert erp.search(conn, '[特') == [('inventory', shop['products'][1] + 1, '[特价]*商品')]
+    assert erp.search(conn, '商 1') == [('inventory', shop['products'][1], '商品1')]
+    assert erp.search(conn, '测试', limit=1) == [('customers', shop['customer'], '测试客户')]
+
+    assert matching(conn, 'inventory', '商品') == ['商品0', '商品1']
+    assert matching(conn, 'inventory', '[特 商') == ['[特价]*商品']
+    assert matching(conn, 'inventory', '*') == []
+
+
+def test_index_follows_renames_and_deletes(conn, services, shop):
+    first, second = shop['products']
+    services.inventory.update_product(first, erp.ProductInput('改名后的商品', shop['category'], shop['supplier'], 100, 100, 200))
+    services.customers.update(shop['customer'], erp.PartyInput('测试客户', '已合作客户', notes='每月结算'))
+
+    assert erp.search(conn, '改名后') == [('inventory', first, '改名后的商品')]
+    assert matching(conn, 'inventory', '改名后的') == ['改名后的商品']
+    assert erp.search(conn, '每月结算') == [('customers', shop['customer'], '测试客户')]
+
+    # 库存变动不改名称，索引保持不变
+    services.inventory.update_product(second, erp.ProductInput('商品1', shop['category'], shop['supplier'], 50, 100, 200))
+    assert conn.execute('SELECT name FROM search_index WHERE rowid = ?', (second * 4 + 1,)).fetchone() == ('商品1',)
+
+    services.inventory.delete_product(first)
+    services.customers.delete(shop['customer'])
+    assert erp.search(conn, '改名后') == []
+    assert erp.search(conn, '每月结算') == []
+    assert conn.execute('SELECT COUNT(*) FROM search_index').fetchone()[0] == 2
@@ -0,0 +1,308 @@
+import sqlite3
+
+import pytest
+
+import erp
+
+
+def stock(conn, product_id):
+    return conn.execute('SELECT quantity FROM inventory WHERE id = ?', (product_id,)).fetchone()[0]
+
+
+def count(conn, table):
+    return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def receivable(conn, customer_id):
+    row = conn.execute(
+        "SELECT balance FROM account_balances WHERE kind = '应收' AND party_id = ?", (customer_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def place(services, shop, *lines, **kwargs):
+    order = erp.OrderInput(shop['customer'], '对公', [erp.OrderLine(*line) for line in lines], **kwargs)
+    return services.orders.create_order(order)
+
+
+def test_create_order_reserves_stock(conn, services, shop):
+    first, second = shop['products']
+    result = place(services, shop, (first, 3, 250), (second, 1, 200), freight_cost=500, commission=100)
+
+    assert stock(conn, first) == 97
+    assert stock(conn, second) == 99
+    assert conn.execute('SELECT total_amount FROM orders WHERE id = ?', (result.id,)).fetchone()[0] == 1350
+    assert result.changes.tables['inventory']['updated'] == {first, second}
+    assert erp.stock_as_of(conn, first, '2999-12-31') == 97
+    assert receivable(conn, shop['customer']) == 1350
+    assert erp.IntegrityChecker(conn).run() == []
+
+
+def test_create_order_merges_lines_of_same_product_and_price(conn, services, shop):
+    first, _ = shop['products']
+    result = place(services, shop, (first, 2, 200), (first, 3, 200))
+
+    assert conn.execute(
+        'SELECT quantity FROM order_items WHERE order_id = ?', (result.id,)
+    ).fetchall() == [(5,)]
+    assert stock(conn, first) == 95
+
+
+@pytest.mark.parametrize('line', [(1, 0, 200), (1, -5, 200), (1, 1, -1)])
+def test_create_order_rejects_invalid_lines(conn, services, shop, line):
+    with pytest.raises(erp.ServiceError):
+        place(services, shop, line)
+    assert count(conn, 'orders') == 0
+    assert stock(conn, 1) == 100
+
+
+def test_failed_reservation_rolls_back_whole_order(conn, services, shop):
+    first, second = shop['products']
+    movements = count(conn, 'stock_movements')
+
+    with pytest.raises(erp.InsufficientStockError) as error:
+        place(services, shop, (first, 10, 200), (second, 101, 200))
+
+    assert [(s.product_id, s.requested, s.available) for s in error.value.shortages] == [(second, 101, 100)]
+    assert stock(conn, first) == 100
+    assert stock(conn, second) == 100
+    for table in ('orders', 'order_items', 'daily_sales', 'account_balances'):
+        assert count(conn, table) == 0
+    assert count(conn, 'stock_movements') == movements
+    assert not conn.in_transaction
+
+
+def test_update_order_applies_only_the_difference(conn, services, shop):
+    first, second = shop['products']
+    order_id = place(services, shop, (first, 5, 200), (second, 5, 200)).id
+
+    services.orders.update_order(order_id, erp.OrderInput(
+        shop['customer'], '对公', [erp.OrderLine(first, 8, 200)]
+    ))
+
+    assert stock(conn, first) == 92
+    assert stock(conn, second) == 100
+    assert receivable(conn, shop['customer']) == 1600
+    assert conn.execute(
+        'SELECT SUM(quantity), SUM(amount) FROM daily_sales WHERE product_id = ?', (first,)
+    ).fetchone() == (8, 1600)
+    assert erp.IntegrityChecker(conn).run() == []
+
+
+def test_update_order_beyond_stock_keeps_original(conn, services, shop):
+    first, _ = shop['products']
+    order_id = place(services, shop, (first, 5, 200)).id
+
+    with pytest.raises(erp.InsufficientStockError):
+        services.orders.update_order(order_id, erp.OrderInput(
+            shop['customer'], '对公', [erp.OrderLine(first, 106, 200)]
+        ))
+
+    assert stock(conn, first) == 95
+    assert conn.execute('SELECT quantity FROM order_items WHERE order_id = ?', (order_id,)).fetchall() == [(5,)]
+
+
+def test_delete_order_restores_stock(conn, services, shop):
+    first, second = shop['products']
+    order_id = place(services, shop, (first, 5, 200), (second, 2, 200)).id
+
+    services.orders.delete_order(order_id)
+
+    assert stock(conn, first) == 100
+    assert stock(conn, second) == 100
+    assert count(conn, 'orders') == 0
+    assert count(conn, 'order_items') == 0
+    assert receivable(conn, shop['customer']) == 0
+    assert erp.IntegrityChecker(conn).run() == []
+
+
+def test_delete_of_referenced_rows_is_refused_inside_the_transaction(conn, services, shop):
+    first = shop['products'][0]
+    order_id = place(services, shop, (first, 1, 200)).id
+    services.ledger.add_transaction(erp.TransactionInput(
+        '收入', '对公', 200, customer_id=shop['customer'], order_id=order_id
+    ))
+
+    with pytest.raises(erp.ServiceError):
+        services.orders.delete_order(order_id)
+    with pytest.raises(erp.ServiceError):
+        services.customers.delete(shop['customer'])
+    with pytest.raises(erp.ServiceError):
+        services.inventory.delete_product(first)
+    with pytest.raises(erp.ServiceError):
+        services.inventory.delete_category(shop['category'])
+
+    assert not conn.in_transaction
+    assert count(conn, 'orders') == 1
+    assert stock(conn, first) == 99
+    assert erp.IntegrityChecker(conn).run() == []
+
+
+def test_ledger_transactions_update_cash_summary_and_accounts(conn, services, shop):
+    place(services, shop, (shop['products'][0], 10, 200))
+    ledger = services.ledger
+    payment = ledger.add_transaction(erp.TransactionInput('收入', '对公', 1500, customer_id=shop['customer'])).id
+    assert receivable(conn, shop['customer']) == 500
+
+    ledger.update_transaction(payment, erp.TransactionInput('收入', '对公', 2000, customer_id=shop['customer']))
+    assert receivable(conn, shop['customer']) == 0
+    assert conn.execute("SELECT SUM(amount) FROM daily_cash WHERE type = '收入'").fetchone()[0] == 2000
+
+    ledger.delete_transaction(payment)
+    assert receivable(conn, shop['customer']) == 2000
+    assert conn.execute('SELECT COALESCE(SUM(amount), 0) FROM daily_cash').fetchone()[0] == 0
+    assert erp.IntegrityChecker(conn).run() == []
+
+
+def test_deleting_a_transaction_removes_only_its_zeroed_cash_row(conn, services):
+    ledger = services.ledger
+    kept = ledger.add_transaction(erp.TransactionInput('收入', '对公', 500), date='2024-05-01 09:00:00').id
+    removed = ledger.add_transaction(erp.TransactionInput('支出', '对公', 300), date='2024-05-01 10:00:00').id
+    ledger.add_transaction(erp.TransactionInput('支出', '对私', 200), date='2024-05-01 11:00:00')
+
+    ledger.delete_transaction(removed)
+    assert conn.execute('SELECT type, business_type, amount, count FROM daily_cash ORDER BY type, business_type').fetchall() == [
+        ('支出', '对私', 200, 1), ('收入', '对公', 500, 1)
+    ]
+
+    ledger.delete_transactions([kept])
+    assert count(conn, 'daily_cash') == 1
+
+
+def test_ledger_rejects_non_positive_amount(services):
+    with pytest.raises(erp.ServiceError):
+        services.ledger.add_transaction(erp.TransactionInput('收入', '对公', 0))
+
+
+def test_bulk_delete_skips_referenced_rows(conn, services, shop):
+    first, second = shop['products']
+    order_ids = [place(services, shop, (first, 1, 200)).id for _ in range(3)]
+    services.ledger.add_transaction(erp.TransactionInput(
+        '收入', '对公', 200, customer_id=shop['customer'], order_id=order_ids[0]
+    ))
+
+    result = services.orders.delete_orders(order_ids)
+    assert result.skipped == [order_ids[0]]
+    assert stock(conn, first) == 99
+
+    result = services.inventory.delete_products([first, second])
+    assert result.skipped == [first]
+    assert [row[0] for row in conn.execute('SELECT id FROM inventory')] == [first]
+
+    result = services.customers.delete_many([shop['customer']])
+    assert result.skipped == [shop['customer']]
+    assert erp.IntegrityChecker(conn).run() == []
+
+
+def test_bulk_update_products(conn, services, shop):
+    products = shop['products']
+    category_id = services.inventory.add_category('另一分类').id
+
+    services.inventory.set_category(products, category_id)
+    services.inventory.set_supplier(products, '')
+    result = services.inventory.adjust_prices(products, 10, -25)
+
+    assert result.changes.tables['inventory']['updated'] == set(products)
+    assert conn.execute(
+        'SELECT DISTINCT category_id, supplier_id, purchase_price, selling_price FROM inventory'
+    ).fetchall() == [(category_id, None, 110, 150)]
+
+
+def test_bulk_delete_transactions(conn, services, shop):
+    ids = [
+        services.ledger.add_transaction(erp.TransactionInput('支出', '对私', 100 * n, supplier_id=shop['supplier'])).id
+        for n in range(1, 4)
+    ]
+
+    services.ledger.delete_transactions(ids[:2])
+
+    assert count(conn, 'transactions') == 1
+    assert conn.execute('SELECT SUM(amount) FROM daily_cash').fetchone()[0] == 300
+    assert erp.IntegrityChecker(conn).run() == []
+
+
+def test_order_service_benchmark_leaves_consistent_data():
+    result = erp.run_order_service_benchmark(orders=50, products=20)
+    assert [(label, count) for label, count, _ in result['operations']] == [('下单', 50), ('改单', 50), ('删单', 25)]
+    assert result['issues'] == 0
+
+
+def test_order_refresh_benchmark_reports_each_size():
+    results = erp.run_order_refresh_benchmark(sizes=(100, 300), repeat=2)
+    assert [size for size, _ in results] == [100, 300]
+    assert all(set(timings) == {'下单', '按行修补', '重新加载首页', '全表重新加载'} for _, timings in results)
+
+
+def test_connection_profile_benchmark_compares_both_settings():
+    results = erp.run_connection_profile_benchmark(commits=5, rows=1000, seconds=0.2)
+    assert set(results) == {'默认参数', '连接配置'}
+    assert all(stats['pages'] > 0 and stats['commit_p50'] > 0 for stats in results.values())
+
+
+def test_transaction_refuses_to_join_an_open_transaction(conn, services, shop):
+    conn.execute('BEGIN')
+    conn.execute("INSERT INTO categories (name) VALUES ('未提交')")
+
+    with pytest.raises(sqlite3.OperationalError):
+        place(services, shop, (shop['products'][0], 1, 200))
+
+    conn.rollback()
+    assert count(conn, 'orders') == 0
+    assert stock(conn, shop['products'][0]) == 100
+
+
+def test_reserve_stock_guards_each_outgoing_line_in_the_update(conn, shop):
+    first, second = shop['products']
+    cursor = conn.cursor()
+    conn.execute('BEGIN')
+    with pytest.raises(erp.InsufficientStockError) as error:
+        erp.reserve_stock(cursor, {first: -60, second: -101}, '销售')
+    conn.rollback()
+
+    # 足够的行已在同一语句中扣减，报告的可用数量只来自未扣减的行
+    assert [(s.product_id, s.requested, s.available) for s in error.value.shortages] == [(second, 101, 100)]
+    assert (stock(conn, first), stock(conn, second)) == (100, 100)
+
+    conn.execute('BEGIN')
+    assert sorted(erp.reserve_stock(cursor, {first: -100, second: 5}, '销售')) == [first, second]
+    conn.commit()
+    assert (stock(conn, first), stock(conn, second)) == (0, 105)
+
+
+def test_concurrent_processes_never_oversell():
+    stats = erp.run_stock_stress(processes=4, orders=50, products=5, stock=20)
+    assert stats['placed'] + stats['rejected'] + stats['busy'] == 200
+    assert stats['placed'] > 0 and stats['rejected'] > 0
+    assert stats['negative'] == stats['mismatched'] == 0
+
+
+def test_pricing_engine_precedence_breaks_and_recompile(tmp_path, conn, services, shop):
+    first, second = shop['products']
+    prospect = services.customers.add(erp.PartyInput('意向客户甲', '意向客户')).id
+    partner = services.customers.add(erp.PartyInput('合作客户乙', '已合作客户')).id
+    pricing = services.pricing
+    generic = pricing.add_price_list(erp.PriceListInput('通用')).id
+    preferred = pricing.add_price_list(erp.PriceListInput('通用优先', priority=5)).id
+    by_type = pricing.add_price_list(erp.PriceListInput('合作客户价', customer_type='已合作客户')).id
+    own = pricing.add_price_list(erp.PriceListInput('专属价', customer_id=shop['customer'])).id
+    pricing.set_price(generic, first, 1, 190)
+    pricing.set_price(preferred, first, 1, 185)
+    pricing.set_price(by_type, first, 1, 180)
+    pricing.set_price(by_type, first, 10, 150)
+    pricing.set_price(own, first, 5, 120)
+
+    engine = erp.PricingEngine(conn, erp.MasterDataCache(conn))
+    # 专属价格表没有适用的档位时按下一层级定价
+    assert engine.price_lines(shop['customer'], [(first, 1), (first, 5), (first, 100)]) == [180, 120, 120]
+    assert engine.price_lines(partner, [(first, 9), (first, 10), (first, 11)]) == [180, 150, 150]
+    assert engine.price(prospect, first, 1) == 185
+    assert engine.price_lines(prospect, [(second, 1), (999, 1)]) == [200, None]
+
+    other = erp.connect_database(str(tmp_path / 'test.db'))
+    try:
+        erp.ErpServices(other).pricing.set_price(generic, second, 1, 170)
+        erp.ErpServices(other).pricing.delete_price(preferred, first, 1)
+    finally:
+        other.close()
+    assert engine.price_lines(prospect, [(first, 1), (second, 1)]) == [190, 170]
+    assert engine.price(shop['customer'], second, 1) == 170